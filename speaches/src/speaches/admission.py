@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from fastapi import HTTPException, status
+
+from speaches.metrics import metrics
+from speaches.priority import PRIORITY_RANKS
+
+if TYPE_CHECKING:
+    from speaches.config import AdmissionConfig, AdmissionControlConfig, Priority
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+@dataclass(order=True)
+class _Waiter:
+    sort_key: tuple[int, float, int]
+    loop: asyncio.AbstractEventLoop = field(compare=False)
+    future: asyncio.Future[None] = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+
+
+class ConcurrencyLimiter:
+    """Limits the number of concurrently held slots. Requests that don't get a slot right away wait in a bounded queue.
+
+    The queue is ordered by priority, then by `cost` (i.e. the amount of audio to process) when `shortest_job_first` is set, and then by arrival. `release` may be called from any thread.
+    """
+
+    def __init__(self, max_concurrent: int, max_queued: int, *, shortest_job_first: bool = False) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.shortest_job_first = shortest_job_first
+        self.active = 0
+        self._waiters: list[_Waiter] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        # exponentially weighted moving average of how long a slot is held, used to estimate `Retry-After`
+        self._average_hold_seconds = 1.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Estimated number of seconds until a newly queued request would get a slot."""
+        with self._lock:
+            return max(1, math.ceil(self._average_hold_seconds * (len(self._waiters) + 1) / self.max_concurrent))
+
+    async def acquire(self, cost: float, deadline: float, priority_rank: int = 0) -> None:
+        """Raises `QueueFullError` right away if the queue is full and `TimeoutError` if no slot freed up before `deadline` (a `time.perf_counter` value)."""
+        with self._lock:
+            if self.active < self.max_concurrent and len(self._waiters) == 0:
+                self.active += 1
+                return
+            if len(self._waiters) >= self.max_queued:
+                raise QueueFullError
+            loop = asyncio.get_running_loop()
+            waiter = _Waiter(
+                (priority_rank, cost if self.shortest_job_first else 0.0, next(self._counter)),
+                loop,
+                loop.create_future(),
+            )
+            heapq.heappush(self._waiters, waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max(0.0, deadline - time.perf_counter()))
+        except BaseException:
+            with self._lock:
+                granted = waiter.granted
+                if not granted:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+            if granted:
+                # the slot was handed over right as the wait timed out (or got cancelled), pass it on
+                self.release()
+            raise
+
+    def release(self, held_seconds: float | None = None) -> None:
+        with self._lock:
+            if held_seconds is not None:
+                self._average_hold_seconds = 0.8 * self._average_hold_seconds + 0.2 * held_seconds
+            if len(self._waiters) == 0:
+                self.active -= 1
+                return
+            # hand the slot over to the next waiter, `active` stays the same
+            waiter = heapq.heappop(self._waiters)
+            waiter.granted = True
+        waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+
+def _resolve(future: asyncio.Future[None]) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def _release_all(limiters: list[ConcurrencyLimiter]) -> None:
+    for limiter in reversed(limiters):
+        limiter.release()
+
+
+class Permit:
+    """Slots held by an admitted request. `release` is idempotent and may be called from any thread."""
+
+    def __init__(self, limiters: list[ConcurrencyLimiter]) -> None:
+        self._limiters = limiters
+        self._acquired_at = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        with self._lock:
+            limiters, self._limiters = self._limiters, []
+        held_seconds = time.perf_counter() - self._acquired_at
+        for limiter in reversed(limiters):
+            limiter.release(held_seconds)
+
+
+class AdmissionController:
+    """Admission control for a single kind of endpoint (i.e. transcription), with a limit across all models and a limit per model."""
+
+    def __init__(self, name: str, config: AdmissionConfig) -> None:
+        self.name = name
+        self.config = config
+        self._limiter = (
+            ConcurrencyLimiter(config.max_concurrent, config.max_queued, shortest_job_first=config.shortest_job_first)
+            if config.max_concurrent is not None
+            else None
+        )
+        self._model_limiters: dict[str, ConcurrencyLimiter] = {}
+        self._lock = threading.Lock()
+        self._admitted = metrics.counter(f"admission_{name}_admitted", "Requests that got a slot.")
+        self._rejected = metrics.counter(f"admission_{name}_rejected", "Requests rejected because the queue was full.")
+        self._timed_out = metrics.counter(
+            f"admission_{name}_timed_out", "Requests rejected because they waited longer than the maximum queue wait."
+        )
+
+    def _model_limiter(self, model_id: str) -> ConcurrencyLimiter | None:
+        if self.config.max_concurrent_per_model is None:
+            return None
+        with self._lock:
+            if model_id not in self._model_limiters:
+                self._model_limiters[model_id] = ConcurrencyLimiter(
+                    self.config.max_concurrent_per_model,
+                    self.config.max_queued,
+                    shortest_job_first=self.config.shortest_job_first,
+                )
+            return self._model_limiters[model_id]
+
+    async def admit(self, model_id: str, cost: float = 0.0, priority: Priority = "interactive") -> Permit:
+        """Wait for a slot for `model_id`. Raises a 429 (queue full) or 503 (waited too long) `HTTPException` with a `Retry-After` header when overloaded.
+
+        `cost` is the amount of work of the request (i.e. seconds of audio), cheaper requests are admitted first when `shortest_job_first` is enabled. Queued interactive requests are always admitted before bulk ones.
+        """
+        limiters = [limiter for limiter in (self._model_limiter(model_id), self._limiter) if limiter is not None]
+        deadline = time.perf_counter() + self.config.max_queue_wait_seconds
+        acquired: list[ConcurrencyLimiter] = []
+        try:
+            # NOTE: always acquired in the same order (model, then global), so waiting requests can't deadlock each other
+            for limiter in limiters:
+                await limiter.acquire(cost, deadline, PRIORITY_RANKS[priority])
+                acquired.append(limiter)
+        except QueueFullError:
+            self._rejected.inc()
+            _release_all(acquired)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Too many {self.name} requests are queued. Try again later.",
+                headers={"Retry-After": str(limiter.retry_after())},
+            ) from None
+        except TimeoutError:
+            self._timed_out.inc()
+            _release_all(acquired)
+            logger.warning(f"Rejecting a {self.name} request for '{model_id}' after waiting for a slot for too long")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"The server is overloaded with {self.name} requests. Try again later.",
+                headers={"Retry-After": str(limiter.retry_after())},
+            ) from None
+        except BaseException:
+            _release_all(acquired)
+            raise
+        self._admitted.inc()
+        return Permit(acquired)
+
+
+class AdmissionControl:
+    def __init__(self, config: AdmissionControlConfig) -> None:
+        self.transcription = AdmissionController("transcription", config.transcription)
+        self.speech = AdmissionController("speech", config.speech)
+        self.vad = AdmissionController("vad", config.vad)
@@ -1,15 +1,24 @@
 from __future__ import annotations
 
+import gc
 import io
 import logging
+from pathlib import Path
+import struct
 from typing import TYPE_CHECKING, BinaryIO
 
+import av
+import av.audio.resampler
+from faster_whisper.audio import _group_frames, _ignore_invalid_frames, _resample_frames
 import numpy as np
 import soundfile as sf
 
 from speaches.config import SAMPLES_PER_SECOND
+from speaches.resampling import resample
 
 if TYPE_CHECKING:
+    from collections.abc import Generator
+
     from numpy.typing import NDArray
 
     from speaches.routers.speech import ResponseFormat
@@ -17,15 +26,9 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
-# aip 'Write a function `resample_audio` which would take in RAW PCM 16-bit signed, little-endian audio data represented as bytes (`audio_bytes`) and resample it (either downsample or upsample) from `sample_rate` to `target_sample_rate` using numpy'
 def resample_audio(audio_bytes: bytes, sample_rate: int, target_sample_rate: int) -> bytes:
-    audio_data = np.frombuffer(audio_bytes, dtype=np.int16)
-    duration = len(audio_data) / sample_rate
-    target_length = int(duration * target_sample_rate)
-    resampled_data = np.interp(
-        np.linspace(0, len(audio_data), target_length, endpoint=False), np.arange(len(audio_data)), audio_data
-    )
-    return resampled_data.astype(np.int16).tobytes()
+    """Resample a whole RAW PCM 16-bit little-endian signal. Use a `speaches.resampling.Resampler` for streams."""
+    return resample(np.frombuffer(audio_bytes, dtype=np.int16), sample_rate, target_sample_rate).tobytes()
 
 
 def convert_audio_format(
@@ -65,29 +68,289 @@ def audio_samples_from_file(file: BinaryIO) -> NDArray[np.float32]:
     return audio  # pyright: ignore[reportReturnType]
 
 
+def decode_audio_chunks(
+    file: str | BinaryIO,
+    sampling_rate: int = SAMPLES_PER_SECOND,
+    *,
+    format: str | None = None,  # noqa: A002
+    options: dict[str, str] | None = None,
+) -> Generator[NDArray[np.int16], None, None]:
+    """Decode and resample (to mono PCM 16-bit) the audio file incrementally. Each yielded chunk is roughly 500000 input samples long.
+
+    `format` and `options` are passed to `av.open`, they're only needed for containerless (raw) audio.
+    """
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=sampling_rate)
+    try:
+        with av.open(file, mode="r", format=format, options=options or {}, metadata_errors="ignore") as container:
+            frames = container.decode(audio=0)
+            frames = _ignore_invalid_frames(frames)
+            frames = _group_frames(frames, 500000)
+            frames = _resample_frames(frames, resampler)
+            for frame in frames:
+                yield frame.to_ndarray().reshape(-1)
+    finally:
+        # NOTE: same as `faster_whisper.audio.decode_audio`, some objects related to the resampler aren't freed otherwise. https://github.com/SYSTRAN/faster-whisper/issues/390
+        del resampler
+        gc.collect()
+
+
+def get_audio_duration(
+    file: str | BinaryIO,
+    *,
+    format: str | None = None,  # noqa: A002
+    options: dict[str, str] | None = None,
+) -> float | None:
+    """Duration (in seconds) from the container's header, without decoding. `None` if the file can't be opened or the format doesn't have a header (i.e. raw streams)."""
+    try:
+        with av.open(file, mode="r", format=format, options=options or {}, metadata_errors="ignore") as container:
+            duration = container.duration  # in `av.time_base` units
+    except av.error.FFmpegError:
+        duration = None
+    finally:
+        if not isinstance(file, str):
+            file.seek(0)
+    return duration / av.time_base if duration is not None else None
+
+
+# 8 kbps (the lowest bitrate speech is commonly encoded at) of 16 kHz audio
+MAX_SAMPLES_PER_BYTE = 16
+
+
+def _file_size(file: str | BinaryIO) -> int:
+    if isinstance(file, str):
+        return Path(file).stat().st_size
+    current_position = file.tell()
+    size = file.seek(0, io.SEEK_END)
+    file.seek(current_position)
+    return size
+
+
+def _estimate_num_samples(
+    file: str | BinaryIO,
+    sampling_rate: int,
+    format: str | None,  # noqa: A002
+    options: dict[str, str] | None,
+) -> int:
+    # NOTE: the duration comes from an untrusted header, so it's capped by what the file's size can realistically hold. Audio that's encoded more efficiently than that just makes the buffer grow while decoding
+    max_num_samples = _file_size(file) * MAX_SAMPLES_PER_BYTE * sampling_rate // SAMPLES_PER_SECOND
+    duration = get_audio_duration(file, format=format, options=options)
+    if duration is None:
+        return min(30 * sampling_rate, max_num_samples)
+    return min(int(duration * sampling_rate) + sampling_rate, max_num_samples)
+
+
+def decode_audio(
+    file: str | BinaryIO,
+    sampling_rate: int = SAMPLES_PER_SECOND,
+    *,
+    format: str | None = None,  # noqa: A002
+    options: dict[str, str] | None = None,
+) -> NDArray[np.float32]:
+    """Same result as `faster_whisper.audio.decode_audio`, but the decoded chunks are written into a single (preallocated) float32 buffer.
+
+    `faster_whisper.audio.decode_audio` accumulates the PCM 16-bit data in a `BytesIO` and then converts all of it at once, which briefly holds ~5x the memory of the final array.
+
+    NOTE: for uploads through `UploadFile`, decoding only starts once the whole file has been received, as FastAPI spools the multipart body before the endpoint runs. `/v1/audio/transcriptions/stream` decodes the upload while it arrives instead (see `speaches.upload_stream`).
+    """
+    audio = np.empty(_estimate_num_samples(file, sampling_rate, format, options), dtype=np.float32)
+    size = 0
+    for chunk in decode_audio_chunks(file, sampling_rate, format=format, options=options):
+        if size + len(chunk) > len(audio):
+            # the container's duration was missing or wrong
+            grown_audio = np.empty(max(2 * len(audio), size + len(chunk)), dtype=np.float32)
+            grown_audio[:size] = audio[:size]
+            audio = grown_audio
+        audio[size : size + len(chunk)] = chunk
+        size += len(chunk)
+    # NOTE: don't keep a mostly unused buffer alive when the estimate was far off
+    audio = audio[:size] if len(audio) - size <= 10 * sampling_rate else audio[:size].copy()
+    audio *= 1 / 32768.0
+    return audio
+
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+RAW_PCM_MEDIA_TYPES = ("audio/pcm", "audio/x-pcm", "audio/s16le")
+
+
+def _read_into_array(file: BinaryIO, num_bytes: int | None, dtype: str) -> NDArray:
+    """Read the rest of the file (or `num_bytes` of it) into a writable array without an intermediate `bytes` copy."""
+    if num_bytes is None:
+        current_position = file.tell()
+        num_bytes = file.seek(0, io.SEEK_END) - current_position
+        file.seek(current_position)
+    item_size = np.dtype(dtype).itemsize
+    buffer = bytearray(num_bytes - num_bytes % item_size)
+    num_read = file.readinto(buffer)  # pyright: ignore[reportAttributeAccessIssue]
+    return np.frombuffer(buffer, dtype=dtype)[: num_read // item_size]
+
+
+def _pcm_to_float32(samples: NDArray) -> NDArray[np.float32]:
+    if samples.dtype == np.float32:
+        return samples
+    audio = samples.astype(np.float32)
+    audio *= 1 / 32768.0
+    return audio
+
+
+def _wav_dtype(fmt: bytes, sampling_rate: int) -> str | None:
+    """The dtype of the samples given the `fmt ` chunk, `None` unless it's mono PCM 16-bit or 32-bit float at `sampling_rate`."""
+    # NOTE: a truncated chunk is left to `decode_audio`, which reports it like any other malformed file
+    if len(fmt) < 16:
+        return None
+    format_tag, channels, sample_rate, _, _, bits_per_sample = struct.unpack("<HHIIHH", fmt[:16])
+    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+        format_tag = struct.unpack("<H", fmt[24:26])[0]  # first two bytes of the sub-format GUID
+    if channels != 1 or sample_rate != sampling_rate:
+        return None
+    if format_tag == WAVE_FORMAT_PCM and bits_per_sample == 16:
+        return "<i2"
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT and bits_per_sample == 32:
+        return "<f4"
+    return None
+
+
+def read_pcm_wav(file: BinaryIO, sampling_rate: int = SAMPLES_PER_SECOND) -> NDArray[np.float32] | None:
+    """Read a mono PCM 16-bit or 32-bit float WAV file that is already at `sampling_rate` without decoding/resampling.
+
+    Returns `None` (with the file rewound) for any other file, which should then go through `decode_audio`.
+    """
+    header = file.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        file.seek(0)
+        return None
+    dtype: str | None = None
+    while True:
+        chunk_header = file.read(8)
+        if len(chunk_header) < 8:
+            break
+        chunk_id, chunk_size = chunk_header[:4], struct.unpack("<I", chunk_header[4:])[0]
+        if chunk_id == b"fmt ":
+            dtype = _wav_dtype(file.read(chunk_size + chunk_size % 2), sampling_rate)
+            if dtype is None:
+                break
+        elif chunk_id == b"data":
+            if dtype is None:
+                break
+            # NOTE: streaming writers don't know the size upfront and leave it at 0 or 0xFFFFFFFF
+            num_bytes = None if chunk_size in (0, 0xFFFFFFFF) else chunk_size
+            return _pcm_to_float32(_read_into_array(file, num_bytes, dtype))
+        else:
+            file.seek(chunk_size + chunk_size % 2, io.SEEK_CUR)
+    file.seek(0)
+    return None
+
+
+def parse_raw_pcm_content_type(content_type: str | None) -> tuple[int, int] | None:
+    """`(sample_rate, channels)` of a raw PCM 16-bit little-endian upload, i.e. `audio/pcm;rate=16000;channels=1`. Missing parameters default to 16 kHz mono.
+
+    Raises `ValueError` if a parameter isn't a positive integer.
+    """
+    if content_type is None:
+        return None
+    media_type, *params = (part.strip() for part in content_type.split(";"))
+    if media_type.lower() not in RAW_PCM_MEDIA_TYPES:
+        return None
+    sample_rate, channels = SAMPLES_PER_SECOND, 1
+    for param in params:
+        key, _, value = param.partition("=")
+        key = key.strip().lower()
+        if key in ("rate", "sample_rate", "samplerate"):
+            sample_rate = int(value)
+        elif key == "channels":
+            channels = int(value)
+    if sample_rate <= 0 or channels <= 0:
+        raise ValueError(f"Invalid raw PCM parameters: {sample_rate=}, {channels=}")
+    return sample_rate, channels
+
+
+def read_raw_pcm(file: BinaryIO, sample_rate: int, channels: int) -> NDArray[np.float32]:
+    if sample_rate == SAMPLES_PER_SECOND and channels == 1:
+        return _pcm_to_float32(_read_into_array(file, None, "<i2"))
+    return decode_audio(file, format="s16le", options={"sample_rate": str(sample_rate), "channels": str(channels)})
+
+
+def float32_to_pcm(samples: NDArray[np.float32]) -> NDArray[np.int16]:
+    """The inverse of `_pcm_to_float32` (the audio read by `soundfile`, `faster_whisper`, ...)."""
+    return np.clip(samples * 32768.0, -32768, 32767).astype(np.int16)
+
+
+class PcmBuffer:
+    """A growable buffer of mono 16-bit PCM samples.
+
+    The capacity doubles whenever it runs out, so appending is amortized O(1) instead of copying the whole buffer like `np.append`. Reads are views into the buffer. They stay valid as the buffer grows, since samples are only ever written past the end of the buffer.
+    """
+
+    def __init__(self, samples: NDArray[np.int16] | None = None, capacity: int = SAMPLES_PER_SECOND) -> None:
+        """`samples` is used as the initial storage without copying it, it's only copied once the buffer grows."""
+        if samples is None:
+            self._storage = np.empty(capacity, dtype=np.int16)
+            self._size = 0
+        else:
+            self._storage = samples
+            self._size = len(samples)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, samples: NDArray[np.int16] | NDArray[np.float32]) -> None:
+        """`float32` samples (in `[-1.0, 1.0]`) are converted."""
+        if samples.dtype != np.int16:
+            samples = float32_to_pcm(samples)
+        new_size = self._size + len(samples)
+        if new_size > len(self._storage):
+            storage = np.empty(max(new_size, 2 * len(self._storage)), dtype=np.int16)
+            storage[: self._size] = self._storage[: self._size]
+            self._storage = storage
+        self._storage[self._size : new_size] = samples
+        self._size = new_size
+
+    @property
+    def samples(self) -> NDArray[np.int16]:
+        """A view of all of the samples."""
+        return self._storage[: self._size]
+
+    def to_float32(self, start: int = 0, end: int | None = None) -> NDArray[np.float32]:
+        """A `float32` copy of the samples in `[start, end)`. Negative indices count from the end like in slices."""
+        return _pcm_to_float32(self.samples[start:end])
+
+
 class Audio:
     def __init__(
         self,
-        data: NDArray[np.float32] = np.array([], dtype=np.float32),
+        samples: NDArray[np.int16] | NDArray[np.float32] | None = None,
         start: float = 0.0,
     ) -> None:
-        self.data = data
+        """`int16` samples are used without copying them, `float32` ones are converted."""
+        if samples is not None and samples.dtype != np.int16:
+            samples = float32_to_pcm(samples)
+        self._buffer = PcmBuffer(samples)
         self.start = start
 
     def __repr__(self) -> str:
         return f"Audio(start={self.start:.2f}, end={self.end:.2f})"
 
+    @property
+    def samples(self) -> NDArray[np.int16]:
+        return self._buffer.samples
+
+    @property
+    def data(self) -> NDArray[np.float32]:
+        """The samples as `float32`, as expected by the models. This is a copy."""
+        return self._buffer.to_float32()
+
     @property
     def end(self) -> float:
         return self.start + self.duration
 
     @property
     def duration(self) -> float:
-        return len(self.data) / SAMPLES_PER_SECOND
+        return len(self._buffer) / SAMPLES_PER_SECOND
 
     def after(self, ts: float) -> Audio:
         assert ts <= self.duration
-        return Audio(self.data[int(ts * SAMPLES_PER_SECOND) :], start=ts)
+        return Audio(self.samples[int(ts * SAMPLES_PER_SECOND) :], start=ts)
 
-    def extend(self, data: NDArray[np.float32]) -> None:
-        self.data = np.append(self.data, data)
+    def extend(self, samples: NDArray[np.int16] | NDArray[np.float32]) -> None:
+        self._buffer.append(samples)
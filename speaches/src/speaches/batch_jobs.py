@@ -0,0 +1,467 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Literal
+import uuid
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+
+from speaches.audio import decode_audio
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.executors.whisper.batching import MAX_BATCHED_SAMPLES
+from speaches.transcription_serialization import transcription_result_from_json, transcription_result_to_json
+
+if TYPE_CHECKING:
+    from faster_whisper.transcribe import Segment, TranscriptionInfo
+    import numpy as np
+    from numpy.typing import NDArray
+
+    from speaches.admission import AdmissionControl, Permit
+    from speaches.config import WhisperConfig
+    from speaches.executors.whisper.batching import WhisperBatchScheduler
+    from speaches.executors.whisper.long_form import LongFormTranscriber
+    from speaches.executors.whisper.model_manager import WhisperModelManager
+    from speaches.priority import PriorityScheduler
+
+logger = logging.getLogger(__name__)
+
+STORE_ERROR_BACKOFF_SECONDS = 5.0
+
+type JobStatus = Literal["queued", "running", "completed", "failed", "cancelled"]
+type BatchStatus = Literal["queued", "in_progress", "completed", "cancelled"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id TEXT PRIMARY KEY,
+    created_at INTEGER NOT NULL,
+    model TEXT NOT NULL,
+    params TEXT NOT NULL,
+    cancelled INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    batch_id TEXT NOT NULL REFERENCES batches (id),
+    filename TEXT NOT NULL,
+    audio_path TEXT NOT NULL,
+    owns_audio INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    result BLOB,
+    created_at INTEGER NOT NULL,
+    started_at INTEGER,
+    completed_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, duration);
+CREATE INDEX IF NOT EXISTS jobs_by_batch ON jobs (batch_id);
+"""
+
+
+class TranscriptionParams(BaseModel):
+    language: str | None = None
+    prompt: str | None = None
+    temperature: float = 0.0
+    word_timestamps: bool = False
+    hotwords: str | None = None
+    vad_filter: bool = True
+
+
+class BatchJob(BaseModel):
+    id: str
+    object: Literal["transcription.batch.job"] = "transcription.batch.job"
+    batch_id: str
+    filename: str
+    duration: float
+    """Duration of the audio in seconds, as reported by its container."""
+    status: JobStatus
+    error: str | None = None
+    created_at: int
+    started_at: int | None = None
+    completed_at: int | None = None
+
+
+class BatchRequestCounts(BaseModel):
+    total: int = 0
+    queued: int = 0
+    running: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+
+
+class TranscriptionBatch(BaseModel):
+    id: str
+    object: Literal["transcription.batch"] = "transcription.batch"
+    model: str
+    params: TranscriptionParams
+    status: BatchStatus
+    created_at: int
+    request_counts: BatchRequestCounts
+    jobs: list[BatchJob] | None = None
+
+
+class NewJob(BaseModel):
+    filename: str
+    audio_path: str
+    owns_audio: bool
+    """Whether the audio file was uploaded (and should be deleted once it's no longer needed) rather than referenced by a manifest."""
+    duration: float
+
+
+class BatchJobStore:
+    """SQLite backed store of transcription batches and their jobs. Audio uploaded as a part of a batch is stored next to the database."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.audio_dir = path / "audio"
+        self.audio_dir.mkdir(parents=True, exist_ok=True)
+        # NOTE: a single connection shared (behind a lock) by the request handlers and the workers
+        self._connection = sqlite3.connect(path / "batch_jobs.sqlite3", check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+
+    def new_audio_path(self, filename: str) -> Path:
+        return self.audio_dir / f"{uuid.uuid4().hex}{Path(filename).suffix}"
+
+    def create_batch(self, model: str, params: TranscriptionParams, jobs: list[NewJob]) -> TranscriptionBatch:
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        now = int(time.time())
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.execute(
+                "INSERT INTO batches (id, created_at, model, params) VALUES (?, ?, ?, ?)",
+                (batch_id, now, model, params.model_dump_json()),
+            )
+            self._connection.executemany(
+                "INSERT INTO jobs (id, batch_id, filename, audio_path, owns_audio, duration, status, created_at) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?)",
+                [
+                    (
+                        f"job_{uuid.uuid4().hex}",
+                        batch_id,
+                        job.filename,
+                        job.audio_path,
+                        job.owns_audio,
+                        job.duration,
+                        now,
+                    )
+                    for job in jobs
+                ],
+            )
+        batch = self.get_batch(batch_id)
+        assert batch is not None
+        return batch
+
+    def _batch_from_row(self, row: sqlite3.Row, jobs: list[BatchJob] | None) -> TranscriptionBatch:
+        counts = BatchRequestCounts()
+        for status_row in self._connection.execute(
+            "SELECT status, COUNT(*) AS count FROM jobs WHERE batch_id = ? GROUP BY status", (row["id"],)
+        ):
+            setattr(counts, status_row["status"], status_row["count"])
+            counts.total += status_row["count"]
+        status: BatchStatus
+        if row["cancelled"] and counts.cancelled > 0:
+            status = "cancelled"
+        elif counts.queued + counts.running == 0:
+            status = "completed"
+        elif counts.queued == counts.total:
+            status = "queued"
+        else:
+            status = "in_progress"
+        return TranscriptionBatch(
+            id=row["id"],
+            model=row["model"],
+            params=TranscriptionParams.model_validate_json(row["params"]),
+            status=status,
+            created_at=row["created_at"],
+            request_counts=counts,
+            jobs=jobs,
+        )
+
+    def get_batch(self, batch_id: str, *, with_jobs: bool = False) -> TranscriptionBatch | None:
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM batches WHERE id = ?", (batch_id,)).fetchone()
+            if row is None:
+                return None
+            jobs = (
+                [
+                    _job_from_row(job_row)
+                    for job_row in self._connection.execute(
+                        "SELECT * FROM jobs WHERE batch_id = ? ORDER BY rowid", (batch_id,)
+                    )
+                ]
+                if with_jobs
+                else None
+            )
+            return self._batch_from_row(row, jobs)
+
+    def list_batches(self) -> list[TranscriptionBatch]:
+        with self._lock:
+            rows = self._connection.execute("SELECT * FROM batches ORDER BY created_at DESC").fetchall()
+            return [self._batch_from_row(row, None) for row in rows]
+
+    def get_job(self, batch_id: str, job_id: str) -> BatchJob | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT * FROM jobs WHERE id = ? AND batch_id = ?", (job_id, batch_id)
+            ).fetchone()
+        return _job_from_row(row) if row is not None else None
+
+    def get_result(self, batch_id: str, job_id: str) -> tuple[list[Segment], TranscriptionInfo] | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT result FROM jobs WHERE id = ? AND batch_id = ? AND status = 'completed'", (job_id, batch_id)
+            ).fetchone()
+        if row is None:
+            return None
+        return transcription_result_from_json(row["result"])
+
+    def cancel_batch(self, batch_id: str) -> bool:
+        """Cancel the batch's queued jobs. Jobs that are already running are finished."""
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            if self._connection.execute("UPDATE batches SET cancelled = 1 WHERE id = ?", (batch_id,)).rowcount == 0:
+                return False
+            audio_paths = [
+                row["audio_path"]
+                for row in self._connection.execute(
+                    "SELECT audio_path FROM jobs WHERE batch_id = ? AND status = 'queued' AND owns_audio", (batch_id,)
+                )
+            ]
+            self._connection.execute(
+                "UPDATE jobs SET status = 'cancelled', completed_at = ? WHERE batch_id = ? AND status = 'queued'",
+                (int(time.time()), batch_id),
+            )
+        for audio_path in audio_paths:
+            Path(audio_path).unlink(missing_ok=True)
+        return True
+
+    def requeue_running(self) -> int:
+        """Put jobs that were running when the process stopped back into the queue."""
+        with self._lock:
+            return self._connection.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'").rowcount
+
+    def claim_next(self) -> tuple[BatchJob, str, TranscriptionParams, str] | None:
+        """Mark the next job as running. Returns the job, its model, its decoding parameters and the path of its audio.
+
+        Batches are processed in the order they were created. Within a batch, shorter audio goes first, so that the concurrently running jobs have similar lengths and can be decoded together by the batch scheduler.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            row = self._connection.execute(
+                """
+                SELECT jobs.*, batches.model, batches.params FROM jobs JOIN batches ON batches.id = jobs.batch_id
+                WHERE jobs.status = 'queued'
+                ORDER BY batches.created_at, batches.rowid, jobs.duration
+                LIMIT 1
+                """
+            ).fetchone()
+            if row is None:
+                return None
+            started_at = int(time.time())
+            try:
+                params = TranscriptionParams.model_validate_json(row["params"])
+            except ValidationError as e:
+                # NOTE: the job is failed (and committed) rather than left `queued`, where it would be claimed again and again
+                self._connection.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, completed_at = ? WHERE id = ?",
+                    (f"Invalid transcription parameters: {e}", started_at, row["id"]),
+                )
+                params = None
+            else:
+                self._connection.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (started_at, row["id"])
+                )
+        if params is None:
+            msg = f"Batch transcription job {row['id']} has invalid transcription parameters"
+            raise ValueError(msg)
+        job = _job_from_row(row).model_copy(update={"status": "running", "started_at": started_at})
+        return job, row["model"], params, row["audio_path"]
+
+    def finish_job(
+        self, job_id: str, result: tuple[list[Segment], TranscriptionInfo] | None, error: str | None = None
+    ) -> None:
+        with self._lock:
+            row = self._connection.execute("SELECT audio_path, owns_audio FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, completed_at = ? WHERE id = ?",
+                (
+                    "completed" if error is None else "failed",
+                    transcription_result_to_json(*result) if result is not None else None,
+                    error,
+                    int(time.time()),
+                    job_id,
+                ),
+            )
+        if row is not None and row["owns_audio"]:
+            Path(row["audio_path"]).unlink(missing_ok=True)
+
+
+def _job_from_row(row: sqlite3.Row) -> BatchJob:
+    return BatchJob(
+        id=row["id"],
+        batch_id=row["batch_id"],
+        filename=row["filename"],
+        duration=row["duration"],
+        status=row["status"],
+        error=row["error"],
+        created_at=row["created_at"],
+        started_at=row["started_at"],
+        completed_at=row["completed_at"],
+    )
+
+
+class BatchJobRunner:
+    """Worker threads that process the queued jobs of `BatchJobStore` with the regular whisper executors, as bulk priority requests. Jobs go through the same admission control as `/v1/audio/transcriptions`."""
+
+    def __init__(
+        self,
+        store: BatchJobStore,
+        *,
+        num_workers: int,
+        model_manager: WhisperModelManager,
+        batch_scheduler: WhisperBatchScheduler,
+        long_form_transcriber: LongFormTranscriber,
+        priority_scheduler: PriorityScheduler,
+        admission_control: AdmissionControl,
+        whisper_config: WhisperConfig,
+    ) -> None:
+        self.store = store
+        self.num_workers = num_workers
+        self.model_manager = model_manager
+        self.batch_scheduler = batch_scheduler
+        self.long_form_transcriber = long_form_transcriber
+        self.priority_scheduler = priority_scheduler
+        self.admission_control = admission_control
+        self.whisper_config = whisper_config
+        self._wakeup = threading.Condition()
+        self._started = False
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def start(self) -> None:
+        """Must be called from the event loop, which the workers use to wait for admission."""
+        if self._started:
+            return
+        self._started = True
+        self._loop = asyncio.get_running_loop()
+        requeued = self.store.requeue_running()
+        if requeued > 0:
+            logger.info(f"Resuming {requeued} batch transcription jobs that were interrupted")
+        for i in range(self.num_workers):
+            threading.Thread(target=self._work, name=f"batch-job-worker-{i}", daemon=True).start()
+
+    def notify(self) -> None:
+        """Wake up the workers, i.e. after new jobs were queued."""
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _work(self) -> None:
+        while True:
+            try:
+                self._work_once()
+            except Exception:
+                # NOTE: i.e. the database is locked or the disk is full. The worker keeps going, otherwise a single error would stop processing the queue for good
+                logger.exception("A batch transcription worker failed to access the job store")
+                time.sleep(STORE_ERROR_BACKOFF_SECONDS)
+
+    def _work_once(self) -> None:
+        # NOTE: claimed while holding the condition's lock, so a `notify` for jobs queued right after the claim can't get lost
+        with self._wakeup:
+            claimed = self.store.claim_next()
+            if claimed is None:
+                self._wakeup.wait(timeout=10)
+                return
+        job, model_id, params, audio_path = claimed
+        start = time.perf_counter()
+        try:
+            result = self._transcribe(model_id, params, audio_path, job.duration)
+        except Exception as e:
+            logger.exception(f"Batch transcription job {job.id} ({job.filename}) failed")
+            self.store.finish_job(job.id, None, error=str(e))
+            return
+        logger.info(
+            f"Batch transcription job {job.id} ({job.duration:.2f}s of audio) took {time.perf_counter() - start:.2f}s"
+        )
+        try:
+            self.store.finish_job(job.id, result)
+        except Exception as e:
+            # the job would otherwise stay `running` until the next restart
+            logger.exception(f"Failed to store the result of batch transcription job {job.id}")
+            self.store.finish_job(job.id, None, error=f"Failed to store the result: {e}")
+
+    def _admit(self, model_id: str, duration: float) -> Permit:
+        """Wait for a transcription slot like a bulk request would. Unlike a request, a job isn't rejected when the server is overloaded, it retries after the suggested delay."""
+        assert self._loop is not None
+        while True:
+            try:
+                return asyncio.run_coroutine_threadsafe(
+                    self.admission_control.transcription.admit(model_id, duration, "bulk"), self._loop
+                ).result()
+            except HTTPException as e:
+                retry_after = int((e.headers or {}).get("Retry-After", 1))
+                logger.debug(f"Waiting {retry_after}s for a transcription slot for a batch job: {e.detail}")
+                time.sleep(retry_after)
+
+    def _transcribe(
+        self, model_id: str, params: TranscriptionParams, audio_path: str, duration: float
+    ) -> tuple[list[Segment], TranscriptionInfo]:
+        # NOTE: batch jobs are always bulk, so a job only starts when there are no interactive requests (or after `max_bulk_pause_seconds`)
+        self.priority_scheduler.yield_to_interactive()
+        permit = self._admit(model_id, duration)
+        try:
+            return self._transcribe_admitted(model_id, params, decode_audio(audio_path))
+        finally:
+            permit.release()
+
+    def _transcribe_admitted(
+        self, model_id: str, params: TranscriptionParams, audio: NDArray[np.float32]
+    ) -> tuple[list[Segment], TranscriptionInfo]:
+        kwargs = {
+            "task": "transcribe",
+            "language": params.language,
+            "initial_prompt": params.prompt,
+            "temperature": params.temperature,
+            "word_timestamps": params.word_timestamps,
+            "hotwords": params.hotwords,
+            "vad_filter": params.vad_filter,
+        }
+        # NOTE: mirrors the routing of `/v1/audio/transcriptions`
+        if self.whisper_config.batching.enabled and len(audio) <= MAX_BATCHED_SAMPLES:
+            return self.batch_scheduler.transcribe(model_id, audio, **kwargs)  # pyright: ignore[reportArgumentType]
+        if (
+            self.whisper_config.long_form.enabled
+            and len(audio) > self.whisper_config.long_form.min_duration_seconds * SAMPLES_PER_SECOND
+        ):
+            segments, transcription_info = self.long_form_transcriber.transcribe(
+                model_id,
+                audio,
+                priority="bulk",
+                **kwargs,  # pyright: ignore[reportArgumentType]
+            )
+            return list(segments), transcription_info
+        replica = self.model_manager.load_model(model_id)
+        with replica as whisper:
+            segments, transcription_info = whisper.transcribe(audio, **kwargs)  # pyright: ignore[reportArgumentType]
+            segments = self.priority_scheduler.gate(segments, "bulk", replica.lent)
+            return list(segments), transcription_info
+
+
+def parse_manifest(content: bytes) -> list[str]:
+    """A manifest is either a JSON array of paths or one path per line."""
+    text = content.decode()
+    if text.lstrip().startswith("["):
+        paths = json.loads(text)
+        if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+            msg = "The manifest must be a JSON array of paths"
+            raise ValueError(msg)
+        return paths
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.lstrip().startswith("#")]
@@ -17,6 +17,48 @@ type Quantization = Literal[
     "int8", "int8_float16", "int8_bfloat16", "int8_float32", "int16", "float16", "bfloat16", "float32", "default"
 ]
 
+type Priority = Literal["interactive", "bulk"]
+
+
+class WhisperBatchingConfig(BaseModel):
+    enabled: bool = False
+    """
+    Whether to group concurrent transcription requests for the same model into a single batched encoder/decoder pass. Only requests whose audio fits into a single Whisper window (30 seconds) are batched, longer audio is transcribed on its own.
+    """
+    max_wait_ms: int = Field(default=0, ge=0)
+    """
+    How long the scheduler waits for more requests to join a batch after the first one arrives.
+    0: Don't wait. Requests that arrive while a batch is running are grouped into the next batch, so no latency is added when traffic is low.
+    """
+    max_batch_size: int = Field(default=8, ge=1)
+    """
+    Maximum number of requests in a single batch.
+    """
+    max_batch_audio_seconds: float = Field(default=240.0, gt=0)
+    """
+    Maximum total duration of audio (in seconds) in a single batch.
+    """
+
+
+class WhisperLongFormConfig(BaseModel):
+    enabled: bool = False
+    """
+    Whether to split long audio into chunks on silences (found with the Silero VAD) and transcribe the chunks in parallel. Chunks are transcribed on the least busy model replica, so the speed-up scales with `num_replicas` (or `num_workers`).
+    """
+    min_duration_seconds: float = Field(default=120.0, gt=0)
+    """
+    Audio longer than this (in seconds) is transcribed in long-form mode.
+    """
+    chunk_seconds: float = Field(default=60.0, ge=30)
+    """
+    Maximum duration of a chunk (in seconds). Chunks are cut in the middle of a silence whenever possible.
+    """
+    max_parallel_chunks: int | None = Field(default=None, ge=1)
+    """
+    Maximum number of chunks that are transcribed at the same time (across all requests).
+    If not set, `num_replicas * num_workers`. That's 1 with the defaults, i.e. chunks are transcribed one after another until `num_replicas` (or `num_workers`) is raised.
+    """
+
 
 class WhisperConfig(BaseModel):
     """See https://github.com/SYSTRAN/faster-whisper/blob/master/faster_whisper/transcribe.py#L599."""
@@ -25,17 +67,198 @@ class WhisperConfig(BaseModel):
     device_index: int | list[int] = 0
     compute_type: Quantization = "default"  # TODO: should this even be a configuration option?
     cpu_threads: int = 0
+    """
+    Number of threads used by each model replica when running on CPU.
+    0: Use the CTranslate2 default, or when `num_replicas > 1`, an equal share of the available cores per replica.
+    """
     num_workers: int = 1
+    num_replicas: int = Field(default=1, ge=1)
+    """
+    Number of instances of each model that can be loaded. Requests are routed to the least busy replica and additional replicas are only loaded once all of the loaded ones are in use.
+    """
+    pin_replicas_to_cpus: bool = False
+    """
+    Whether to pin each replica's inference threads to its own, non-overlapping, set of CPU cores. Only supported on Linux.
+    """
+    max_concurrent_loads: int = Field(default=2, ge=1)
+    """
+    Maximum number of models (or replicas) that are downloaded and loaded at the same time. Requests for a model that is being loaded wait for that load, requests for other (loaded) models are not blocked by it.
+    """
     ttl: int = Field(default=300, ge=-1)
     """
     Time in seconds until the model is unloaded if it is not being used.
     -1: Never unload the model.
     0: Unload the model immediately after usage.
     """
+    prompt_token_cache_size: int = Field(default=256, ge=0)
+    """
+    Number of distinct tokenized prompts and hotwords that are cached per model, as most clients send the same ones on every request. Hit rates are reported as `whisper_prompt_token_cache_*` in `GET /api/metrics`.
+    0: Disable the cache.
+    """
     use_batched_mode: bool = False
     """
     Whether to use batch mode(introduced in 1.1.0 `faster-whisper` release) for inference. This will likely become the default in the future and the configuration option will be removed.
     """
+    batching: WhisperBatchingConfig = WhisperBatchingConfig()
+    """
+    Cross-request batching of `/v1/audio/transcriptions` and `/v1/audio/translations` requests. Example: `WHISPER__BATCHING__ENABLED=true`.
+    """
+    long_form: WhisperLongFormConfig = WhisperLongFormConfig()
+    """
+    Chunked, parallel transcription of long audio in `/v1/audio/transcriptions` and `/v1/audio/translations`. Example: `WHISPER__LONG_FORM__ENABLED=true`.
+    """
+
+
+class TranscriptionCacheConfig(BaseModel):
+    enabled: bool = False
+    """
+    Whether to cache `/v1/audio/transcriptions` and `/v1/audio/translations` results. Requests with identical (decoded) audio, model and decoding parameters, i.e. client retries, are served from the cache.
+    """
+    max_entries: int = Field(default=1024, ge=1)
+    """
+    Maximum number of results kept in memory.
+    """
+    disk_path: str | None = None
+    """
+    Directory for an additional on-disk cache tier. Results are stored as JSON files.
+    """
+    disk_max_mb: int = Field(default=1024, ge=1)
+    """
+    Maximum size (in megabytes) of the on-disk tier. Least recently used results are removed first.
+    """
+
+
+class RemoteModelCatalogConfig(BaseModel):
+    path: str | None = None
+    """
+    Path of the JSON file the remote model listings are persisted to. Defaults to `speaches_remote_models.json` in the Hugging Face cache directory.
+    """
+    ttl: int = Field(default=86400, ge=0)
+    """
+    Time in seconds after which the persisted listings are refreshed (in the background) from the Hugging Face Hub.
+    """
+    offline: bool = False
+    """
+    Never contact the Hugging Face Hub, only use the persisted listings. Also enabled when `HF_HUB_OFFLINE` is set.
+    """
+
+
+class AdmissionConfig(BaseModel):
+    max_concurrent: int | None = Field(default=None, ge=1)
+    """
+    Maximum number of requests (across all models) that are processed at the same time. Additional requests wait in a queue.
+    If not set, the number of concurrent requests isn't limited.
+    """
+    max_concurrent_per_model: int | None = Field(default=None, ge=1)
+    """
+    Maximum number of requests for the same model that are processed at the same time.
+    If not set, the number of concurrent requests per model isn't limited.
+    """
+    max_queued: int = Field(default=32, ge=0)
+    """
+    Maximum number of requests waiting for a slot. Requests arriving when the queue is full are rejected right away with a 429 and a `Retry-After` header.
+    """
+    max_queue_wait_seconds: float = Field(default=15.0, gt=0)
+    """
+    Maximum time (in seconds) a request waits for a slot before it's rejected with a 503 and a `Retry-After` header. Should be lower than the clients' timeout, so that they get a response they can act on.
+    """
+    shortest_job_first: bool = False
+    """
+    Whether queued requests with less work (seconds of audio, or characters of text for speech synthesis) get a slot first rather than in arrival order. Long requests may wait until `max_queue_wait_seconds` under sustained load.
+    """
+
+
+class AdmissionControlConfig(BaseModel):
+    transcription: AdmissionConfig = AdmissionConfig()
+    """
+    `/v1/audio/transcriptions` and `/v1/audio/translations`.
+    """
+    speech: AdmissionConfig = AdmissionConfig()
+    """
+    `/v1/audio/speech`.
+    """
+    vad: AdmissionConfig = AdmissionConfig()
+    """
+    `/v1/audio/speech/timestamps`.
+    """
+
+
+class PriorityConfig(BaseModel):
+    default: Priority = "interactive"
+    """
+    Priority of `/v1/audio/transcriptions` and `/v1/audio/translations` requests that don't specify one (through the `priority` form field or the `X-Priority` header) and aren't covered by the rules below.
+    """
+    bulk_min_duration_seconds: float | None = Field(default=120.0, gt=0)
+    """
+    Requests without an explicit priority with audio at least this long (in seconds) are treated as bulk.
+    If not set, the duration is not taken into account.
+    """
+    api_key_defaults: dict[str, Priority] = {}
+    """
+    Default priority per API key (the bearer token), i.e. `{"<desktop-client-key>": "interactive", "<batch-jobs-key>": "bulk"}`. This never grants access: when `api_key` is set, only `api_key` is accepted and its default is the only one that applies.
+    """
+    max_bulk_pause_seconds: float = Field(default=30.0, ge=0)
+    """
+    Bulk requests pause at chunk boundaries (between 30 second Whisper windows, or between long-form chunks) while interactive requests are queued or running. This is the maximum duration (in seconds) of a single pause, so that bulk requests still make progress under sustained interactive load.
+    """
+
+
+class BatchJobsConfig(BaseModel):
+    enabled: bool = False
+    """
+    Whether to enable the `/v1/audio/transcriptions/batches` API for queueing many files for transcription.
+    """
+    path: str | None = None
+    """
+    Directory of the job database and the uploaded audio. Queued jobs are resumed when the server restarts.
+    If not set, `$XDG_CACHE_HOME/speaches/batch_jobs` (`~/.cache/speaches/batch_jobs`).
+    """
+    num_workers: int = Field(default=2, ge=1)
+    """
+    Number of jobs that are transcribed at the same time. Jobs run with the bulk priority.
+    """
+    manifest_dirs: list[str] = []
+    """
+    Directories from which a batch manifest may reference audio files (on the server's filesystem). Manifests are rejected if this is empty.
+    """
+
+
+class DictationConfig(BaseModel):
+    min_chunk_seconds: float = Field(default=1.0, gt=0)
+    """
+    Minimum amount of new audio (in seconds) before an utterance is transcribed again for a partial transcript. Lower values make the partial transcripts more responsive and leave less audio for the final pass after the commit, at the cost of more inference.
+    """
+    max_buffer_seconds: float = Field(default=15.0, gt=0)
+    """
+    The whole utterance is retranscribed on every pass. Once it's longer than this (in seconds), the audio of the confirmed words is dropped from it and only their text is passed along as the prompt.
+    """
+
+
+class VadConfig(BaseModel):
+    num_sessions: int = Field(default=1, ge=1)
+    """
+    Number of ONNX Runtime sessions of the silero VAD model. Each session runs one inference at a time, so this is the number of `/v1/audio/speech/timestamps` requests (and batches of realtime audio) that are processed in parallel.
+    """
+    intra_op_num_threads: int = Field(default=1, ge=0)
+    """
+    Number of threads used by each session to run a single operator. 0: ONNX Runtime's default (one per physical core).
+    """
+    inter_op_num_threads: int = Field(default=1, ge=0)
+    """
+    Number of threads used by each session to run independent operators in parallel. 0: ONNX Runtime's default.
+    """
+
+
+class RealtimeVadConfig(BaseModel):
+    max_wait_ms: float = Field(default=10.0, ge=0)
+    """
+    How long the VAD waits for more sessions' audio after the first one arrives, so that they're scored in a single batched inference.
+    0: Don't wait. Audio that arrives while a batch is being scored is scored together in the next batch.
+    """
+    max_batch_size: int = Field(default=256, ge=1)
+    """
+    Maximum number of sessions scored in a single batch.
+    """
 
 
 class OrtOptions(BaseModel):
@@ -90,6 +313,65 @@ class Config(BaseSettings):
 
     whisper: WhisperConfig = WhisperConfig()
 
+    inference_workers: int | None = Field(default=None, ge=1)
+    """
+    Number of threads that decode uploaded audio and run the transcription/translation inference. Requests beyond that wait in a queue, see `inference_queue_wait_seconds` in `GET /api/metrics`.
+    If not set, `2 * whisper.num_replicas * whisper.num_workers` (so the next request's audio is decoded while the current one is transcribed), but at least `whisper.batching.max_batch_size` when batching is enabled.
+    """
+
+    admission_control: AdmissionControlConfig = AdmissionControlConfig()
+    """
+    Concurrency limits and load shedding for the inference endpoints. Example: `ADMISSION_CONTROL__TRANSCRIPTION__MAX_CONCURRENT=4`.
+    """
+
+    priority: PriorityConfig = PriorityConfig()
+    """
+    Priority lanes for interactive (i.e. dictation) and bulk (i.e. long file) transcriptions. Example: `PRIORITY__BULK_MIN_DURATION_SECONDS=300`.
+    """
+
+    batch_jobs: BatchJobsConfig = BatchJobsConfig()
+    """
+    Example: `BATCH_JOBS__ENABLED=true`, `BATCH_JOBS__MANIFEST_DIRS='["/srv/archive"]'`.
+    """
+
+    dictation: DictationConfig = DictationConfig()
+    """
+    Incremental transcription of push-to-talk dictation over `WS /v1/audio/transcriptions`. Example: `DICTATION__MIN_CHUNK_SECONDS=0.5`.
+    """
+
+    vad: VadConfig = VadConfig()
+    """
+    The silero VAD model behind `/v1/audio/speech/timestamps` and the realtime turn detection. Its ONNX Runtime providers are chosen according to `unstable_ort_opts`. Example: `VAD__NUM_SESSIONS=4`.
+    """
+
+    realtime_vad: RealtimeVadConfig = RealtimeVadConfig()
+    """
+    Turn detection of the realtime sessions. The audio of all of the sessions is scored by a single batched VAD. Example: `REALTIME_VAD__MAX_WAIT_MS=20`.
+    """
+
+    preload_models: list[str] = []
+    """
+    Model IDs (whisper, kokoro, piper or `silero_vad_v5`) to load at startup. Each model is warmed up with a short synthetic inference and `/health` reports the server as ready only once all of them are warmed up. Models that failed to preload are listed in the `/health` response, which is still a 200.
+    Usage:
+        `export PRELOAD_MODELS='["Systran/faster-distil-whisper-small.en", "silero_vad_v5"]'`
+    """
+
+    transcription_cache: TranscriptionCacheConfig = TranscriptionCacheConfig()
+    """
+    Example: `TRANSCRIPTION_CACHE__ENABLED=true`, `TRANSCRIPTION_CACHE__DISK_PATH=/var/cache/speaches/transcriptions`.
+    """
+
+    remote_model_catalog: RemoteModelCatalogConfig = RemoteModelCatalogConfig()
+    """
+    Local cache of the remote model listings used by `/v1/registry` and to classify model ids. Example: `REMOTE_MODEL_CATALOG__OFFLINE=true`.
+    """
+
+    model_memory_budget_mb: int | None = Field(default=None, gt=0)
+    """
+    Maximum amount of memory (in megabytes) that loaded models (whisper, kokoro and piper) may use. The footprint of each model is estimated from the size of its files when it gets loaded. When loading a model would exceed the budget, idle models are unloaded in least-recently-used order.
+    If not set, models are only unloaded based on their `ttl`.
+    """
+
     # TODO: remove the underscore prefix from the field name
     _unstable_vad_filter: bool = True
     """
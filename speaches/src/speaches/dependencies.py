@@ -1,28 +1,50 @@
 from functools import lru_cache
 import logging
+import os
+from pathlib import Path
 from typing import Annotated
 
 import av.error
 from fastapi import (
     Depends,
     Form,
+    Header,
     HTTPException,
     UploadFile,
     status,
 )
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from faster_whisper.audio import decode_audio
 from httpx import ASGITransport, AsyncClient
+from huggingface_hub import constants as hf_constants
 from numpy import float32
 from numpy.typing import NDArray
 from openai import AsyncOpenAI
 from openai.resources.audio import AsyncSpeech, AsyncTranscriptions
 from openai.resources.chat.completions import AsyncCompletions
 
-from speaches.config import Config
+from speaches.admission import AdmissionControl
+from speaches.api_types import Model
+from speaches.audio import decode_audio, parse_raw_pcm_content_type, read_pcm_wav, read_raw_pcm
+from speaches.batch_jobs import BatchJobRunner, BatchJobStore
+from speaches.config import SAMPLES_PER_SECOND, Config, Priority
 from speaches.executors.kokoro.model_manager import KokoroModelManager
+from speaches.executors.kokoro.utils import KokoroModel
+from speaches.executors.kokoro.utils import model_registry as kokoro_model_registry
 from speaches.executors.piper.model_manager import PiperModelManager
+from speaches.executors.piper.utils import PiperModel
+from speaches.executors.piper.utils import model_registry as piper_model_registry
+from speaches.executors.silero_vad.model_manager import VadModelManager
+from speaches.executors.whisper.batching import WhisperBatchScheduler
+from speaches.executors.whisper.long_form import LongFormTranscriber
 from speaches.executors.whisper.model_manager import WhisperModelManager
+from speaches.executors.whisper.utils import model_registry as whisper_model_registry
+from speaches.inference_executor import InferenceExecutor
+from speaches.model_manager import ModelMemoryBudget
+from speaches.preload import ModelPreloader
+from speaches.priority import PriorityScheduler
+from speaches.remote_model_catalog import RemoteModelCatalog
+from speaches.streaming_vad import VadBatcher
+from speaches.transcription_cache import TranscriptionCache
 
 logger = logging.getLogger(__name__)
 
@@ -39,19 +61,139 @@ def get_config() -> Config:
 ConfigDependency = Annotated[Config, Depends(get_config)]
 
 
+@lru_cache
+def get_model_memory_budget() -> ModelMemoryBudget:
+    config = get_config()
+    return ModelMemoryBudget(
+        config.model_memory_budget_mb * 1024**2 if config.model_memory_budget_mb is not None else None
+    )
+
+
 @lru_cache
 def get_model_manager() -> WhisperModelManager:
     config = get_config()
-    return WhisperModelManager(config.whisper)
+    return WhisperModelManager(config.whisper, get_model_memory_budget())
 
 
 WhisperModelManagerDependency = Annotated[WhisperModelManager, Depends(get_model_manager)]
 
 
+@lru_cache
+def get_whisper_batch_scheduler() -> WhisperBatchScheduler:
+    config = get_config()
+    return WhisperBatchScheduler(get_model_manager(), config.whisper.batching)
+
+
+WhisperBatchSchedulerDependency = Annotated[WhisperBatchScheduler, Depends(get_whisper_batch_scheduler)]
+
+
+@lru_cache
+def get_priority_scheduler() -> PriorityScheduler:
+    config = get_config()
+    return PriorityScheduler(config.priority)
+
+
+PrioritySchedulerDependency = Annotated[PriorityScheduler, Depends(get_priority_scheduler)]
+
+
+@lru_cache
+def get_long_form_transcriber() -> LongFormTranscriber:
+    config = get_config()
+    return LongFormTranscriber(get_model_manager(), config.whisper.long_form, get_priority_scheduler())
+
+
+LongFormTranscriberDependency = Annotated[LongFormTranscriber, Depends(get_long_form_transcriber)]
+
+
+@lru_cache
+def get_transcription_cache() -> TranscriptionCache:
+    config = get_config()
+    return TranscriptionCache(config.transcription_cache)
+
+
+TranscriptionCacheDependency = Annotated[TranscriptionCache, Depends(get_transcription_cache)]
+
+
+@lru_cache
+def get_inference_executor() -> InferenceExecutor:
+    config = get_config()
+    max_workers = config.inference_workers
+    if max_workers is None:
+        max_workers = 2 * config.whisper.num_replicas * config.whisper.num_workers
+        if config.whisper.batching.enabled:
+            # NOTE: requests wait for their batch on a worker, fewer workers than `max_batch_size` would cap the batch size
+            max_workers = max(max_workers, config.whisper.batching.max_batch_size)
+    return InferenceExecutor(max_workers)
+
+
+InferenceExecutorDependency = Annotated[InferenceExecutor, Depends(get_inference_executor)]
+
+
+@lru_cache
+def get_admission_control() -> AdmissionControl:
+    config = get_config()
+    return AdmissionControl(config.admission_control)
+
+
+AdmissionControlDependency = Annotated[AdmissionControl, Depends(get_admission_control)]
+
+
+@lru_cache
+def get_vad_model_manager() -> VadModelManager:
+    config = get_config()
+    return VadModelManager(config.vad, config.unstable_ort_opts, get_model_memory_budget())
+
+
+VadModelManagerDependency = Annotated[VadModelManager, Depends(get_vad_model_manager)]
+
+
+@lru_cache
+def get_vad_batcher() -> VadBatcher:
+    config = get_config()
+    return VadBatcher(config.realtime_vad, get_vad_model_manager())
+
+
+VadBatcherDependency = Annotated[VadBatcher, Depends(get_vad_batcher)]
+
+
+@lru_cache
+def get_batch_job_store() -> BatchJobStore:
+    config = get_config()
+    if not config.batch_jobs.enabled:
+        raise HTTPException(status_code=404, detail="Batch jobs are disabled. Set `BATCH_JOBS__ENABLED=true`.")
+    return BatchJobStore(
+        Path(config.batch_jobs.path)
+        if config.batch_jobs.path is not None
+        else Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "speaches" / "batch_jobs"
+    )
+
+
+BatchJobStoreDependency = Annotated[BatchJobStore, Depends(get_batch_job_store)]
+
+
+@lru_cache
+def get_batch_job_runner() -> BatchJobRunner:
+    config = get_config()
+    return BatchJobRunner(
+        get_batch_job_store(),
+        num_workers=config.batch_jobs.num_workers,
+        model_manager=get_model_manager(),
+        batch_scheduler=get_whisper_batch_scheduler(),
+        long_form_transcriber=get_long_form_transcriber(),
+        priority_scheduler=get_priority_scheduler(),
+        admission_control=get_admission_control(),
+        whisper_config=config.whisper,
+    )
+
+
+BatchJobRunnerDependency = Annotated[BatchJobRunner, Depends(get_batch_job_runner)]
+
+
 @lru_cache
 def get_piper_model_manager() -> PiperModelManager:
     config = get_config()
-    return PiperModelManager(config.whisper.ttl, config.unstable_ort_opts)  # HACK: should have its own config
+    # HACK: should have its own config
+    return PiperModelManager(config.whisper.ttl, config.unstable_ort_opts, get_model_memory_budget())
 
 
 PiperModelManagerDependency = Annotated[PiperModelManager, Depends(get_piper_model_manager)]
@@ -60,11 +202,50 @@ PiperModelManagerDependency = Annotated[PiperModelManager, Depends(get_piper_mod
 @lru_cache
 def get_kokoro_model_manager() -> KokoroModelManager:
     config = get_config()
-    return KokoroModelManager(config.whisper.ttl, config.unstable_ort_opts)  # HACK: should have its own config
+    # HACK: should have its own config
+    return KokoroModelManager(config.whisper.ttl, config.unstable_ort_opts, get_model_memory_budget())
 
 
 KokoroModelManagerDependency = Annotated[KokoroModelManager, Depends(get_kokoro_model_manager)]
 
+
+@lru_cache
+def get_remote_model_catalog() -> RemoteModelCatalog:
+    config = get_config()
+    catalog_config = config.remote_model_catalog
+    return RemoteModelCatalog(
+        Path(catalog_config.path)
+        if catalog_config.path is not None
+        else Path(hf_constants.HF_HUB_CACHE) / "speaches_remote_models.json",
+        # NOTE: same precedence as the original classification, kokoro -> piper -> whisper
+        {
+            "kokoro": (kokoro_model_registry, KokoroModel),
+            "piper": (piper_model_registry, PiperModel),
+            "whisper": (whisper_model_registry, Model),
+        },
+        ttl=catalog_config.ttl,
+        offline=catalog_config.offline or hf_constants.HF_HUB_OFFLINE,
+    )
+
+
+RemoteModelCatalogDependency = Annotated[RemoteModelCatalog, Depends(get_remote_model_catalog)]
+
+
+@lru_cache
+def get_model_preloader() -> ModelPreloader:
+    config = get_config()
+    return ModelPreloader(
+        config.preload_models,
+        get_model_manager(),
+        get_kokoro_model_manager(),
+        get_piper_model_manager(),
+        get_vad_model_manager(),
+        get_remote_model_catalog(),
+    )
+
+
+ModelPreloaderDependency = Annotated[ModelPreloader, Depends(get_model_preloader)]
+
 security = HTTPBearer()
 
 
@@ -79,12 +260,22 @@ async def verify_api_key(
 ApiKeyDependency = Depends(verify_api_key)
 
 
-# TODO: test async vs sync performance
-def audio_file_dependency(
-    file: Annotated[UploadFile, Form()],
-) -> NDArray[float32]:
+def decode_audio_file(file: UploadFile) -> NDArray[float32]:
+    try:
+        raw_pcm_params = parse_raw_pcm_content_type(file.content_type)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid content type '{file.content_type}'. Expected e.g. 'audio/pcm;rate=16000;channels=1'.",
+        ) from e
     try:
-        audio = decode_audio(file.file)
+        # fast paths for audio that is already 16 kHz mono PCM, no decoding or resampling needed
+        if raw_pcm_params is not None:
+            audio = read_raw_pcm(file.file, *raw_pcm_params)
+        else:
+            audio = read_pcm_wav(file.file)
+            if audio is None:
+                audio = decode_audio(file.file)
     except av.error.InvalidDataError as e:
         raise HTTPException(
             status_code=415,
@@ -105,9 +296,46 @@ def audio_file_dependency(
         return audio  # pyright: ignore reportReturnType
 
 
+async def audio_file_dependency(
+    file: Annotated[UploadFile, Form()],
+    inference_executor: InferenceExecutorDependency,
+) -> NDArray[float32]:
+    # NOTE: decoding is CPU bound, so it's done on the inference workers instead of Starlette's shared threadpool
+    return await inference_executor.run(decode_audio_file, file)
+
+
 AudioFileDependency = Annotated[NDArray[float32], Depends(audio_file_dependency)]
 
 
+def authenticated_api_key(config: Config, authorization: str | None) -> str | None:
+    api_key = authorization.removeprefix("Bearer ").strip() if authorization is not None else None
+    # NOTE: the key's default priority only applies once it's authenticated (`verify_api_key` rejects any other key). Without an `api_key` nothing is authenticated and the bearer token only identifies the client
+    if config.api_key is not None and api_key != config.api_key.get_secret_value():
+        return None
+    return api_key
+
+
+async def get_request_priority(
+    config: ConfigDependency,
+    priority_scheduler: PrioritySchedulerDependency,
+    audio: AudioFileDependency,
+    priority: Annotated[
+        Priority | None,
+        Form(description="Interactive requests (i.e. dictation) are served before bulk ones (i.e. long files)."),
+    ] = None,
+    x_priority: Annotated[Priority | None, Header()] = None,
+    authorization: Annotated[str | None, Header()] = None,
+) -> Priority:
+    return priority_scheduler.resolve(
+        priority if priority is not None else x_priority,
+        authenticated_api_key(config, authorization),
+        len(audio) / SAMPLES_PER_SECOND,
+    )
+
+
+RequestPriorityDependency = Annotated[Priority, Depends(get_request_priority)]
+
+
 @lru_cache
 def get_completion_client() -> AsyncCompletions:
     config = get_config()
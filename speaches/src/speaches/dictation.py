@@ -0,0 +1,169 @@
+"""Incremental transcription of push-to-talk dictation, see `WS /v1/audio/transcriptions`.
+
+While the key is held, the growing utterance is retranscribed whenever enough new audio has arrived. Words that two consecutive hypotheses agree on are confirmed (LocalAgreement-2, https://arxiv.org/abs/2307.14743) and are sent as the stable part of the partial transcript. When the utterance is committed (the key is released) only the audio after the confirmed words has to be transcribed, so the final transcript is ready shortly after.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import logging
+from typing import TYPE_CHECKING
+
+from speaches.audio import Audio
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.metrics import metrics
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from faster_whisper import WhisperModel
+    from faster_whisper.transcribe import Word
+    import numpy as np
+    from numpy.typing import NDArray
+
+    from speaches.config import DictationConfig
+
+logger = logging.getLogger(__name__)
+
+# words starting this close to the end of the last confirmed word (or earlier) belong to already confirmed audio
+CONFIRMED_OVERLAP_SECONDS = 0.1
+# Whisper sometimes repeats the last few confirmed words at the start of a hypothesis, up to this many are dropped
+MAX_REPEATED_WORDS = 5
+# tail of the confirmed text that is passed as the prompt
+PROMPT_MAX_CHARS = 200
+
+partial_passes = metrics.counter("dictation_partial_passes", "Partial transcription passes of dictated utterances.")
+final_latency_seconds = metrics.summary(
+    "dictation_final_latency_seconds", "Time from the commit of a dictated utterance until its final transcript."
+)
+
+
+def words_to_text(words: Iterable[Word]) -> str:
+    return "".join(word.word for word in words).strip()
+
+
+def _normalize(word: Word) -> str:
+    return word.word.strip().lower()
+
+
+class LocalAgreement:
+    """Confirms the longest prefix that the last two hypotheses of the growing audio agree on."""
+
+    def __init__(self) -> None:
+        self.confirmed: list[Word] = []
+        self.unconfirmed: list[Word] = []
+
+    @property
+    def confirmed_end(self) -> float:
+        return self.confirmed[-1].end if len(self.confirmed) > 0 else 0.0
+
+    def new_words(self, hypothesis: list[Word]) -> list[Word]:
+        """The words of `hypothesis` that come after the confirmed ones."""
+        words = [word for word in hypothesis if word.start > self.confirmed_end - CONFIRMED_OVERLAP_SECONDS]
+        if len(words) > 0 and len(self.confirmed) > 0:
+            for n in range(min(len(words), len(self.confirmed), MAX_REPEATED_WORDS), 0, -1):
+                if [_normalize(word) for word in self.confirmed[-n:]] == [_normalize(word) for word in words[:n]]:
+                    return words[n:]
+        return words
+
+    def update(self, hypothesis: list[Word]) -> list[Word]:
+        """Returns the newly confirmed words."""
+        words = self.new_words(hypothesis)
+        num_agreed = 0
+        for previous, current in zip(self.unconfirmed, words, strict=False):
+            if _normalize(previous) != _normalize(current):
+                break
+            num_agreed += 1
+        self.confirmed.extend(words[:num_agreed])
+        self.unconfirmed = words[num_agreed:]
+        return words[:num_agreed]
+
+
+class Utterance:
+    """The audio and the transcript so far of a single utterance, from when the key is pressed until it's committed."""
+
+    def __init__(self, config: DictationConfig) -> None:
+        self.config = config
+        # NOTE: `audio.start` is where the (trimmed) audio starts within the utterance
+        self.audio = Audio()
+        self.agreement = LocalAgreement()
+        self.language: str | None = None
+        self.transcribed_until = 0.0
+        self.committed_at: float | None = None
+
+    def append(self, samples: NDArray[np.int16] | NDArray[np.float32]) -> None:
+        self.audio.extend(samples)
+
+    @property
+    def untranscribed_seconds(self) -> float:
+        return self.audio.end - self.transcribed_until
+
+    @property
+    def confirmed_text(self) -> str:
+        return words_to_text(self.agreement.confirmed)
+
+    @property
+    def unconfirmed_text(self) -> str:
+        return words_to_text(self.agreement.unconfirmed)
+
+    def prompt(self, prompt: str | None) -> str | None:
+        confirmed_text = self.confirmed_text[-PROMPT_MAX_CHARS:]
+        if len(confirmed_text) == 0:
+            return prompt
+        return f"{prompt} {confirmed_text}" if prompt else confirmed_text
+
+    def snapshot(self) -> Audio:
+        """The audio to transcribe next. It's a view, appending to the utterance afterwards doesn't modify it."""
+        return Audio(self.audio.samples, start=self.audio.start)
+
+    def final_snapshot(self) -> Audio:
+        """The audio after the confirmed words, which is all that's left to transcribe once the utterance is committed. The confirmed words are passed as the prompt instead (see `prompt`)."""
+        confirmed_end = max(self.agreement.confirmed_end, self.audio.start)
+        return Audio(
+            self.audio.samples[int((confirmed_end - self.audio.start) * SAMPLES_PER_SECOND) :], start=confirmed_end
+        )
+
+    def update(self, audio: Audio, hypothesis: list[Word], language: str) -> list[Word]:
+        """Apply the hypothesis of `audio` (a snapshot of this utterance). Returns the newly confirmed words."""
+        self.transcribed_until = audio.end
+        self.language = language
+        newly_confirmed = self.agreement.update(hypothesis)
+        if self.audio.duration > self.config.max_buffer_seconds and self.agreement.confirmed_end > self.audio.start:
+            trim_at = self.agreement.confirmed_end
+            self.audio = Audio(
+                self.audio.samples[int((trim_at - self.audio.start) * SAMPLES_PER_SECOND) :], start=trim_at
+            )
+        return newly_confirmed
+
+    def final_text(self, hypothesis: list[Word] | None = None) -> str:
+        """The transcript of the committed utterance given the hypothesis of the audio after the confirmed words (see `final_snapshot`). Without one, the last hypothesis is used, which is only complete if nothing was appended since (`untranscribed_seconds == 0`)."""
+        if hypothesis is None:
+            return words_to_text([*self.agreement.confirmed, *self.agreement.unconfirmed])
+        return words_to_text([*self.agreement.confirmed, *self.agreement.new_words(hypothesis)])
+
+
+def transcribe_words(
+    whisper: WhisperModel,
+    audio: Audio,
+    *,
+    language: str | None,
+    prompt: str | None,
+    hotwords: str | None,
+) -> tuple[list[Word], str]:
+    """Transcribe `audio` into words with timestamps within the utterance. Blocks."""
+    segments, transcription_info = whisper.transcribe(
+        audio.data,
+        task="transcribe",
+        language=language,
+        initial_prompt=prompt,
+        word_timestamps=True,
+        condition_on_previous_text=False,
+        vad_filter=False,
+        hotwords=hotwords,
+    )
+    words = [
+        dataclasses.replace(word, start=word.start + audio.start, end=word.end + audio.start)
+        for segment in segments
+        for word in segment.words or ()
+    ]
+    return words, transcription_info.language
@@ -7,15 +7,16 @@ from onnxruntime import InferenceSession, get_available_providers
 
 from speaches.config import OrtOptions
 from speaches.executors.kokoro.utils import model_registry
-from speaches.model_manager import SelfDisposingModel
+from speaches.model_manager import ModelMemoryBudget, SelfDisposingModel, estimate_model_size
 
 logger = logging.getLogger(__name__)
 
 
 class KokoroModelManager:
-    def __init__(self, ttl: int, ort_opts: OrtOptions) -> None:
+    def __init__(self, ttl: int, ort_opts: OrtOptions, memory_budget: ModelMemoryBudget | None = None) -> None:
         self.ttl = ttl
         self.ort_opts = ort_opts
+        self.memory_budget = memory_budget
         self.loaded_models: OrderedDict[str, SelfDisposingModel[Kokoro]] = OrderedDict()
         self._lock = threading.Lock()
 
@@ -39,6 +40,10 @@ class KokoroModelManager:
         inf_sess = InferenceSession(model_files.model, providers=available_providers_with_opts)
         return Kokoro.from_session(inf_sess, str(model_files.voices))
 
+    def _size_fn(self, model_id: str) -> int:
+        model_files = model_registry.get_model_files(model_id)
+        return estimate_model_size([model_files.model, model_files.voices])
+
     def _handle_model_unloaded(self, model_id: str) -> None:
         with self._lock:
             if model_id in self.loaded_models:
@@ -83,5 +88,7 @@ class KokoroModelManager:
                 load_fn=lambda: self._load_fn(model_id),
                 ttl=self.ttl,
                 model_unloaded_callback=self._handle_model_unloaded,
+                size_fn=lambda: self._size_fn(model_id),
+                memory_budget=self.memory_budget,
             )
             return self.loaded_models[model_id]
@@ -10,17 +10,16 @@ import numpy as np
 from pydantic import BaseModel, computed_field
 
 from speaches.api_types import Model
-from speaches.audio import resample_audio
 from speaches.hf_utils import (
+    CachedModelRepo,
     HfModelFilter,
     extract_language_list,
-    get_cached_model_repos_info,
-    get_model_card_data_from_cached_repo_info,
     list_model_files,
 )
 from speaches.model_registry import (
     ModelRegistry,
 )
+from speaches.resampling import Resampler
 
 SAMPLE_RATE = 24000  # the default sample rate for Kokoro
 LIBRARY_NAME = "onnx"
@@ -141,22 +140,17 @@ class KokoroModelRegistry(ModelRegistry):
                 voices=VOICES,
             )
 
-    def list_local_models(self) -> Generator[KokoroModel, None, None]:
-        cached_model_repos_info = get_cached_model_repos_info()
-        for cached_repo_info in cached_model_repos_info:
-            model_card_data = get_model_card_data_from_cached_repo_info(cached_repo_info)
-            if model_card_data is None:
-                continue
-            if self.hf_model_filter.passes_filter(model_card_data):
-                yield KokoroModel(
-                    id=cached_repo_info.repo_id,
-                    created=int(cached_repo_info.last_modified),
-                    owned_by=cached_repo_info.repo_id.split("/")[0],
-                    language=extract_language_list(model_card_data),
-                    task=TASK_NAME_TAG,
-                    sample_rate=SAMPLE_RATE,
-                    voices=VOICES,
-                )
+    def _model_from_cached_repo(self, model_id: str, cached_repo: CachedModelRepo) -> KokoroModel:
+        assert cached_repo.model_card_data is not None
+        return KokoroModel(
+            id=model_id,
+            created=int(cached_repo.last_modified),
+            owned_by=model_id.split("/")[0],
+            language=extract_language_list(cached_repo.model_card_data),
+            task=TASK_NAME_TAG,
+            sample_rate=SAMPLE_RATE,
+            voices=VOICES,
+        )
 
     def get_model_files(self, model_id: str) -> KokoroModelFiles:
         model_files = list(list_model_files(model_id))
@@ -189,12 +183,14 @@ async def generate_audio(
     if sample_rate is None:
         sample_rate = SAMPLE_RATE
     voice_language = next(v.language for v in VOICES if v.name == voice)
+    resampler = Resampler(SAMPLE_RATE, sample_rate) if sample_rate != SAMPLE_RATE else None
     start = time.perf_counter()
     async for audio_data, _ in kokoro_tts.create_stream(text, voice, lang=voice_language, speed=speed):
         assert isinstance(audio_data, np.ndarray) and audio_data.dtype == np.float32 and isinstance(sample_rate, int)
         normalized_audio_data = (audio_data * np.iinfo(np.int16).max).astype(np.int16)
-        audio_bytes = normalized_audio_data.tobytes()
-        if sample_rate != SAMPLE_RATE:
-            audio_bytes = resample_audio(audio_bytes, SAMPLE_RATE, sample_rate)
-        yield audio_bytes
+        if resampler is not None:
+            normalized_audio_data = resampler.process(normalized_audio_data)
+        yield normalized_audio_data.tobytes()
+    if resampler is not None:
+        yield resampler.flush().tobytes()
     logger.info(f"Generated audio for {len(text)} characters in {time.perf_counter() - start}s")
@@ -10,7 +10,7 @@ from onnxruntime import InferenceSession, get_available_providers
 
 from speaches.config import OrtOptions  # noqa: TC001
 from speaches.executors.piper.utils import model_registry
-from speaches.model_manager import SelfDisposingModel
+from speaches.model_manager import ModelMemoryBudget, SelfDisposingModel, estimate_model_size
 
 if TYPE_CHECKING:
     from piper.voice import PiperVoice
@@ -20,9 +20,10 @@ logger = logging.getLogger(__name__)
 
 
 class PiperModelManager:
-    def __init__(self, ttl: int, ort_opts: OrtOptions) -> None:
+    def __init__(self, ttl: int, ort_opts: OrtOptions, memory_budget: ModelMemoryBudget | None = None) -> None:
         self.ttl = ttl
         self.ort_opts = ort_opts
+        self.memory_budget = memory_budget
         self.loaded_models: OrderedDict[str, SelfDisposingModel[PiperVoice]] = OrderedDict()
         self._lock = threading.Lock()
 
@@ -49,6 +50,10 @@ class PiperModelManager:
         conf = PiperConfig.from_dict(json.loads(model_files.config.read_text()))
         return PiperVoice(session=inf_sess, config=conf)
 
+    def _size_fn(self, model_id: str) -> int:
+        model_files = model_registry.get_model_files(model_id)
+        return estimate_model_size([model_files.model])
+
     def _handle_model_unloaded(self, model_id: str) -> None:
         with self._lock:
             if model_id in self.loaded_models:
@@ -96,5 +101,7 @@ class PiperModelManager:
                 load_fn=lambda: self._load_fn(model_id),
                 ttl=self.ttl,
                 model_unloaded_callback=self._handle_model_unloaded,
+                size_fn=lambda: self._size_fn(model_id),
+                memory_budget=self.memory_budget,
             )
             return self.loaded_models[model_id]
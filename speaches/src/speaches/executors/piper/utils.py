@@ -6,24 +6,25 @@ import time
 from typing import TYPE_CHECKING, Literal
 
 import huggingface_hub
+import numpy as np
 from pydantic import BaseModel, computed_field
 
 from speaches.api_types import Model
-from speaches.audio import resample_audio
 from speaches.hf_utils import (
     HfModelFilter,
     extract_language_list,
-    get_cached_model_repos_info,
-    get_model_card_data_from_cached_repo_info,
     list_model_files,
 )
 from speaches.model_registry import ModelRegistry
+from speaches.resampling import Resampler
 
 if TYPE_CHECKING:
     from collections.abc import Generator
 
     from piper.voice import PiperVoice
 
+    from speaches.hf_utils import CachedModelRepo
+
 
 PiperVoiceQuality = Literal["x_low", "low", "medium", "high"]
 PIPER_VOICE_QUALITY_SAMPLE_RATE_MAP: dict[PiperVoiceQuality, int] = {
@@ -96,35 +97,31 @@ class PiperModelRegistry(ModelRegistry):
                 ],
             )
 
-    def list_local_models(self) -> Generator[PiperModel, None, None]:
-        cached_model_repos_info = get_cached_model_repos_info()
-        for cached_repo_info in cached_model_repos_info:
-            model_card_data = get_model_card_data_from_cached_repo_info(cached_repo_info)
-            if model_card_data is None:
-                continue
-            if self.hf_model_filter.passes_filter(model_card_data):
-                repo_id_parts = cached_repo_info.repo_id.split("/")[-1].split("-")
-                # HACK: all of the `speaches-ai` piper models have a prefix of `piper-`. That's why there are 4 parts.
-                assert len(repo_id_parts) == 4, repo_id_parts
-                _prefix, _language_and_region, name, quality = repo_id_parts
-                assert quality in PIPER_VOICE_QUALITY_SAMPLE_RATE_MAP, cached_repo_info.repo_id
-                sample_rate = PIPER_VOICE_QUALITY_SAMPLE_RATE_MAP[quality]
-                languages = extract_language_list(model_card_data)
-                assert len(languages) == 1, model_card_data
-                yield PiperModel(
-                    id=cached_repo_info.repo_id,
-                    created=int(cached_repo_info.last_modified),
-                    owned_by=cached_repo_info.repo_id.split("/")[0],
-                    language=extract_language_list(model_card_data),
-                    task=TASK_NAME_TAG,
-                    sample_rate=sample_rate,
-                    voices=[
-                        PiperModelVoice(
-                            name=name,
-                            language=languages[0],
-                        )
-                    ],
+    def _model_from_cached_repo(self, model_id: str, cached_repo: CachedModelRepo) -> PiperModel:
+        model_card_data = cached_repo.model_card_data
+        assert model_card_data is not None
+        repo_id_parts = model_id.split("/")[-1].split("-")
+        # HACK: all of the `speaches-ai` piper models have a prefix of `piper-`. That's why there are 4 parts.
+        assert len(repo_id_parts) == 4, repo_id_parts
+        _prefix, _language_and_region, name, quality = repo_id_parts
+        assert quality in PIPER_VOICE_QUALITY_SAMPLE_RATE_MAP, model_id
+        sample_rate = PIPER_VOICE_QUALITY_SAMPLE_RATE_MAP[quality]
+        languages = extract_language_list(model_card_data)
+        assert len(languages) == 1, model_card_data
+        return PiperModel(
+            id=model_id,
+            created=int(cached_repo.last_modified),
+            owned_by=model_id.split("/")[0],
+            language=extract_language_list(model_card_data),
+            task=TASK_NAME_TAG,
+            sample_rate=sample_rate,
+            voices=[
+                PiperModelVoice(
+                    name=name,
+                    language=languages[0],
                 )
+            ],
+        )
 
     def get_model_files(self, model_id: str) -> PiperModelFiles:
         model_files = list(list_model_files(model_id))
@@ -151,9 +148,14 @@ def generate_audio(
 ) -> Generator[bytes, None, None]:
     if sample_rate is None:
         sample_rate = piper_tts.config.sample_rate
+    resampler = (
+        Resampler(piper_tts.config.sample_rate, sample_rate) if sample_rate != piper_tts.config.sample_rate else None
+    )
     start = time.perf_counter()
     for audio_bytes in piper_tts.synthesize_stream_raw(text, length_scale=1.0 / speed):
-        if sample_rate != piper_tts.config.sample_rate:
-            audio_bytes = resample_audio(audio_bytes, piper_tts.config.sample_rate, sample_rate)  # noqa: PLW2901
+        if resampler is not None:
+            audio_bytes = resampler.process(np.frombuffer(audio_bytes, dtype=np.int16)).tobytes()  # noqa: PLW2901
         yield audio_bytes
+    if resampler is not None:
+        yield resampler.flush().tobytes()
     logger.info(f"Generated audio for {len(text)} characters in {time.perf_counter() - start}s")
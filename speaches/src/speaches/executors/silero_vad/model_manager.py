@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+import threading
+from typing import TYPE_CHECKING, Any
+
+from faster_whisper.utils import get_assets_path
+from faster_whisper.vad import SileroVADModel
+from onnxruntime import InferenceSession, SessionOptions, get_available_providers
+
+from speaches.model_manager import ModelMemoryBudget, SelfDisposingModel, estimate_model_size
+
+if TYPE_CHECKING:
+    from speaches.config import OrtOptions, VadConfig
+
+logger = logging.getLogger(__name__)
+
+MODEL_ID = "silero_vad_v5"
+ENCODER_PATH = Path(get_assets_path()) / "silero_encoder_v5.onnx"
+DECODER_PATH = Path(get_assets_path()) / "silero_decoder_v5.onnx"
+
+
+class SileroVad(SileroVADModel):
+    """`SileroVADModel` on the configured ONNX Runtime providers and threads. `faster_whisper` always creates it on a single CPU thread."""
+
+    def __init__(self, providers: list[tuple[str, dict[str, Any]]], sess_options: SessionOptions) -> None:
+        self.encoder_session = InferenceSession(ENCODER_PATH, providers=providers, sess_options=sess_options)
+        self.decoder_session = InferenceSession(DECODER_PATH, providers=providers, sess_options=sess_options)
+
+
+class VadModelManager:
+    """A pool of `num_sessions` sessions of the silero VAD model. Each one is loaded on first use."""
+
+    def __init__(
+        self, vad_config: VadConfig, ort_opts: OrtOptions, memory_budget: ModelMemoryBudget | None = None
+    ) -> None:
+        self.vad_config = vad_config
+        self.ort_opts = ort_opts
+        self.sessions = [
+            SelfDisposingModel[SileroVad](
+                MODEL_ID,
+                load_fn=self._load_fn,
+                size_fn=lambda: estimate_model_size([ENCODER_PATH, DECODER_PATH]),
+                memory_budget=memory_budget,
+            )
+            for _ in range(vad_config.num_sessions)
+        ]
+        self._lock = threading.Lock()
+
+    def _load_fn(self) -> SileroVad:
+        # NOTE: `get_available_providers` is an unknown symbol (on MacOS at least)
+        available_providers: list[str] = get_available_providers()
+        available_providers = [
+            provider for provider in available_providers if provider not in self.ort_opts.exclude_providers
+        ]
+        available_providers = sorted(
+            available_providers,
+            key=lambda x: self.ort_opts.provider_priority.get(x, 0),
+            reverse=True,
+        )
+        available_providers_with_opts = [
+            (provider, self.ort_opts.provider_opts.get(provider, {})) for provider in available_providers
+        ]
+        logger.debug(f"Using ONNX Runtime providers: {available_providers_with_opts}")
+        sess_options = SessionOptions()
+        sess_options.intra_op_num_threads = self.vad_config.intra_op_num_threads
+        sess_options.inter_op_num_threads = self.vad_config.inter_op_num_threads
+        sess_options.enable_cpu_mem_arena = False
+        sess_options.log_severity_level = 4
+        return SileroVad(available_providers_with_opts, sess_options)
+
+    def unload_model(self, model_id: str) -> None:
+        if model_id != MODEL_ID:
+            raise KeyError(f"Model {model_id} not found")
+        for session in self.sessions:
+            if session.model is not None:
+                session.unload()
+
+    def load_model(self, model_id: str) -> SelfDisposingModel[SileroVad]:
+        """The least busy session. It's reserved for the caller, who has to enter it right away."""
+        if model_id != MODEL_ID:
+            raise KeyError(f"Model {model_id} not found")
+        with self._lock:
+            # least busy first, then prefer an already loaded session over loading a new one
+            session = min(self.sessions, key=lambda session: (session.ref_count, session.model is None))
+            # NOTE: reserved while `_lock` is still held, otherwise concurrent callers would all pick the same session
+            session.reserve()
+            return session
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.streaming_vad import WINDOW_SIZE_SAMPLES, SileroState, speech_probs
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from faster_whisper.vad import SileroVADModel, VadOptions
+    from numpy.typing import NDArray
+
+
+def get_speech_timestamps(
+    model: SileroVADModel, audios: Sequence[NDArray[np.float32]], vad_options: VadOptions
+) -> list[list[dict[str, int]]]:
+    """Same as `faster_whisper.vad.get_speech_timestamps` for each of the 16 kHz `audios`, but on `model` instead of `faster_whisper`'s own instance. The speech probabilities of all of the audios are computed in a single batched inference."""
+    # NOTE: like in `faster_whisper`, the audio is always padded, even if its length is already a multiple of the window size
+    windows = [
+        np.pad(audio, (0, WINDOW_SIZE_SAMPLES - len(audio) % WINDOW_SIZE_SAMPLES)).reshape(-1, WINDOW_SIZE_SAMPLES)
+        for audio in audios
+    ]
+    probs = speech_probs(model, [(audio_windows, SileroState()) for audio_windows in windows])
+    return [
+        speech_timestamps(audio_probs, len(audio), vad_options)
+        for audio_probs, audio in zip(probs, audios, strict=True)
+    ]
+
+
+def speech_timestamps(  # noqa: C901, PLR0912, PLR0915
+    probs: NDArray[np.float32], audio_length_samples: int, vad_options: VadOptions
+) -> list[dict[str, int]]:
+    """The speech chunks (in samples) given the speech probability of each window. This is the post-processing of `faster_whisper.vad.get_speech_timestamps`, which can't be given the probabilities (or a model to compute them with)."""
+    threshold = vad_options.threshold
+    neg_threshold = vad_options.neg_threshold
+    if neg_threshold is None:
+        neg_threshold = max(threshold - 0.15, 0.01)
+    min_speech_samples = SAMPLES_PER_SECOND * vad_options.min_speech_duration_ms / 1000
+    speech_pad_samples = SAMPLES_PER_SECOND * vad_options.speech_pad_ms / 1000
+    max_speech_samples = (
+        SAMPLES_PER_SECOND * vad_options.max_speech_duration_s - WINDOW_SIZE_SAMPLES - 2 * speech_pad_samples
+    )
+    min_silence_samples = SAMPLES_PER_SECOND * vad_options.min_silence_duration_ms / 1000
+    min_silence_samples_at_max_speech = SAMPLES_PER_SECOND * 98 / 1000
+
+    triggered = False
+    speeches: list[dict[str, int]] = []
+    current_speech: dict[str, int] = {}
+    # to save potential segment end (and tolerate some silence)
+    temp_end = 0
+    # to save potential segment limits in case of maximum segment size reached
+    prev_end = next_start = 0
+
+    for i, prob in enumerate(probs):
+        position = WINDOW_SIZE_SAMPLES * i
+        if prob >= threshold and temp_end:
+            temp_end = 0
+            if next_start < prev_end:
+                next_start = position
+
+        if prob >= threshold and not triggered:
+            triggered = True
+            current_speech["start"] = position
+            continue
+
+        if triggered and position - current_speech["start"] > max_speech_samples:
+            if prev_end:
+                current_speech["end"] = prev_end
+                speeches.append(current_speech)
+                current_speech = {}
+                # previously reached silence (< neg_threshold) and is still not speech (< threshold)
+                if next_start < prev_end:
+                    triggered = False
+                else:
+                    current_speech["start"] = next_start
+                prev_end = next_start = temp_end = 0
+            else:
+                current_speech["end"] = position
+                speeches.append(current_speech)
+                current_speech = {}
+                prev_end = next_start = temp_end = 0
+                triggered = False
+                continue
+
+        if prob < neg_threshold and triggered:
+            if not temp_end:
+                temp_end = position
+            # condition to avoid cutting in very short silence
+            if position - temp_end > min_silence_samples_at_max_speech:
+                prev_end = temp_end
+            if position - temp_end < min_silence_samples:
+                continue
+            current_speech["end"] = temp_end
+            if current_speech["end"] - current_speech["start"] > min_speech_samples:
+                speeches.append(current_speech)
+            current_speech = {}
+            prev_end = next_start = temp_end = 0
+            triggered = False
+
+    if current_speech and audio_length_samples - current_speech["start"] > min_speech_samples:
+        current_speech["end"] = audio_length_samples
+        speeches.append(current_speech)
+
+    for i, speech in enumerate(speeches):
+        if i == 0:
+            speech["start"] = int(max(0, speech["start"] - speech_pad_samples))
+        if i != len(speeches) - 1:
+            silence_duration = speeches[i + 1]["start"] - speech["end"]
+            if silence_duration < 2 * speech_pad_samples:
+                speech["end"] += int(silence_duration // 2)
+                speeches[i + 1]["start"] = int(max(0, speeches[i + 1]["start"] - silence_duration // 2))
+            else:
+                speech["end"] = int(min(audio_length_samples, speech["end"] + speech_pad_samples))
+                speeches[i + 1]["start"] = int(max(0, speeches[i + 1]["start"] - speech_pad_samples))
+        else:
+            speech["end"] = int(min(audio_length_samples, speech["end"] + speech_pad_samples))
+
+    return speeches
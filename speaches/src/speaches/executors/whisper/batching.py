@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import bisect
+from collections import deque
+from concurrent.futures import Future
+import dataclasses
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, NamedTuple
+
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.transcribe import BatchedInferencePipeline, Segment, TranscriptionInfo, TranscriptionOptions
+from faster_whisper.vad import VadOptions, get_speech_timestamps, merge_segments
+import numpy as np
+
+from speaches.config import SAMPLES_PER_SECOND
+
+if TYPE_CHECKING:
+    from faster_whisper import WhisperModel
+    from numpy.typing import NDArray
+
+    from speaches.config import WhisperBatchingConfig
+    from speaches.executors.whisper.model_manager import WhisperModelManager
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCHED_SAMPLES = 30 * SAMPLES_PER_SECOND
+"""Only requests that fit into a single Whisper window are batched."""
+DISPATCHER_IDLE_SECONDS = 30.0
+"""How long an idle dispatcher waits for requests before checking whether its model is still loaded."""
+
+
+class BatchKey(NamedTuple):
+    """Decoding parameters that must be identical for requests to share a batch."""
+
+    task: str
+    language: str | None
+    initial_prompt: str | None
+    hotwords: str | None
+    temperature: float
+    word_timestamps: bool
+
+
+@dataclasses.dataclass(eq=False)
+class BatchRequest:
+    key: BatchKey
+    audio: NDArray[np.float32]
+    vad_filter: bool
+    future: Future[tuple[list[Segment], TranscriptionInfo]] = dataclasses.field(default_factory=Future)
+    language_probability: float = 1.0
+
+    @property
+    def duration(self) -> float:
+        return len(self.audio) / SAMPLES_PER_SECOND
+
+
+class WhisperBatchScheduler:
+    """Groups concurrent requests for the same model and runs them through a single `BatchedInferencePipeline` call.
+
+    Each model gets one dispatcher thread per replica. A dispatcher takes every request that is already waiting (and optionally waits up to `max_wait_ms` for more), so a lone request is dispatched immediately while requests that pile up behind a running batch are decoded together. The dispatchers stop once their queue is empty and the model has been unloaded (or never got loaded), and are started again by the next request.
+    """
+
+    def __init__(self, model_manager: WhisperModelManager, batching_config: WhisperBatchingConfig) -> None:
+        self.model_manager = model_manager
+        self.batching_config = batching_config
+        self._queues: dict[str, deque[BatchRequest]] = {}
+        self._conditions: dict[str, threading.Condition] = {}
+        self._lock = threading.Lock()
+
+    def transcribe(
+        self,
+        model_id: str,
+        audio: NDArray[np.float32],
+        *,
+        task: str = "transcribe",
+        language: str | None = None,
+        initial_prompt: str | None = None,
+        temperature: float = 0.0,
+        word_timestamps: bool = False,
+        hotwords: str | None = None,
+        vad_filter: bool = False,
+    ) -> tuple[list[Segment], TranscriptionInfo]:
+        """Submit a request and block until its batch has been decoded. The audio must not be longer than `MAX_BATCHED_SAMPLES`."""
+        request = BatchRequest(
+            key=BatchKey(task, language, initial_prompt, hotwords, temperature, word_timestamps),
+            audio=audio,
+            vad_filter=vad_filter,
+        )
+        # NOTE: enqueued while `_lock` is held, so that the queue can't be retired by its dispatchers in the meantime
+        with self._lock:
+            queue, condition = self._get_queue(model_id)
+            with condition:
+                queue.append(request)
+                condition.notify()
+        return request.future.result()
+
+    def _get_queue(self, model_id: str) -> tuple[deque[BatchRequest], threading.Condition]:
+        """Must be called with `_lock` held."""
+        if model_id not in self._queues:
+            queue: deque[BatchRequest] = deque()
+            condition = threading.Condition()
+            self._queues[model_id] = queue
+            self._conditions[model_id] = condition
+            # one dispatcher per replica so that batches for the same model can run in parallel
+            for i in range(self.model_manager.whisper_config.num_replicas):
+                threading.Thread(
+                    target=self._dispatch_loop,
+                    args=(model_id, queue, condition),
+                    name=f"whisper-batcher-{model_id}-{i}",
+                    daemon=True,
+                ).start()
+        return self._queues[model_id], self._conditions[model_id]
+
+    def _retire_if_idle(self, model_id: str, queue: deque[BatchRequest], condition: threading.Condition) -> bool:
+        """Whether the dispatchers of `queue` should stop. The queue is dropped if it's empty and the model isn't loaded."""
+        with self._lock:
+            if self._queues.get(model_id) is not queue:
+                # another dispatcher of this model already retired the queue
+                return True
+            if model_id in self.model_manager.loaded_models:
+                return False
+            with condition:
+                if len(queue) > 0:
+                    return False
+                del self._queues[model_id]
+                del self._conditions[model_id]
+        logger.debug(f"Stopping the batch dispatchers of {model_id}, the model isn't loaded anymore")
+        return True
+
+    def _collect_batch(self, queue: deque[BatchRequest], condition: threading.Condition) -> list[BatchRequest] | None:
+        """The next batch, or `None` if no request arrived within `DISPATCHER_IDLE_SECONDS`."""
+        with condition:
+            if not condition.wait_for(lambda: len(queue) > 0, timeout=DISPATCHER_IDLE_SECONDS):
+                return None
+            batch = [queue.popleft()]
+            batch_audio_seconds = batch[0].duration
+            deadline = time.perf_counter() + self.batching_config.max_wait_ms / 1000
+            while len(batch) < self.batching_config.max_batch_size:
+                if len(queue) == 0:
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0 or not condition.wait_for(lambda: len(queue) > 0, timeout=timeout):
+                        break
+                if batch_audio_seconds + queue[0].duration > self.batching_config.max_batch_audio_seconds:
+                    break
+                request = queue.popleft()
+                batch.append(request)
+                batch_audio_seconds += request.duration
+        return batch
+
+    def _dispatch_loop(self, model_id: str, queue: deque[BatchRequest], condition: threading.Condition) -> None:
+        while True:
+            batch = self._collect_batch(queue, condition)
+            if batch is None:
+                if self._retire_if_idle(model_id, queue, condition):
+                    return
+                continue
+            start = time.perf_counter()
+            try:
+                with self.model_manager.load_model(model_id) as whisper:
+                    self._run_batch(whisper, batch)
+            except Exception as e:
+                logger.exception(f"Failed to run a batch of {len(batch)} requests for {model_id}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            logger.debug(
+                f"Decoded a batch of {len(batch)} requests ({sum(r.duration for r in batch):.2f}s of audio) for {model_id} in {time.perf_counter() - start:.2f}s"
+            )
+
+    def _run_batch(self, whisper: WhisperModel, batch: list[BatchRequest]) -> None:
+        undetected = [request for request in batch if request.key.language is None]
+        if len(undetected) > 0:
+            self._detect_languages(whisper, undetected)
+
+        groups: dict[BatchKey, list[BatchRequest]] = {}
+        for request in batch:
+            groups.setdefault(request.key, []).append(request)
+        for requests in groups.values():
+            try:
+                self._run_group(whisper, requests)
+            except Exception as e:  # noqa: BLE001
+                for request in requests:
+                    request.future.set_exception(e)
+
+    def _detect_languages(self, whisper: WhisperModel, requests: list[BatchRequest]) -> None:
+        """Detect the language of each request in one batched encoder pass so that requests without a `language` can share a batch."""
+        if not whisper.model.is_multilingual:
+            for request in requests:
+                request.key = request.key._replace(language="en")
+            return
+        features = np.stack([pad_or_trim(whisper.feature_extractor(request.audio)[..., :-1]) for request in requests])
+        results = whisper.model.detect_language(whisper.encode(features))
+        for request, language_probs in zip(requests, results, strict=True):
+            language_token, language_probability = language_probs[0]
+            request.key = request.key._replace(language=language_token[2:-2])
+            request.language_probability = language_probability
+
+    def _run_group(self, whisper: WhisperModel, requests: list[BatchRequest]) -> None:
+        key = requests[0].key
+        chunk_length = whisper.feature_extractor.chunk_length
+
+        # The audio of every request is placed on a whole-second boundary of one long array. `clip_timestamps` tells the pipeline where each request's speech is, so each request becomes one (or more, when VAD splits it) items of the batch.
+        audio_parts: list[NDArray[np.float32]] = []
+        clip_timestamps: list[dict[str, int]] = []
+        offsets: list[float] = []
+        speech_samples: list[int] = []
+        position = 0
+        for request in requests:
+            if request.vad_filter:
+                vad_options = VadOptions(max_speech_duration_s=chunk_length, min_silence_duration_ms=160)
+                speech_chunks = merge_segments(get_speech_timestamps(request.audio, vad_options), vad_options)
+            else:
+                speech_chunks = [{"start": 0, "end": len(request.audio)}]
+            speech_chunks = [chunk for chunk in speech_chunks if chunk["end"] > chunk["start"]]
+            clip_timestamps.extend(
+                {"start": chunk["start"] + position, "end": chunk["end"] + position} for chunk in speech_chunks
+            )
+            speech_samples.append(sum(chunk["end"] - chunk["start"] for chunk in speech_chunks))
+            offsets.append(position / SAMPLES_PER_SECOND)
+            padded_size = -(-len(request.audio) // SAMPLES_PER_SECOND) * SAMPLES_PER_SECOND
+            audio_parts.append(np.pad(request.audio, (0, padded_size - len(request.audio))))
+            position += padded_size
+
+        if len(clip_timestamps) == 0:
+            # every request is silent, there's nothing to decode (an empty `clip_timestamps` would make the pipeline transcribe the whole array instead)
+            transcription_options = silent_transcription_options(key)
+            for request in requests:
+                request.future.set_result(
+                    (
+                        [],
+                        TranscriptionInfo(
+                            language=key.language or "en",
+                            language_probability=request.language_probability,
+                            duration=request.duration,
+                            duration_after_vad=0.0,
+                            all_language_probs=None,
+                            transcription_options=transcription_options,
+                            vad_options=None,  # pyright: ignore[reportArgumentType]
+                        ),
+                    )
+                )
+            return
+
+        segments, info = BatchedInferencePipeline(model=whisper).transcribe(
+            np.concatenate(audio_parts),
+            language=key.language,
+            task=key.task,
+            initial_prompt=key.initial_prompt,
+            temperature=key.temperature,
+            word_timestamps=key.word_timestamps,
+            hotwords=key.hotwords,
+            vad_filter=False,
+            clip_timestamps=clip_timestamps,
+            batch_size=self.batching_config.max_batch_size,
+        )
+        results: list[list[Segment]] = [[] for _ in requests]
+        for segment in segments:
+            i = bisect.bisect_right(offsets, segment.start) - 1
+            results[i].append(shift_segment(segment, -offsets[i], len(results[i]) + 1, whisper))
+
+        for i, request in enumerate(requests):
+            request_info = dataclasses.replace(
+                info,
+                language_probability=request.language_probability,
+                duration=request.duration,
+                duration_after_vad=speech_samples[i] / SAMPLES_PER_SECOND,
+                all_language_probs=None,
+            )
+            request.future.set_result((results[i], request_info))
+
+
+def silent_transcription_options(key: BatchKey) -> TranscriptionOptions:
+    """The options `BatchedInferencePipeline.transcribe` would report for a batch decoded with `key` and its defaults."""
+    return TranscriptionOptions(
+        beam_size=5,
+        best_of=5,
+        patience=1,
+        length_penalty=1,
+        repetition_penalty=1,
+        no_repeat_ngram_size=0,
+        log_prob_threshold=-1.0,
+        no_speech_threshold=0.6,
+        compression_ratio_threshold=2.4,
+        condition_on_previous_text=False,
+        prompt_reset_on_temperature=0.5,
+        temperatures=[key.temperature],
+        initial_prompt=key.initial_prompt,
+        prefix=None,
+        suppress_blank=True,
+        suppress_tokens=[-1],
+        without_timestamps=True,
+        max_initial_timestamp=0.0,
+        word_timestamps=key.word_timestamps,
+        prepend_punctuations="\"'“¿([{-",
+        append_punctuations="\"'.。,，!！?？:：”)]}、",  # noqa: RUF001
+        multilingual=False,
+        max_new_tokens=None,
+        clip_timestamps=[],
+        hallucination_silence_threshold=None,
+        hotwords=key.hotwords,
+    )
+
+
+def shift_segment(segment: Segment, seconds: float, segment_id: int, whisper: WhisperModel) -> Segment:
+    """Move the segment (and its words) `seconds` later in time and renumber it."""
+    return dataclasses.replace(
+        segment,
+        id=segment_id,
+        seek=segment.seek + int(seconds * whisper.frames_per_second),
+        start=round(segment.start + seconds, 3),
+        end=round(segment.end + seconds, 3),
+        words=[
+            dataclasses.replace(word, start=round(word.start + seconds, 3), end=round(word.end + seconds, 3))
+            for word in segment.words
+        ]
+        if segment.words is not None
+        else None,
+    )
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import dataclasses
+from itertools import pairwise
+import logging
+import time
+from typing import TYPE_CHECKING
+import weakref
+
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+import numpy as np
+
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.executors.whisper.batching import shift_segment
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Iterator
+
+    from faster_whisper.transcribe import Segment, TranscriptionInfo
+    from numpy.typing import NDArray
+
+    from speaches.config import Priority, WhisperLongFormConfig
+    from speaches.executors.whisper.model_manager import WhisperModelManager
+    from speaches.priority import PriorityScheduler
+
+logger = logging.getLogger(__name__)
+
+type ChunkResult = tuple[list[Segment], TranscriptionInfo]
+
+
+def find_speech(audio: NDArray[np.float32], max_chunk_samples: int) -> list[dict[str, int]]:
+    """The `{"start": ..., "end": ...}` sample ranges of speech, none of them longer than `max_chunk_samples`."""
+    # NOTE: limiting the speech duration guarantees there are cut candidates at least every `max_chunk_samples`
+    vad_options = VadOptions(
+        min_silence_duration_ms=300, max_speech_duration_s=max_chunk_samples / SAMPLES_PER_SECOND, speech_pad_ms=0
+    )
+    return get_speech_timestamps(audio, vad_options)
+
+
+def split_on_silences(
+    audio: NDArray[np.float32], max_chunk_samples: int, speech_chunks: list[dict[str, int]] | None = None
+) -> list[tuple[int, int]]:
+    """Split the audio into contiguous `(start, end)` sample ranges of at most `max_chunk_samples`.
+
+    Ranges are cut in the middle of the silence between two speech segments (`find_speech` is run if `speech_chunks` isn't given). Only when a range contains no silence at all, it's cut at exactly `max_chunk_samples`.
+    """
+    if speech_chunks is None:
+        speech_chunks = find_speech(audio, max_chunk_samples)
+    cuts = [(previous["end"] + current["start"]) // 2 for previous, current in pairwise(speech_chunks)]
+
+    boundaries = [0]
+    previous_cut: int | None = None
+    for cut in [*cuts, len(audio)]:
+        while cut - boundaries[-1] > max_chunk_samples:
+            if previous_cut is not None and previous_cut > boundaries[-1]:
+                boundaries.append(previous_cut)
+            else:
+                boundaries.append(boundaries[-1] + max_chunk_samples)
+        previous_cut = cut
+    if boundaries[-1] != len(audio):
+        boundaries.append(len(audio))
+    return list(pairwise(boundaries))
+
+
+class LongFormTranscriber:
+    """Transcribes long audio by splitting it on silences and transcribing the chunks in parallel.
+
+    Every chunk acquires a model replica through `WhisperModelManager.load_model`, which hands out the least busy one, so chunks of the same request are spread across replicas. Segments are yielded in order as soon as all of the preceding chunks are done. Chunks of bulk requests yield to interactive requests before they start.
+
+    At most `max_parallel_chunks` chunks are transcribed at the same time. It defaults to `num_replicas * num_workers`, which is 1 with the default `WhisperConfig`, so there's no speed-up unless either of them is raised.
+    """
+
+    def __init__(
+        self,
+        model_manager: WhisperModelManager,
+        long_form_config: WhisperLongFormConfig,
+        priority_scheduler: PriorityScheduler,
+    ) -> None:
+        self.model_manager = model_manager
+        self.long_form_config = long_form_config
+        self.priority_scheduler = priority_scheduler
+        whisper_config = model_manager.whisper_config
+        self._executor = ThreadPoolExecutor(
+            max_workers=long_form_config.max_parallel_chunks
+            or whisper_config.num_replicas * whisper_config.num_workers,
+            thread_name_prefix="whisper-long-form",
+        )
+
+    def _detect_language(self, model_id: str, audio: NDArray[np.float32]) -> str:
+        """Detect the language of a single chunk, as `detect_language` only looks at the first 30s of speech anyway."""
+        with self.model_manager.load_model(model_id) as whisper:
+            if not whisper.model.is_multilingual:
+                return "en"
+            language, language_probability, _ = whisper.detect_language(audio, vad_filter=True)
+            logger.debug(f"Detected language {language} ({language_probability:.2f}) for long-form transcription")
+            return language
+
+    def _transcribe_chunk(
+        self,
+        model_id: str,
+        audio: NDArray[np.float32],
+        start: int,
+        end: int,
+        priority: Priority,
+        audio_offset: int = 0,
+        **kwargs: object,
+    ) -> ChunkResult:
+        """`audio_offset` is the position (in samples) of `audio` itself, for audio that's only kept partially."""
+        if priority == "bulk":
+            self.priority_scheduler.yield_to_interactive()
+        with self.model_manager.load_model(model_id) as whisper:
+            segments, info = whisper.transcribe(audio[start:end], **kwargs)  # pyright: ignore[reportArgumentType]
+            offset = (audio_offset + start) / SAMPLES_PER_SECOND
+            return [shift_segment(segment, offset, segment.id, whisper) for segment in segments], info
+
+    def transcribe(
+        self,
+        model_id: str,
+        audio: NDArray[np.float32],
+        *,
+        task: str = "transcribe",
+        language: str | None = None,
+        initial_prompt: str | None = None,
+        temperature: float = 0.0,
+        word_timestamps: bool = False,
+        hotwords: str | None = None,
+        vad_filter: bool = False,
+        priority: Priority = "interactive",
+    ) -> tuple[Generator[Segment], TranscriptionInfo]:
+        """Same as `WhisperModel.transcribe`, but the segments are produced by multiple chunks decoded in parallel. Blocks until the first chunk is done."""
+        start = time.perf_counter()
+        max_chunk_samples = int(self.long_form_config.chunk_seconds * SAMPLES_PER_SECOND)
+        speech_chunks = find_speech(audio, max_chunk_samples)
+        chunks = split_on_silences(audio, max_chunk_samples, speech_chunks)
+        logger.info(
+            f"Transcribing {len(audio) / SAMPLES_PER_SECOND:.2f}s of audio as {len(chunks)} chunks (split in {time.perf_counter() - start:.2f}s)"
+        )
+        # NOTE: every chunk must be decoded in the same language, so it's detected once instead of per chunk
+        if language is None:
+            # the chunk with the first speech in it, rather than the whole audio which would be run through the VAD again
+            first_speech = speech_chunks[0]["start"] if len(speech_chunks) > 0 else 0
+            speech_start, speech_end = next((start, end) for start, end in chunks if first_speech < end)
+            language = self._detect_language(model_id, audio[speech_start:speech_end])
+
+        futures: list[Future[ChunkResult]] = [
+            self._executor.submit(
+                self._transcribe_chunk,
+                model_id,
+                audio,
+                chunk_start,
+                chunk_end,
+                priority,
+                task=task,
+                language=language,
+                initial_prompt=initial_prompt,
+                temperature=temperature,
+                word_timestamps=word_timestamps,
+                hotwords=hotwords,
+                vad_filter=vad_filter,
+            )
+            for chunk_start, chunk_end in chunks
+        ]
+        try:
+            _, first_info = futures[0].result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        # NOTE: `duration_after_vad` is summed up as the chunks finish, it's only final once all of the segments have been consumed
+        transcription_info = dataclasses.replace(first_info, duration=len(audio) / SAMPLES_PER_SECOND)
+
+        def cancel_pending() -> None:
+            for future in futures:
+                future.cancel()
+
+        def segments() -> Generator[Segment]:
+            segment_id = 1
+            try:
+                for index, future in enumerate(futures):
+                    chunk_segments, chunk_info = future.result()
+                    if index > 0:
+                        transcription_info.duration_after_vad += chunk_info.duration_after_vad
+                    for segment in chunk_segments:
+                        yield dataclasses.replace(segment, id=segment_id)
+                        segment_id += 1
+                logger.info(
+                    f"Transcribed {len(audio) / SAMPLES_PER_SECOND:.2f}s of audio in {time.perf_counter() - start:.2f}s"
+                )
+            finally:
+                # the client went away (or a chunk failed), don't decode the rest
+                cancel_pending()
+
+        segments_generator = segments()
+        # NOTE: the `finally` above only runs if the generator was started. One that's dropped before that (i.e. the request failed before streaming the response) cancels the chunks once it's garbage collected
+        weakref.finalize(segments_generator, cancel_pending)
+        return segments_generator, transcription_info
+
+    def transcribe_stream(
+        self,
+        model_id: str,
+        chunks: Iterator[NDArray[np.int16]],
+        *,
+        task: str = "transcribe",
+        language: str | None = None,
+        initial_prompt: str | None = None,
+        temperature: float = 0.0,
+        word_timestamps: bool = False,
+        hotwords: str | None = None,
+        vad_filter: bool = False,
+        priority: Priority = "interactive",
+    ) -> Generator[Segment]:
+        """Transcribe audio that's still being decoded (i.e. an upload that's still being received), one chunk of at most `chunk_seconds` at a time.
+
+        A chunk is transcribed as soon as enough audio arrived to cut it at a silence (see `split_on_silences`), so transcription starts long before the audio is complete. Only the audio that hasn't been transcribed yet is kept. `chunks` (PCM 16-bit, i.e. from `decode_audio_chunks`) is closed when the generator is.
+        """
+        max_chunk_samples = int(self.long_form_config.chunk_seconds * SAMPLES_PER_SECOND)
+        kwargs = {
+            "task": task,
+            "initial_prompt": initial_prompt,
+            "temperature": temperature,
+            "word_timestamps": word_timestamps,
+            "hotwords": hotwords,
+            "vad_filter": vad_filter,
+        }
+        pending = np.empty(0, dtype=np.float32)
+        # position of `pending` in the whole audio
+        offset = 0
+        segment_id = 1
+
+        def transcribe_pending(end: int) -> Generator[Segment]:
+            nonlocal language, segment_id
+            if language is None:
+                # NOTE: like in `transcribe`, every chunk is decoded in the language detected on the first one
+                language = self._detect_language(model_id, pending[:end])
+            future = self._executor.submit(
+                self._transcribe_chunk, model_id, pending, 0, end, priority, offset, language=language, **kwargs
+            )
+            chunk_segments, _ = future.result()
+            for segment in chunk_segments:
+                yield dataclasses.replace(segment, id=segment_id)
+                segment_id += 1
+
+        try:
+            for chunk in chunks:
+                pending = np.concatenate((pending, chunk.astype(np.float32) / 32768.0))
+                while len(pending) > max_chunk_samples:
+                    (_, end), *_ = split_on_silences(pending, max_chunk_samples)
+                    yield from transcribe_pending(end)
+                    pending = pending[end:]
+                    offset += end
+            if len(pending) > 0:
+                yield from transcribe_pending(len(pending))
+            logger.info(f"Transcribed {(offset + len(pending)) / SAMPLES_PER_SECOND:.2f}s of streamed audio")
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
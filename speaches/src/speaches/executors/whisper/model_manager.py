@@ -1,15 +1,21 @@
 from __future__ import annotations
 
 from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 import logging
+import os
 import threading
 from typing import TYPE_CHECKING
 
 from faster_whisper import WhisperModel
 
-from speaches.model_manager import SelfDisposingModel
+from speaches.executors.whisper.prompt_cache import CachingTokenizer, PromptTokenCache
+from speaches.model_manager import ModelMemoryBudget, SelfDisposingModel, estimate_model_size
 
 if TYPE_CHECKING:
+    from collections.abc import Generator
+
     from speaches.config import (
         WhisperConfig,
     )
@@ -17,46 +23,112 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
-# TODO: enable concurrent model downloads
+@contextmanager
+def cpu_affinity(cpus: set[int] | None) -> Generator[None]:
+    """Temporarily pin the calling thread to `cpus`. Threads created in the meantime (i.e. the CTranslate2 workers) inherit the affinity."""
+    if cpus is None or not hasattr(os, "sched_setaffinity"):
+        yield
+        return
+    previous_cpus = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, cpus)
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, previous_cpus)
 
 
 class WhisperModelManager:
-    def __init__(self, whisper_config: WhisperConfig) -> None:
+    def __init__(self, whisper_config: WhisperConfig, memory_budget: ModelMemoryBudget | None = None) -> None:
         self.whisper_config = whisper_config
-        self.loaded_models: OrderedDict[str, SelfDisposingModel[WhisperModel]] = OrderedDict()
+        self.memory_budget = memory_budget
+        self.loaded_models: OrderedDict[str, list[SelfDisposingModel[WhisperModel]]] = OrderedDict()
+        # NOTE: `_lock` only guards `loaded_models` and `_pending_models`, it's never held while downloading or loading a model
         self._lock = threading.Lock()
-
-    def _load_fn(self, model_id: str) -> WhisperModel:
-        return WhisperModel(
-            model_id,
-            device=self.whisper_config.inference_device,
-            device_index=self.whisper_config.device_index,
-            compute_type=self.whisper_config.compute_type,
-            cpu_threads=self.whisper_config.cpu_threads,
-            num_workers=self.whisper_config.num_workers,
+        self._pending_models: dict[str, Future[None]] = {}
+        # NOTE: kept when a model is unloaded, so a reloaded model starts out with its (small) cache warm
+        self._prompt_token_caches: dict[str, PromptTokenCache] = {}
+        self._load_executor = ThreadPoolExecutor(
+            max_workers=whisper_config.max_concurrent_loads, thread_name_prefix="whisper-model-loader"
         )
 
+    def _replica_cpus(self, replica_index: int) -> set[int] | None:
+        if not self.whisper_config.pin_replicas_to_cpus or not hasattr(os, "sched_getaffinity"):
+            return None
+        available_cpus = sorted(os.sched_getaffinity(0))
+        cpus_per_replica = max(1, len(available_cpus) // self.whisper_config.num_replicas)
+        cpus = set(available_cpus[replica_index * cpus_per_replica : (replica_index + 1) * cpus_per_replica])
+        return cpus or None
+
+    def _replica_cpu_threads(self) -> int:
+        if self.whisper_config.cpu_threads != 0 or self.whisper_config.num_replicas == 1:
+            return self.whisper_config.cpu_threads
+        # NOTE: `os.cpu_count` ignores the CPU affinity (i.e. `taskset` or the cgroup's cpuset of a container)
+        num_cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+        return max(1, num_cpus // self.whisper_config.num_replicas)
+
+    def _load_fn(self, model_id: str, replica_index: int = 0) -> WhisperModel:
+        with cpu_affinity(self._replica_cpus(replica_index)):
+            whisper = WhisperModel(
+                model_id,
+                device=self.whisper_config.inference_device,
+                device_index=self.whisper_config.device_index,
+                compute_type=self.whisper_config.compute_type,
+                cpu_threads=self._replica_cpu_threads(),
+                num_workers=self.whisper_config.num_workers,
+            )
+        if self.whisper_config.prompt_token_cache_size > 0:
+            with self._lock:
+                prompt_token_cache = self._prompt_token_caches.setdefault(
+                    model_id, PromptTokenCache(self.whisper_config.prompt_token_cache_size)
+                )
+            whisper.hf_tokenizer = CachingTokenizer(whisper.hf_tokenizer, prompt_token_cache)
+        return whisper
+
+    def _size_fn(self, model_id: str) -> int:
+        from speaches.executors.whisper.utils import model_registry
+
+        return estimate_model_size([model_registry.get_model_files(model_id).model])
+
     def _handle_model_unloaded(self, model_id: str) -> None:
         with self._lock:
-            if model_id in self.loaded_models:
+            replicas = self.loaded_models.get(model_id)
+            # NOTE: the model stays registered as long as at least one of its replicas is loaded
+            if replicas is not None and all(replica.model is None for replica in replicas):
                 del self.loaded_models[model_id]
 
     def unload_model(self, model_id: str) -> None:
         with self._lock:
-            model = self.loaded_models.get(model_id)
-            if model is None:
+            replicas = self.loaded_models.get(model_id)
+            if replicas is None:
                 raise KeyError(f"Model {model_id} not found")
-            # WARN: ~300 MB of memory will still be held by the model. See https://github.com/SYSTRAN/faster-whisper/issues/992
-            self.loaded_models[model_id].unload()
+            replicas = list(replicas)
+        # WARN: ~300 MB of memory will still be held by the model. See https://github.com/SYSTRAN/faster-whisper/issues/992
+        for replica in replicas:
+            if replica.model is not None:
+                replica.unload()
 
-    def load_model(self, model_id: str) -> SelfDisposingModel[WhisperModel]:
-        logger.debug(f"Loading model {model_id}")
+    def replica_stats(self) -> dict[str, list[dict[str, int | bool]]]:
+        """Per-replica load state and queue depth (number of requests currently holding the replica)."""
         with self._lock:
-            logger.debug("Acquired lock")
-            if model_id in self.loaded_models:
-                logger.debug(f"{model_id} model already loaded")
-                return self.loaded_models[model_id]
-            
+            return {
+                model_id: [
+                    {"index": i, "loaded": replica.model is not None, "ref_count": replica.ref_count}
+                    for i, replica in enumerate(replicas)
+                ]
+                for model_id, replicas in self.loaded_models.items()
+            }
+
+    @staticmethod
+    def _select_replica(replicas: list[SelfDisposingModel[WhisperModel]]) -> SelfDisposingModel[WhisperModel]:
+        # least busy first, then prefer an already loaded replica over loading a new one
+        replica = min(replicas, key=lambda replica: (replica.ref_count, replica.model is None))
+        # NOTE: reserved while `_lock` is still held, otherwise concurrent callers would all pick the same replica
+        replica.reserve()
+        return replica
+
+    def _prepare_model(self, model_id: str) -> None:
+        """Download the model files (if needed) and register the model's replicas. Runs on `_load_executor`."""
+        try:
             # 检查模型是否存在，如果不存在则自动下载
             try:
                 from speaches.executors.whisper.utils import model_registry
@@ -78,11 +150,36 @@ class WhisperModelManager:
             except Exception as e:
                 logger.error(f"Model preparation failed for {model_id}: {e}")
                 raise e
-                
-            self.loaded_models[model_id] = SelfDisposingModel[WhisperModel](
-                model_id,
-                load_fn=lambda: self._load_fn(model_id),
-                ttl=self.whisper_config.ttl,
-                model_unloaded_callback=self._handle_model_unloaded,
-            )
-            return self.loaded_models[model_id]
+
+            replicas = [
+                SelfDisposingModel[WhisperModel](
+                    model_id,
+                    load_fn=lambda replica_index=replica_index: self._load_fn(model_id, replica_index),
+                    ttl=self.whisper_config.ttl,
+                    model_unloaded_callback=self._handle_model_unloaded,
+                    size_fn=lambda: self._size_fn(model_id),
+                    memory_budget=self.memory_budget,
+                    load_executor=self._load_executor,
+                )
+                for replica_index in range(self.whisper_config.num_replicas)
+            ]
+            with self._lock:
+                self.loaded_models[model_id] = replicas
+        finally:
+            with self._lock:
+                del self._pending_models[model_id]
+
+    def load_model(self, model_id: str) -> SelfDisposingModel[WhisperModel]:
+        """The least busy replica of the model. It's reserved for the caller, who has to enter it right away."""
+        logger.debug(f"Loading model {model_id}")
+        while True:
+            with self._lock:
+                if model_id in self.loaded_models:
+                    logger.debug(f"{model_id} model already loaded")
+                    return self._select_replica(self.loaded_models[model_id])
+                future = self._pending_models.get(model_id)
+                if future is None:
+                    # concurrent callers for the same model wait on this future instead of preparing the model again
+                    future = self._load_executor.submit(self._prepare_model, model_id)
+                    self._pending_models[model_id] = future
+            future.result()
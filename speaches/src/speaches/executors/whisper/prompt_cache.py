@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, Any
+
+from cachetools import LRUCache
+from faster_whisper.tokenizer import Tokenizer
+
+from speaches.metrics import metrics
+
+if TYPE_CHECKING:
+    import tokenizers
+
+hits = metrics.counter("whisper_prompt_token_cache_hits", "Prompt/hotword tokenizations served from the cache.")
+misses = metrics.counter("whisper_prompt_token_cache_misses", "Prompt/hotword tokenizations that had to be encoded.")
+non_speech_encodes = metrics.counter(
+    "whisper_non_speech_token_encodes",
+    "Tokenizations of the symbols that are suppressed by default. They're cached apart from the prompts and hotwords.",
+)
+
+
+class _RecordingTokenizer:
+    def __init__(self) -> None:
+        self.sequences: set[str] = set()
+
+    def encode(self, text: str) -> list[int]:
+        self.sequences.add(text)
+        return [0]
+
+
+def _non_speech_sequences() -> frozenset[str]:
+    """The texts `faster_whisper.tokenizer.Tokenizer.non_speech_tokens` encodes. It's computed for every request (the `Tokenizer` is created per request) when `suppress_tokens` contains -1, which is the default."""
+    recorder = _RecordingTokenizer()
+    Tokenizer.non_speech_tokens.func(recorder)  # pyright: ignore[reportArgumentType]
+    return frozenset(recorder.sequences)
+
+
+NON_SPEECH_SEQUENCES = _non_speech_sequences()
+
+
+class PromptTokenCache:
+    """Tokenized prompts and hotwords of a single model, shared by all of its replicas.
+
+    The non-speech symbols (see `NON_SPEECH_SEQUENCES`) are kept in a separate, unbounded (as there's a fixed number of them) cache, so that they neither evict the prompts and hotwords nor count towards their hits.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self._encodings: LRUCache[tuple[str, bool], tokenizers.Encoding] = LRUCache(maxsize=max_entries)
+        self._non_speech_encodings: dict[tuple[str, bool], tokenizers.Encoding] = {}
+        self._lock = threading.Lock()
+
+    def encode(self, tokenizer: tokenizers.Tokenizer, text: str, add_special_tokens: bool) -> tokenizers.Encoding:
+        key = (text, add_special_tokens)
+        if text in NON_SPEECH_SEQUENCES:
+            non_speech_encodes.inc()
+            encoding = self._non_speech_encodings.get(key)
+            if encoding is None:
+                encoding = self._non_speech_encodings.setdefault(
+                    key, tokenizer.encode(text, add_special_tokens=add_special_tokens)
+                )
+            return encoding
+        with self._lock:
+            encoding = self._encodings.get(key)
+        if encoding is not None:
+            hits.inc()
+            return encoding
+        misses.inc()
+        encoding = tokenizer.encode(text, add_special_tokens=add_special_tokens)
+        with self._lock:
+            self._encodings[key] = encoding
+        return encoding
+
+
+class CachingTokenizer:
+    """Stands in for a `WhisperModel.hf_tokenizer` and memoizes `encode`.
+
+    `faster_whisper` tokenizes the `initial_prompt` on every request and the `hotwords` for every 30 second window, while clients send the same ones on almost every request. It also tokenizes ~100 non-speech symbols on every request to suppress them.
+    """
+
+    def __init__(self, tokenizer: tokenizers.Tokenizer, cache: PromptTokenCache) -> None:
+        self._tokenizer = tokenizer
+        self._cache = cache
+
+    def encode(self, sequence: Any, *args: Any, add_special_tokens: bool = True, **kwargs: Any) -> tokenizers.Encoding:  # noqa: ANN401
+        if not isinstance(sequence, str) or len(args) > 0 or len(kwargs) > 0:
+            return self._tokenizer.encode(sequence, *args, add_special_tokens=add_special_tokens, **kwargs)
+        return self._cache.encode(self._tokenizer, sequence, add_special_tokens)
+
+    def __getattr__(self, name: str) -> Any:  # noqa: ANN401
+        return getattr(self._tokenizer, name)
@@ -7,10 +7,9 @@ from pydantic import BaseModel
 
 from speaches.api_types import Model
 from speaches.hf_utils import (
+    CachedModelRepo,
     HfModelFilter,
     extract_language_list,
-    get_cached_model_repos_info,
-    get_model_card_data_from_cached_repo_info,
     list_model_files,
 )
 from speaches.model_registry import ModelRegistry
@@ -46,20 +45,15 @@ class WhisperModelRegistry(ModelRegistry[Model, WhisperModelFiles]):
                 task=TASK_NAME_TAG,
             )
 
-    def list_local_models(self) -> Generator[Model, None, None]:
-        cached_model_repos_info = get_cached_model_repos_info()
-        for cached_repo_info in cached_model_repos_info:
-            model_card_data = get_model_card_data_from_cached_repo_info(cached_repo_info)
-            if model_card_data is None:
-                continue
-            if self.hf_model_filter.passes_filter(model_card_data):
-                yield Model(
-                    id=cached_repo_info.repo_id,
-                    created=int(cached_repo_info.last_modified),
-                    owned_by=cached_repo_info.repo_id.split("/")[0],
-                    language=extract_language_list(model_card_data),
-                    task=TASK_NAME_TAG,
-                )
+    def _model_from_cached_repo(self, model_id: str, cached_repo: CachedModelRepo) -> Model:
+        assert cached_repo.model_card_data is not None
+        return Model(
+            id=model_id,
+            created=int(cached_repo.last_modified),
+            owned_by=model_id.split("/")[0],
+            language=extract_language_list(cached_repo.model_card_data),
+            task=TASK_NAME_TAG,
+        )
 
     def get_model_files(self, model_id: str) -> WhisperModelFiles:
         model_files = list(list_model_files(model_id))
@@ -1,7 +1,10 @@
 from collections.abc import Generator
+from dataclasses import dataclass
+from functools import lru_cache
 import logging
 from pathlib import Path
 import shutil
+import threading
 import time
 from typing import TypedDict
 
@@ -120,7 +123,7 @@ def model_id_from_path(repo_path: Path) -> str:
     return repo_id
 
 
-def get_model_repo_path(model_id: str, *, cache_dir: str | Path | None = None) -> Path | None:
+def _validate_cache_dir(cache_dir: str | Path | None) -> Path:
     if cache_dir is None:
         cache_dir = HF_HUB_CACHE
 
@@ -135,32 +138,167 @@ def get_model_repo_path(model_id: str, *, cache_dir: str | Path | None = None) -
         raise ValueError(
             f"Scan cache expects a directory but found a file: {cache_dir}. Please use `cache_dir` argument or set `HF_HUB_CACHE` environment variable."
         )
+    return cache_dir
+
+
+def _mtime(path: Path) -> float | None:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+@dataclass
+class CachedModelRepo:
+    repo_path: Path
+    files: list[Path]
+    model_card_data: huggingface_hub.ModelCardData | None
+    last_modified: float
+    fingerprint: tuple[float | None, ...]
+
+
+class HfCacheIndex:
+    """In-memory index of the model repositories in a Hugging Face cache directory.
+
+    Maps model ids to their repository path, snapshot files and parsed model card. An entry is reused as long as the modification times of the repository's `snapshots/` (and each snapshot) directories and of `refs/main` are unchanged, so a lookup costs a few `stat` calls instead of a directory walk. Entries are also explicitly invalidated when a model is downloaded or deleted through speaches.
+    """
+
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = cache_dir
+        self._repo_paths: dict[str, Path] = {}
+        self._repo_paths_mtime: float | None = None
+        self._repos: dict[str, CachedModelRepo] = {}
+        self._lock = threading.Lock()
+
+    def _scan_repo_paths(self) -> dict[str, Path]:
+        repo_paths: dict[str, Path] = {}
+        for repo_path in self.cache_dir.iterdir():
+            if not repo_path.is_dir():
+                continue
+            if repo_path.name == ".locks":  # skip './.locks/' folder
+                continue
+            if "--" not in repo_path.name:  # cache might contain unrelated custom files
+                continue
+            repo_type, repo_id = repo_path.name.split("--", maxsplit=1)
+            repo_type = repo_type[:-1]  # "models" -> "model"
+            repo_id = repo_id.replace("--", "/")  # google--fleurs -> "google/fleurs"
+            if repo_type != "model":
+                continue
+            repo_paths[repo_id] = repo_path
+        return repo_paths
+
+    def _refresh_repo_paths(self) -> None:
+        # NOTE: adding or removing a repository changes the modification time of the cache directory
+        mtime = _mtime(self.cache_dir)
+        if mtime != self._repo_paths_mtime:
+            self._repo_paths = self._scan_repo_paths()
+            self._repo_paths_mtime = mtime
+
+    def get_repo_path(self, model_id: str) -> Path | None:
+        with self._lock:
+            self._refresh_repo_paths()
+            return self._repo_paths.get(model_id)
+
+    def list_model_ids(self) -> list[str]:
+        with self._lock:
+            self._refresh_repo_paths()
+            return list(self._repo_paths)
+
+    @staticmethod
+    def _fingerprint(repo_path: Path) -> tuple[float | None, ...]:
+        snapshots_path = repo_path / "snapshots"
+        snapshot_paths = sorted(snapshots_path.iterdir()) if snapshots_path.is_dir() else []
+        return (
+            _mtime(snapshots_path),
+            _mtime(repo_path / "refs" / "main"),
+            *(_mtime(snapshot_path) for snapshot_path in snapshot_paths),
+        )
+
+    @staticmethod
+    def _load_model_card_data(repo_path: Path, files: list[Path]) -> huggingface_hub.ModelCardData | None:
+        readme_file_paths = [
+            file for file in files if file.name == "README.md" and file.parent.parent.name == "snapshots"
+        ]
+        if len(readme_file_paths) == 0:
+            return None
+        # same revision selection as `get_model_card_data_from_cached_repo_info`: the only one, or the one `main` points to
+        if len(readme_file_paths) > 1:
+            main_ref_path = repo_path / "refs" / "main"
+            if not main_ref_path.exists():
+                return None
+            main_commit_hash = main_ref_path.read_text().strip()
+            readme_file_paths = [file for file in readme_file_paths if file.parent.name == main_commit_hash]
+            if len(readme_file_paths) == 0:
+                return None
+        return load_repo_model_card_data(readme_file_paths[0])
+
+    def get(self, model_id: str) -> CachedModelRepo | None:
+        repo_path = self.get_repo_path(model_id)
+        if repo_path is None:
+            return None
+        fingerprint = self._fingerprint(repo_path)
+        with self._lock:
+            cached_repo = self._repos.get(model_id)
+            if (
+                cached_repo is not None
+                and cached_repo.repo_path == repo_path
+                and cached_repo.fingerprint == fingerprint
+            ):
+                return cached_repo
+        snapshots_path = repo_path / "snapshots"
+        files = list(snapshots_path.glob("**/*")) if snapshots_path.exists() else []
+        cached_repo = CachedModelRepo(
+            repo_path=repo_path,
+            files=files,
+            model_card_data=self._load_model_card_data(repo_path, files),
+            # NOTE: same as `CachedRepoInfo.last_modified`, the snapshot files are symlinks to the blobs
+            last_modified=max((file.stat().st_mtime for file in files if file.is_file()), default=0.0),
+            fingerprint=fingerprint,
+        )
+        with self._lock:
+            self._repos[model_id] = cached_repo
+        return cached_repo
+
+    def invalidate(self, model_id: str | None = None) -> None:
+        with self._lock:
+            self._repo_paths_mtime = None
+            if model_id is None:
+                self._repos.clear()
+            else:
+                self._repos.pop(model_id, None)
 
-    for repo_path in cache_dir.iterdir():
-        if not repo_path.is_dir():
-            continue
-        if repo_path.name == ".locks":  # skip './.locks/' folder
-            continue
-        if "--" not in repo_path.name:  # cache might contain unrelated custom files
-            continue
-        repo_type, repo_id = repo_path.name.split("--", maxsplit=1)
-        repo_type = repo_type[:-1]  # "models" -> "model"
-        repo_id = repo_id.replace("--", "/")  # google--fleurs -> "google/fleurs"
-        if repo_type != "model":
-            continue
-        if model_id == repo_id:
-            return repo_path
 
-    return None
+@lru_cache
+def _get_hf_cache_index(cache_dir: Path) -> HfCacheIndex:
+    return HfCacheIndex(cache_dir)
+
+
+def get_hf_cache_index(cache_dir: str | Path | None = None) -> HfCacheIndex:
+    return _get_hf_cache_index(_validate_cache_dir(cache_dir))
+
+
+def get_model_repo_path(model_id: str, *, cache_dir: str | Path | None = None) -> Path | None:
+    return get_hf_cache_index(cache_dir).get_repo_path(model_id)
+
+
+def get_model_card_data(model_id: str, *, cache_dir: str | Path | None = None) -> huggingface_hub.ModelCardData | None:
+    """Model card of a locally cached model. Returns `None` if the model isn't cached or doesn't have a model card."""
+    cached_repo = get_hf_cache_index(cache_dir).get(model_id)
+    if cached_repo is None:
+        return None
+    return cached_repo.model_card_data
 
 
 def list_model_files(
     model_id: str, glob_pattern: str = "**/*", *, cache_dir: str | Path | None = None
 ) -> Generator[Path, None, None]:
-    repo_path = get_model_repo_path(model_id, cache_dir=cache_dir)
-    if repo_path is None:
+    cached_repo = get_hf_cache_index(cache_dir).get(model_id)
+    if cached_repo is None:
+        return None
+    if glob_pattern == "**/*":
+        yield from list(cached_repo.files)
         return None
-    snapshots_path = repo_path / "snapshots"
+    snapshots_path = cached_repo.repo_path / "snapshots"
     if not snapshots_path.exists():
         return None
     yield from list(snapshots_path.glob(glob_pattern))
@@ -173,4 +311,5 @@ def delete_local_model_repo(model_id: str) -> None:
     logger.debug(f"Deleting model repo: {model_repo_path}")
     start = time.perf_counter()
     shutil.rmtree(model_repo_path)
+    get_hf_cache_index().invalidate(model_id)
     logger.info(f"Deleted '{model_repo_path}' in {time.perf_counter() - start:.2f} seconds")
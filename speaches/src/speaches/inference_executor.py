@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import functools
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from speaches.metrics import metrics
+from speaches.priority import PRIORITY_RANKS
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Generator
+
+    from speaches.config import Priority
+
+logger = logging.getLogger(__name__)
+
+queue_depth = metrics.gauge("inference_queue_depth", "Tasks waiting for an inference worker.")
+queue_wait_seconds = metrics.summary(
+    "inference_queue_wait_seconds", "Time tasks spent waiting for an inference worker."
+)
+run_seconds = metrics.summary("inference_run_seconds", "Time inference workers spent running tasks.")
+
+
+class InferenceExecutor(ThreadPoolExecutor):
+    """A dedicated thread pool for audio decoding and inference.
+
+    Keeps the heavy work off of Starlette's shared threadpool, which would otherwise get exhausted under bursts and starve cheap sync endpoints like `/health`. At most `max_workers` tasks run at a time, the others wait in a queue where interactive tasks go ahead of bulk ones. The time they spend there is exposed through `GET /api/metrics`.
+
+    A task that pauses (a bulk request yielding to interactive ones, see `paused`) gives up its slot for as long as it's paused, so the queued tasks don't wait behind it.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        # NOTE: the threads beyond `max_workers` only run tasks while others are paused
+        super().__init__(max_workers=2 * max_workers, thread_name_prefix="inference")
+        self.max_workers = max_workers
+        self._active = 0
+        self._queue: list[tuple[int, int, float, Callable[[], object], Future[object]]] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def submit[**P, T](self, fn: Callable[P, T], /, *args: P.args, **kwargs: P.kwargs) -> Future[T]:  # pyright: ignore[reportIncompatibleMethodOverride]
+        return self.submit_with_priority("interactive", fn, *args, **kwargs)
+
+    def submit_with_priority[**P, T](
+        self, priority: Priority, fn: Callable[P, T], /, *args: P.args, **kwargs: P.kwargs
+    ) -> Future[T]:
+        future: Future[T] = Future()
+        queue_depth.inc()
+        with self._lock:
+            heapq.heappush(
+                self._queue,
+                (
+                    PRIORITY_RANKS[priority],
+                    next(self._counter),
+                    time.perf_counter(),
+                    functools.partial(fn, *args, **kwargs),
+                    future,  # pyright: ignore[reportArgumentType]
+                ),
+            )
+        self._dispatch()
+        return future
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._lock:
+                if self._active >= self.max_workers or len(self._queue) == 0:
+                    return
+                _, _, submitted_at, fn, future = heapq.heappop(self._queue)
+                queue_depth.dec()
+                # NOTE: a task that got cancelled while queued never runs
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._active += 1
+            super().submit(self._run, submitted_at, fn, future)
+
+    def _run(self, submitted_at: float, fn: Callable[[], object], future: Future[object]) -> None:
+        started_at = time.perf_counter()
+        queue_wait_seconds.observe(started_at - submitted_at)
+        self._local.holds_slot = True
+        try:
+            result = fn()
+        except BaseException as e:  # noqa: BLE001
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            run_seconds.observe(time.perf_counter() - started_at)
+            if self._local.holds_slot:
+                self._local.holds_slot = False
+                self._release_slot()
+
+    def _release_slot(self) -> None:
+        with self._lock:
+            self._active -= 1
+        self._dispatch()
+
+    @contextmanager
+    def paused(self) -> Generator[None]:
+        """Give up the calling task's slot for the duration of the block. Does nothing when not called from one of this executor's tasks."""
+        if not getattr(self._local, "holds_slot", False):
+            yield
+            return
+        self._local.holds_slot = False
+        self._release_slot()
+        try:
+            yield
+        finally:
+            # NOTE: the slot is taken back right away (even if that's one more than `max_workers`), so that a resumed task doesn't queue again behind the ones that ran while it was paused
+            with self._lock:
+                self._active += 1
+            self._local.holds_slot = True
+
+    async def run[**P, T](self, fn: Callable[P, T], /, *args: P.args, **kwargs: P.kwargs) -> T:
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def run_with_priority[**P, T](
+        self, priority: Priority, fn: Callable[P, T], /, *args: P.args, **kwargs: P.kwargs
+    ) -> T:
+        return await asyncio.wrap_future(self.submit_with_priority(priority, fn, *args, **kwargs))
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+from contextlib import asynccontextmanager
 import logging
+from typing import TYPE_CHECKING
 import uuid
 
 from fastapi import (
@@ -11,11 +13,17 @@ from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.responses import RedirectResponse
 
-from speaches.dependencies import ApiKeyDependency, get_config
+from speaches.dependencies import ApiKeyDependency, get_batch_job_runner, get_config, get_model_preloader
 from speaches.logger import setup_logger
+from speaches.routers.batches import (
+    router as batches_router,
+)
 from speaches.routers.chat import (
     router as chat_router,
 )
+from speaches.routers.dictation import (
+    router as dictation_router,
+)
 from speaches.routers.misc import (
     router as misc_router,
 )
@@ -39,6 +47,9 @@ from speaches.routers.vad import (
 )
 from speaches.utils import APIProxyError
 
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator
+
 # https://swagger.io/docs/specification/v3_0/grouping-operations-with-tags/
 # https://fastapi.tiangolo.com/tutorial/metadata/#metadata-for-tags
 TAGS_METADATA = [
@@ -54,8 +65,17 @@ TAGS_METADATA = [
 ]
 
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncGenerator[None]:
+    # NOTE: preloading runs in the background so that `/health` can report that the server is still warming up
+    get_model_preloader().start()
+    if get_config().batch_jobs.enabled:
+        get_batch_job_runner().start()
+    yield
+
+
 def create_app() -> FastAPI:
-    
+
     config = get_config()
     setup_logger("INFO")
     logger = logging.getLogger(__name__)
@@ -65,7 +85,7 @@ def create_app() -> FastAPI:
     if config.api_key is not None:
         dependencies.append(ApiKeyDependency)
 
-    app = FastAPI(dependencies=dependencies, openapi_tags=TAGS_METADATA)
+    app = FastAPI(dependencies=dependencies, openapi_tags=TAGS_METADATA, lifespan=lifespan)
 
     # Register global exception handler for APIProxyError
     @app.exception_handler(APIProxyError)
@@ -87,6 +107,8 @@ def create_app() -> FastAPI:
 
     app.include_router(chat_router)
     app.include_router(stt_router)
+    app.include_router(dictation_router)
+    app.include_router(batches_router)
     app.include_router(models_router)
     app.include_router(misc_router)
     app.include_router(realtime_rtc_router)
@@ -122,8 +144,6 @@ def create_app() -> FastAPI:
     return app
 
 
-
 # 延迟创建应用实例
 def get_app():
     return create_app()
-
@@ -0,0 +1,91 @@
+import threading
+
+
+class Counter:
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+
+class Summary:
+    """Count, sum and maximum of the observed values, i.e. latencies."""
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def values(self) -> dict[str, int | float]:
+        with self._lock:
+            return {f"{self.name}_count": self.count, f"{self.name}_sum": self.sum, f"{self.name}_max": self.max}
+
+
+class MetricsRegistry:
+    """Process-wide, in-memory metrics. Exposed as JSON through `GET /api/metrics`."""
+
+    def __init__(self) -> None:
+        self._counters: dict[str, Counter] = {}
+        self._gauges: dict[str, Gauge] = {}
+        self._summaries: dict[str, Summary] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        """Get the counter with the given name, creating it on first use."""
+        with self._lock:
+            if name not in self._counters:
+                self._counters[name] = Counter(name, description)
+            return self._counters[name]
+
+    def gauge(self, name: str, description: str = "") -> Gauge:
+        with self._lock:
+            if name not in self._gauges:
+                self._gauges[name] = Gauge(name, description)
+            return self._gauges[name]
+
+    def summary(self, name: str, description: str = "") -> Summary:
+        with self._lock:
+            if name not in self._summaries:
+                self._summaries[name] = Summary(name, description)
+            return self._summaries[name]
+
+    def snapshot(self) -> dict[str, int | float]:
+        with self._lock:
+            snapshot: dict[str, int | float] = {name: counter.value for name, counter in self._counters.items()}
+            snapshot.update({name: gauge.value for name, gauge in self._gauges.items()})
+            for summary in self._summaries.values():
+                snapshot.update(summary.values())
+            return snapshot
+
+
+metrics = MetricsRegistry()
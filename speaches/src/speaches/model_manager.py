@@ -1,12 +1,79 @@
-from collections.abc import Callable
+from collections.abc import Callable, Generator
+from concurrent.futures import Executor
+from contextlib import contextmanager
 import gc
 import logging
+from pathlib import Path
 import threading
 import time
+import weakref
 
 logger = logging.getLogger(__name__)
 
 
+def estimate_model_size(paths: list[Path]) -> int:
+    """Estimate the resident memory footprint of a model (in bytes) from the size of its files."""
+    return sum(path.stat().st_size for path in paths)
+
+
+class ModelMemoryBudget:
+    """Keeps the estimated memory usage of loaded models, across all model managers, under a budget.
+
+    When loading a model would exceed the budget, idle (`in_use` is false) models are unloaded in least-recently-used order.
+    """
+
+    def __init__(self, budget_bytes: int | None) -> None:
+        self.budget_bytes = budget_bytes
+        self._models: weakref.WeakSet[SelfDisposingModel] = weakref.WeakSet()
+        # models that are being loaded, they count as used so that concurrent loads don't all fit into the same room
+        self._pending: dict[SelfDisposingModel, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def used_bytes(self) -> int:
+        loaded_bytes = sum(
+            model.size_bytes for model in list(self._models) if model.model is not None and model not in self._pending
+        )
+        return loaded_bytes + sum(self._pending.values())
+
+    def register(self, model: "SelfDisposingModel") -> None:
+        with self._lock:
+            self._models.add(model)
+
+    def reserve(self, model: "SelfDisposingModel", size_bytes: int) -> None:
+        """Make room for `size_bytes` by evicting idle models. Loading proceeds (with a warning) if not enough memory could be freed. The room is held until `release` is called once the model has been loaded (or failed to)."""
+        if self.budget_bytes is None:
+            return
+        with self._lock:
+            candidates = sorted(
+                (m for m in self._models if m is not model and m.model is not None and not m.in_use),
+                key=lambda m: m.last_used,
+            )
+            for candidate in candidates:
+                if self.used_bytes + size_bytes <= self.budget_bytes:
+                    break
+                # NOTE: don't block on a model that is being used (or loaded) by another thread
+                if not candidate.rlock.acquire(blocking=False):
+                    continue
+                try:
+                    if candidate.model is not None and not candidate.in_use:
+                        logger.info(
+                            f"Evicting {candidate.model_id} ({candidate.size_bytes / 1024**2:.0f} MB) to make room for {model.model_id} ({size_bytes / 1024**2:.0f} MB)"
+                        )
+                        candidate.unload()
+                finally:
+                    candidate.rlock.release()
+            if self.used_bytes + size_bytes > self.budget_bytes:
+                logger.warning(
+                    f"Loading {model.model_id} ({size_bytes / 1024**2:.0f} MB) exceeds the model memory budget of {self.budget_bytes / 1024**2:.0f} MB ({self.used_bytes / 1024**2:.0f} MB used by models that are in use or being loaded)"
+                )
+            self._pending[model] = size_bytes
+
+    def release(self, model: "SelfDisposingModel") -> None:
+        with self._lock:
+            self._pending.pop(model, None)
+
+
 class SelfDisposingModel[T]:
     def __init__(
         self,
@@ -14,23 +81,39 @@ class SelfDisposingModel[T]:
         load_fn: Callable[[], T],
         ttl: int=-1,
         model_unloaded_callback: Callable[[str], None] | None = None,
+        size_fn: Callable[[], int] | None = None,
+        memory_budget: ModelMemoryBudget | None = None,
+        load_executor: Executor | None = None,
     ) -> None:
         self.model_id = model_id
         self.load_fn = load_fn
         self.ttl = -1
         self.model_unloaded_callback = model_unloaded_callback
+        self.size_fn = size_fn
+        self.memory_budget = memory_budget
+        self.load_executor = load_executor
 
         self.ref_count: int = 0
+        # references given up by `lent`, they don't count as busy but still keep the model from being unloaded
+        self.lent_count: int = 0
+        # references counted by `reserve` that haven't been taken over by `__enter__` yet
+        self._reservations: int = 0
+        # NOTE: guards `ref_count` on its own, `rlock` is held for as long as the model is loading
+        self._ref_lock = threading.Lock()
         self.rlock = threading.RLock()
         self.expire_timer: threading.Timer | None = None
         self.model: T | None = None
+        self.size_bytes: int = 0
+        self.last_used: float = time.monotonic()
+        if self.memory_budget is not None:
+            self.memory_budget.register(self)
 
     def unload(self) -> None:
         with self.rlock:
             if self.model is None:
                 raise ValueError(f"Model {self.model_id} is not loaded. {self.ref_count=}")
-            if self.ref_count > 0:
-                raise ValueError(f"Model {self.model_id} is still in use. {self.ref_count=}")
+            if self.in_use:
+                raise ValueError(f"Model {self.model_id} is still in use. {self.ref_count=}, {self.lent_count=}")
             if self.expire_timer:
                 self.expire_timer.cancel()
             self.model = None
@@ -39,17 +122,44 @@ class SelfDisposingModel[T]:
             if self.model_unloaded_callback is not None:
                 self.model_unloaded_callback(self.model_id)
 
+    @property
+    def in_use(self) -> bool:
+        return self.ref_count > 0 or self.lent_count > 0
+
     def _load(self) -> None:
         with self.rlock:
             assert self.model is None
             logger.debug(f"Loading model {self.model_id}")
+            if self.size_fn is not None:
+                self.size_bytes = self.size_fn()
+            if self.memory_budget is not None:
+                self.memory_budget.reserve(self, self.size_bytes)
             start = time.perf_counter()
-            self.model = self.load_fn()
+            try:
+                # NOTE: concurrent `__enter__` calls for this model wait on `rlock`, so they share this one load
+                if self.load_executor is not None:
+                    self.model = self.load_executor.submit(self.load_fn).result()
+                else:
+                    self.model = self.load_fn()
+            finally:
+                if self.memory_budget is not None:
+                    self.memory_budget.release(self)
             logger.info(f"Model {self.model_id} loaded in {time.perf_counter() - start:.2f}s")
 
+    def reserve(self) -> None:
+        """Count a reference on behalf of a caller that's about to enter the model, so that it already counts as busy when the next caller picks the least busy model. The caller's `__enter__` takes the reference over."""
+        with self._ref_lock:
+            self.ref_count += 1
+            self._reservations += 1
+
     def _increment_ref(self) -> None:
         with self.rlock:
-            self.ref_count += 1
+            with self._ref_lock:
+                if self._reservations > 0:
+                    self._reservations -= 1
+                else:
+                    self.ref_count += 1
+            self.last_used = time.monotonic()
             if self.expire_timer:
                 logger.debug(f"Model was set to expire in {self.expire_timer.interval}s, cancelling")
                 self.expire_timer.cancel()
@@ -57,9 +167,11 @@ class SelfDisposingModel[T]:
 
     def _decrement_ref(self) -> None:
         with self.rlock:
-            self.ref_count -= 1
+            with self._ref_lock:
+                self.ref_count -= 1
+            self.last_used = time.monotonic()
             logger.debug(f"Decremented ref count for {self.model_id}, {self.ref_count=}")
-            if self.ref_count <= 0:
+            if not self.in_use:
                 if self.ttl > 0:
                     logger.info(f"Model {self.model_id} is idle, scheduling offload in {self.ttl}s")
                     self.expire_timer = threading.Timer(self.ttl, self.unload)
@@ -73,10 +185,34 @@ class SelfDisposingModel[T]:
     def __enter__(self) -> T:
         with self.rlock:
             if self.model is None:
-                self._load()
+                try:
+                    self._load()
+                except BaseException:
+                    # NOTE: the caller never gets to `__exit__`, so the reservation made for it is given back here
+                    with self._ref_lock:
+                        if self._reservations > 0:
+                            self._reservations -= 1
+                            self.ref_count -= 1
+                    raise
             self._increment_ref()
             assert self.model is not None
             return self.model
 
     def __exit__(self, *_args) -> None:  # noqa: ANN002
         self._decrement_ref()
+
+    @contextmanager
+    def lent(self) -> Generator[None]:
+        """Give up a held reference for the duration of the block (i.e. while a bulk request is paused), so that the model counts as idle when picking a replica.
+
+        The model is still in use by the paused request, so it's neither evicted nor unloaded once idle in the meantime.
+        """
+        with self._ref_lock:
+            self.ref_count -= 1
+            self.lent_count += 1
+        try:
+            yield
+        finally:
+            with self._ref_lock:
+                self.lent_count -= 1
+                self.ref_count += 1
@@ -1,19 +1,35 @@
 from collections.abc import Generator
+from dataclasses import dataclass
+import hashlib
+import threading
 
 from pydantic import BaseModel
 
 from speaches.api_types import Model
 from speaches.hf_utils import (
+    CachedModelRepo,
     HfModelFilter,
+    get_hf_cache_index,
 )
 
 
+@dataclass(frozen=True)
+class ModelRegistrySnapshot[ModelT: Model]:
+    models: list[ModelT]
+    etag: str
+    """
+    Changes whenever a model is added, removed or modified.
+    """
+
+
 class ModelRegistry[ModelT: Model, ModelFilesT: BaseModel]:
     def __init__(self, hf_model_filter: HfModelFilter) -> None:
         self.hf_model_filter = hf_model_filter
+        # model id -> (the cache entry the model was built from, the model or `None` if the repo doesn't pass the filter)
+        self._local_models: dict[str, tuple[CachedModelRepo, ModelT | None]] = {}
+        self._lock = threading.Lock()
 
     def list_remote_models(self) -> Generator[ModelT, None]: ...
-    def list_local_models(self) -> Generator[ModelT, None]: ...
     def get_model(self, model_id: str) -> ModelT: ...
     def get_model_files(self, model_id: str) -> ModelFilesT: ...
     def download_model_files(self, model_id: str) -> None: ...
@@ -22,5 +38,45 @@ class ModelRegistry[ModelT: Model, ModelFilesT: BaseModel]:
             self.get_model_files(model_id)
         except Exception:  # noqa: BLE001
             self.download_model_files(model_id)
+            get_hf_cache_index().invalidate(model_id)
             return True
         return False
+
+    # builds the model for a cached repository that passes `hf_model_filter`
+    def _model_from_cached_repo(self, model_id: str, cached_repo: CachedModelRepo) -> ModelT: ...
+
+    def snapshot(self) -> ModelRegistrySnapshot[ModelT]:
+        """The locally available models. Only repositories that changed since the previous call are re-read."""
+        hf_cache_index = get_hf_cache_index()
+        with self._lock:
+            local_models: dict[str, tuple[CachedModelRepo, ModelT | None]] = {}
+            for model_id in sorted(hf_cache_index.list_model_ids()):
+                cached_repo = hf_cache_index.get(model_id)
+                if cached_repo is None:
+                    continue
+                entry = self._local_models.get(model_id)
+                if entry is None or entry[0] is not cached_repo:
+                    model = None
+                    if cached_repo.model_card_data is not None and self.hf_model_filter.passes_filter(
+                        cached_repo.model_card_data
+                    ):
+                        model = self._model_from_cached_repo(model_id, cached_repo)
+                    entry = (cached_repo, model)
+                local_models[model_id] = entry
+            self._local_models = local_models
+
+        models = [model for _, model in local_models.values() if model is not None]
+        fingerprint = repr(
+            [
+                (model_id, cached_repo.fingerprint, cached_repo.last_modified)
+                for model_id, (cached_repo, model) in local_models.items()
+                if model is not None
+            ]
+        )
+        return ModelRegistrySnapshot(models=models, etag=hashlib.sha1(fingerprint.encode()).hexdigest())  # noqa: S324
+
+    def list_local_models(self) -> Generator[ModelT, None]:
+        yield from self.snapshot().models
+
+    def get_local_model(self, model_id: str) -> ModelT | None:
+        return next((model for model in self.snapshot().models if model.id == model_id), None)
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from faster_whisper.vad import VadOptions
+import numpy as np
+
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.executors.kokoro import utils as kokoro_utils
+from speaches.executors.piper import utils as piper_utils
+from speaches.executors.silero_vad import utils as silero_vad_utils
+from speaches.executors.silero_vad.model_manager import MODEL_ID as VAD_MODEL_ID
+from speaches.executors.whisper import utils as whisper_utils
+from speaches.hf_utils import get_model_card_data
+
+if TYPE_CHECKING:
+    from speaches.executors.kokoro.model_manager import KokoroModelManager
+    from speaches.executors.piper.model_manager import PiperModelManager
+    from speaches.executors.silero_vad.model_manager import VadModelManager
+    from speaches.executors.whisper.model_manager import WhisperModelManager
+    from speaches.remote_model_catalog import RemoteModelCatalog
+
+logger = logging.getLogger(__name__)
+
+WARMUP_TEXT = "Hello."
+WARMUP_AUDIO = np.zeros(SAMPLES_PER_SECOND, dtype=np.float32)
+
+
+class ModelPreloader:
+    """Loads the configured models and runs a short synthetic inference on each of them so that the first request doesn't pay the load and first-inference costs."""
+
+    def __init__(
+        self,
+        model_ids: list[str],
+        whisper_model_manager: WhisperModelManager,
+        kokoro_model_manager: KokoroModelManager,
+        piper_model_manager: PiperModelManager,
+        vad_model_manager: VadModelManager,
+        remote_model_catalog: RemoteModelCatalog,
+    ) -> None:
+        self.model_ids = model_ids
+        self.whisper_model_manager = whisper_model_manager
+        self.kokoro_model_manager = kokoro_model_manager
+        self.piper_model_manager = piper_model_manager
+        self.vad_model_manager = vad_model_manager
+        self.remote_model_catalog = remote_model_catalog
+        self.ready = threading.Event()
+        self.errors: dict[str, str] = {}
+        if len(self.model_ids) == 0:
+            self.ready.set()
+
+    def start(self) -> None:
+        if self.ready.is_set():
+            return
+        threading.Thread(target=self.run, name="model-preloader", daemon=True).start()
+
+    def run(self) -> None:
+        start = time.perf_counter()
+        for model_id in self.model_ids:
+            try:
+                self._warm_up(model_id)
+            except Exception as e:
+                logger.exception(f"Failed to preload {model_id}")
+                self.errors[model_id] = str(e)
+        logger.info(f"Preloaded {len(self.model_ids)} models in {time.perf_counter() - start:.2f}s")
+        self.ready.set()
+
+    def _warm_up(self, model_id: str) -> None:
+        logger.info(f"Preloading {model_id}")
+        start = time.perf_counter()
+        match self._get_model_task(model_id):
+            case "vad":
+                # warm up every session, otherwise only the first one would be ready
+                for session in self.vad_model_manager.sessions:
+                    with session as vad:
+                        silero_vad_utils.get_speech_timestamps(vad, [WARMUP_AUDIO], VadOptions())
+            case "whisper":
+                with self.whisper_model_manager.load_model(model_id):
+                    # warm up every replica, otherwise only the first one would be ready
+                    for replica in self.whisper_model_manager.loaded_models[model_id]:
+                        with replica as whisper:
+                            segments, _ = whisper.transcribe(WARMUP_AUDIO, vad_filter=False)
+                            list(segments)
+            case "kokoro":
+                with self.kokoro_model_manager.load_model(model_id) as tts:
+                    tts.create(WARMUP_TEXT, kokoro_utils.VOICES[0].name, lang=kokoro_utils.VOICES[0].language)
+            case "piper":
+                with self.piper_model_manager.load_model(model_id) as piper_tts:
+                    list(piper_utils.generate_audio(piper_tts, WARMUP_TEXT))
+        logger.info(f"Preloaded {model_id} in {time.perf_counter() - start:.2f}s")
+
+    def _get_model_task(self, model_id: str) -> str:
+        if model_id == VAD_MODEL_ID:
+            return "vad"
+        model_card_data = get_model_card_data(model_id)
+        if model_card_data is not None:
+            if kokoro_utils.hf_model_filter.passes_filter(model_card_data):
+                return "kokoro"
+            if piper_utils.hf_model_filter.passes_filter(model_card_data):
+                return "piper"
+            if whisper_utils.hf_model_filter.passes_filter(model_card_data):
+                return "whisper"
+        # the model isn't downloaded yet, the model managers will download it on load
+        return self.remote_model_catalog.classify(model_id) or "whisper"
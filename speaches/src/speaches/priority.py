@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import ExitStack
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from speaches.metrics import metrics
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Generator, Iterable
+    from contextlib import AbstractContextManager
+
+    from speaches.config import Priority, PriorityConfig
+
+logger = logging.getLogger(__name__)
+
+# lower ranks are served first
+PRIORITY_RANKS: dict[Priority, int] = {"interactive": 0, "bulk": 1}
+
+bulk_pauses = metrics.counter("priority_bulk_pauses", "Times a bulk request paused for interactive ones.")
+bulk_pause_seconds = metrics.summary(
+    "priority_bulk_pause_seconds", "Time bulk requests spent paused for interactive ones."
+)
+
+type Released = Callable[[], AbstractContextManager[object]]
+"""A resource that's given up while a bulk request is paused, i.e. `SelfDisposingModel.lent` or `InferenceExecutor.paused`."""
+
+
+class RunningRequest:
+    def __init__(self, scheduler: PriorityScheduler, priority: Priority) -> None:
+        self.scheduler = scheduler
+        self.priority = priority
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self) -> None:
+        """Idempotent, may be called from any thread."""
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        if self.priority == "interactive":
+            self.scheduler._interactive_done()  # noqa: SLF001
+
+
+class PriorityScheduler:
+    """Lets interactive requests (i.e. push-to-talk dictation) get ahead of bulk ones (i.e. long file transcriptions).
+
+    Interactive requests are registered for as long as they're queued or running. While any is registered, bulk requests are paused, for at most `max_bulk_pause_seconds` at a time so that they can't be starved:
+    - before they're admitted (`wait_for_interactive`), so that they don't hold a worker or a model replica while waiting;
+    - while running, before each segment is decoded (`gate`) and before each long-form chunk (`yield_to_interactive`). Their worker slot and model replica are given up while paused.
+    """
+
+    def __init__(self, config: PriorityConfig) -> None:
+        self.config = config
+        self._interactive = 0
+        self._condition = threading.Condition()
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future[None]]] = []
+
+    def resolve(self, explicit: Priority | None, api_key: str | None, audio_seconds: float) -> Priority:
+        """An explicitly requested priority wins, then the default of the API key, and otherwise it's based on the duration of the audio."""
+        if explicit is not None:
+            return explicit
+        if api_key is not None and api_key in self.config.api_key_defaults:
+            return self.config.api_key_defaults[api_key]
+        if self.config.bulk_min_duration_seconds is not None and audio_seconds >= self.config.bulk_min_duration_seconds:
+            return "bulk"
+        return self.config.default
+
+    def register(self, priority: Priority) -> RunningRequest:
+        if priority == "interactive":
+            with self._condition:
+                self._interactive += 1
+        return RunningRequest(self, priority)
+
+    def _interactive_done(self) -> None:
+        with self._condition:
+            self._interactive -= 1
+            if self._interactive == 0:
+                self._condition.notify_all()
+                waiters, self._waiters = self._waiters, []
+            else:
+                waiters = []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    async def wait_for_interactive(self, priority: Priority) -> None:
+        """Delay a bulk request before it's admitted while there are interactive requests, but no longer than `max_bulk_pause_seconds`. Doesn't block the event loop."""
+        if priority != "bulk":
+            return
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            if self._interactive == 0:
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.config.max_bulk_pause_seconds)
+        except TimeoutError:
+            with self._condition:
+                if (loop, future) in self._waiters:
+                    self._waiters.remove((loop, future))
+        bulk_pauses.inc()
+        bulk_pause_seconds.observe(time.perf_counter() - start)
+
+    def yield_to_interactive(self, *released: Released) -> None:
+        """Block the (bulk) caller while there are interactive requests, but no longer than `max_bulk_pause_seconds`. The `released` resources are given up while paused."""
+        with self._condition:
+            if self._interactive == 0:
+                return
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for resource in released:
+                stack.enter_context(resource())
+            with self._condition:
+                self._condition.wait_for(lambda: self._interactive == 0, timeout=self.config.max_bulk_pause_seconds)
+        bulk_pauses.inc()
+        bulk_pause_seconds.observe(time.perf_counter() - start)
+
+    def gate[T](self, segments: Iterable[T], priority: Priority, *released: Released) -> Iterable[T]:
+        """Make a lazy segment generator of a bulk request pause before each of its segments. Whisper decodes a 30 second window when the first of its segments is pulled, so the pause never interrupts a window."""
+        if priority != "bulk":
+            return segments
+
+        def gated_segments() -> Generator[T]:
+            iterator = iter(segments)
+            while True:
+                self.yield_to_interactive(*released)
+                try:
+                    segment = next(iterator)
+                except StopIteration:
+                    return
+                yield segment
+
+        return gated_segments()
+
+
+def _resolve(future: asyncio.Future[None]) -> None:
+    if not future.done():
+        future.set_result(None)
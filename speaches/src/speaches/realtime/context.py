@@ -7,6 +7,8 @@ from openai.resources.chat.completions import AsyncCompletions
 from speaches.realtime.conversation_event_router import Conversation
 from speaches.realtime.input_audio_buffer import InputAudioBuffer
 from speaches.realtime.pubsub import EventPubSub
+from speaches.resampling import Resampler
+from speaches.streaming_vad import VadBatcher
 from speaches.types.realtime import Session
 
 if TYPE_CHECKING:
@@ -19,9 +21,11 @@ class SessionContext:
         transcription_client: AsyncTranscriptions,
         completion_client: AsyncCompletions,
         session: Session,
+        vad_batcher: VadBatcher,
     ) -> None:
         self.transcription_client = transcription_client
         self.completion_client = completion_client
+        self.vad_batcher = vad_batcher
 
         self.session = session
 
@@ -29,5 +33,7 @@ class SessionContext:
         self.conversation = Conversation(self.pubsub)
         self.response: ResponseHandler | None = None
 
+        # the input audio is 24 kHz (as defined in the API spec), while the VAD and the transcription need 16 kHz. The resampler is kept across chunks, so that their boundaries don't click
+        self.input_audio_resampler = Resampler(24000, 16000)
         input_audio_buffer = InputAudioBuffer(self.pubsub)
         self.input_audio_buffers = OrderedDict[str, InputAudioBuffer]({input_audio_buffer.id: input_audio_buffer})
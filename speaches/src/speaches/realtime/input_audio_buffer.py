@@ -6,12 +6,13 @@ import logging
 import time
 from typing import TYPE_CHECKING
 
-import numpy as np
 from openai import NotGiven
 from pydantic import BaseModel
 import soundfile as sf
 
+from speaches.audio import PcmBuffer
 from speaches.realtime.utils import generate_item_id, task_done_callback
+from speaches.streaming_vad import StreamingVad
 from speaches.types.realtime import (
     ConversationItemContentInputAudio,
     ConversationItemInputAudioTranscriptionCompletedEvent,
@@ -21,6 +22,7 @@ from speaches.types.realtime import (
 )
 
 if TYPE_CHECKING:
+    import numpy as np
     from numpy.typing import NDArray
     from openai.resources.audio import AsyncTranscriptions
 
@@ -29,7 +31,6 @@ if TYPE_CHECKING:
 
 SAMPLE_RATE = 16000
 MS_SAMPLE_RATE = 16
-MAX_VAD_WINDOW_SIZE_SAMPLES = 3000 * MS_SAMPLE_RATE
 
 logger = logging.getLogger(__name__)
 
@@ -38,35 +39,39 @@ logger = logging.getLogger(__name__)
 class VadState(BaseModel):
     audio_start_ms: int | None = None
     audio_end_ms: int | None = None
-    # TODO: consider keeping track of what was the last audio timestamp that was processed. This value could be used to control how often the VAD is run.
 
 
-# TODO: use `np.int16` instead of `np.float32` for audio data
 class InputAudioBuffer:
     def __init__(self, pubsub: EventPubSub) -> None:
         self.id = generate_item_id()
-        self.data: NDArray[np.float32] = np.array([], dtype=np.float32)
+        self.buffer = PcmBuffer()
         self.vad_state = VadState()
+        self.streaming_vad = StreamingVad()
         self.pubsub = pubsub
 
+    @property
+    def data(self) -> NDArray[np.int16]:
+        """All of the audio. This is a view, not a copy."""
+        return self.buffer.samples
+
     @property
     def size(self) -> int:
         """Number of samples in the buffer."""
-        return len(self.data)
+        return len(self.buffer)
 
     @property
     def duration(self) -> float:
         """Duration of the audio in seconds."""
-        return len(self.data) / SAMPLE_RATE
+        return len(self.buffer) / SAMPLE_RATE
 
     @property
     def duration_ms(self) -> int:
         """Duration of the audio in milliseconds."""
-        return len(self.data) // MS_SAMPLE_RATE
+        return len(self.buffer) // MS_SAMPLE_RATE
 
-    def append(self, audio_chunk: NDArray[np.float32]) -> None:
+    def append(self, audio_chunk: NDArray[np.int16] | NDArray[np.float32]) -> None:
         """Append an audio chunk to the buffer."""
-        self.data = np.append(self.data, audio_chunk)
+        self.buffer.append(audio_chunk)
 
     # def commit(self) -> None:
     #     """Publish an event to indicate that the buffer is ready for processing."""
@@ -74,7 +79,7 @@ class InputAudioBuffer:
 
     # TODO: come up with a better name
     @property
-    def data_w_vad_applied(self) -> NDArray[np.float32]:
+    def data_w_vad_applied(self) -> NDArray[np.int16]:
         if self.vad_state.audio_start_ms is None:
             return self.data
         else:
@@ -1,6 +1,5 @@
 import asyncio
 import base64
-import io
 import logging
 
 from aiortc import MediaStreamTrack
@@ -8,9 +7,8 @@ from av.audio.frame import AudioFrame
 import numpy as np
 from openai.types.beta.realtime import ResponseAudioDeltaEvent
 
-from speaches.audio import audio_samples_from_file
 from speaches.realtime.context import SessionContext
-from speaches.realtime.input_audio_buffer_event_router import resample_audio_data
+from speaches.resampling import Resampler
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +28,7 @@ class AudioStreamTrack(MediaStreamTrack):
         self._sample_rate = 48000
         self._frame_duration = 0.01  # in seconds
         self._samples_per_frame = int(self._sample_rate * self._frame_duration)
+        self._resampler = Resampler(24000, self._sample_rate)
         self._running = True
 
         # Start the frame processing task
@@ -57,13 +56,9 @@ class AudioStreamTrack(MediaStreamTrack):
                 if not self._running:
                     return
 
-                # copied from `input_audio_buffer.append` handler
-                audio_array = audio_samples_from_file(io.BytesIO(base64.b64decode(event.delta)))
-                audio_array = resample_audio_data(audio_array, 24000, 48000)
-
-                # Convert to int16 if not already
-                if audio_array.dtype != np.int16:
-                    audio_array = (audio_array * 32767).astype(np.int16)
+                # same as the `input_audio_buffer.append` handler, the PCM 16-bit samples are resampled as is (and clipped by the resampler)
+                audio_array = np.frombuffer(base64.b64decode(event.delta), dtype="<i2")
+                audio_array = self._resampler.process(audio_array)
 
                 # Split the array into frame-sized chunks
                 frames = self._split_into_frames(audio_array)
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from pathlib import Path
+
+    from speaches.api_types import Model
+    from speaches.model_registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION = 1
+# a model id that isn't listed triggers a refresh (in case it was published since), but at most this often
+MISS_REFRESH_INTERVAL_SECONDS = 300
+
+
+class RemoteModelCatalog:
+    """A persisted copy of the remote (Hugging Face Hub) model listings of each registry.
+
+    Listing remote models is a paginated Hub API call per registry. The catalog keeps the result in a JSON file so that classifying a model id is a dict lookup. The file is refreshed in the background once it's older than `ttl` while the stale listing keeps being served, and right away when a model id isn't listed (see `MISS_REFRESH_INTERVAL_SECONDS`). In offline mode the file is never refreshed, which also allows pointing `path` at a fixture catalog.
+
+    `fetch_models` replaces the Hub listings (i.e. with fixture models in tests), it defaults to `list_remote_models` of each registry.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        registries: dict[str, tuple[ModelRegistry, type[Model]]],
+        *,
+        ttl: int,
+        offline: bool = False,
+        fetch_models: Callable[[], dict[str, list[Model]]] | None = None,
+    ) -> None:
+        self.path = path
+        self.registries = registries  # NOTE: the order determines which registry a model id is classified as
+        self.ttl = ttl
+        self.offline = offline
+        self.fetch_models = fetch_models or self._list_remote_models
+        self.updated_at: float | None = None
+        self._models: dict[str, list[Model]] = {}
+        self._registry_by_model_id: dict[str, str] = {}
+        self._lock = threading.Lock()
+        # NOTE: held while refreshing in the foreground, so that concurrent callers share a single refresh
+        self._refresh_lock = threading.Lock()
+        self._refresh_thread: threading.Thread | None = None
+        self._load()
+
+    def _set_models(self, models: dict[str, list[Model]], updated_at: float) -> None:
+        registry_by_model_id: dict[str, str] = {}
+        for registry_name in reversed(self.registries):
+            for model in models.get(registry_name, []):
+                registry_by_model_id[model.id] = registry_name
+        with self._lock:
+            self._models = models
+            self._registry_by_model_id = registry_by_model_id
+            self.updated_at = updated_at
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+            if data.get("version") != CATALOG_VERSION:
+                logger.warning(f"Ignoring remote model catalog {self.path} with an unsupported version")
+                return
+            models = {
+                registry_name: [model_type.model_validate(model) for model in data["models"].get(registry_name, [])]
+                for registry_name, (_, model_type) in self.registries.items()
+            }
+            self._set_models(models, data["updated_at"])
+            logger.debug(f"Loaded remote model catalog from {self.path}")
+        except Exception:
+            logger.exception(f"Failed to load remote model catalog from {self.path}")
+
+    def _list_remote_models(self) -> dict[str, list[Model]]:
+        return {
+            registry_name: list(registry.list_remote_models())
+            for registry_name, (registry, _) in self.registries.items()
+        }
+
+    def refresh(self) -> None:
+        """Fetch the remote listings of all registries and persist them."""
+        start = time.perf_counter()
+        models = self.fetch_models()
+        updated_at = time.time()
+        data = {
+            "version": CATALOG_VERSION,
+            "updated_at": updated_at,
+            "models": {
+                registry_name: [model.model_dump() for model in registry_models]
+                for registry_name, registry_models in models.items()
+            },
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(data))
+        tmp_path.replace(self.path)  # atomic, so concurrent readers never see a partially written catalog
+        self._set_models(models, updated_at)
+        logger.info(f"Refreshed remote model catalog in {time.perf_counter() - start:.2f}s")
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self._refresh_if_older_than(self.ttl)
+        except Exception:
+            logger.exception("Failed to refresh the remote model catalog")
+
+    def _refresh_if_older_than(self, max_age: float) -> None:
+        """Refresh in the foreground unless the catalog is at most `max_age` seconds old, including when another caller just refreshed it."""
+        with self._refresh_lock:
+            if self.updated_at is not None and time.time() - self.updated_at <= max_age:
+                return
+            self.refresh()
+
+    def _ensure_fresh(self) -> None:
+        if self.offline:
+            return
+        if self.updated_at is None:
+            # nothing to serve yet, so the first caller has to wait
+            self._refresh_if_older_than(float("inf"))
+            return
+        if time.time() - self.updated_at < self.ttl:
+            return
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_in_background, name="remote-model-catalog-refresh", daemon=True
+            )
+            self._refresh_thread.start()
+
+    def list_models(self, registry_name: str) -> list[Model]:
+        self._ensure_fresh()
+        return list(self._models.get(registry_name, []))
+
+    def classify(self, model_id: str) -> str | None:
+        """Name of the registry the model belongs to, or `None` if no registry lists it."""
+        self._ensure_fresh()
+        registry_name = self._registry_by_model_id.get(model_id)
+        if registry_name is None and not self.offline:
+            # the model may have been published after the catalog was last refreshed
+            try:
+                self._refresh_if_older_than(MISS_REFRESH_INTERVAL_SECONDS)
+            except Exception:
+                logger.exception("Failed to refresh the remote model catalog")
+            registry_name = self._registry_by_model_id.get(model_id)
+        return registry_name
@@ -0,0 +1,120 @@
+"""Polyphase FIR resampling of mono audio.
+
+The filters are the same as the ones of `scipy.signal.resample_poly` (a Kaiser windowed sinc, 10 zero crossings on each side) and are designed once per rate pair. `Resampler` keeps the tail of the previous chunk, so a stream resampled chunk by chunk is identical to resampling it in one go, without discontinuities ("clicks") at the chunk boundaries.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from numpy.typing import NDArray
+
+KAISER_BETA = 5.0
+# half of the filter's length, in periods of the lower of the two sample rates
+HALF_LENGTH_PERIODS = 10
+
+type Samples = NDArray[np.float32] | NDArray[np.int16]
+
+
+@dataclass(frozen=True)
+class PolyphaseFilter:
+    up: int
+    down: int
+    half_length: int
+    """In samples of the upsampled signal. It's the delay of the filter."""
+    phases: NDArray[np.float32]
+    """`(up, taps_per_phase)`. The taps of each phase are reversed, so that they can be applied to a window of the input with a dot product."""
+
+
+@lru_cache(maxsize=32)
+def polyphase_filter(sample_rate: int, target_sample_rate: int) -> PolyphaseFilter:
+    divisor = math.gcd(sample_rate, target_sample_rate)
+    up, down = target_sample_rate // divisor, sample_rate // divisor
+    max_rate = max(up, down)
+    half_length = HALF_LENGTH_PERIODS * max_rate
+    cutoff = 1.0 / max_rate
+    taps = (
+        cutoff
+        * np.sinc(cutoff * np.arange(-half_length, half_length + 1))
+        * np.kaiser(2 * half_length + 1, KAISER_BETA)
+    )
+    # unity gain at DC, times `up` to make up for the zeros inserted between the input samples
+    taps *= up / taps.sum()
+    taps_per_phase = -(-len(taps) // up)
+    taps = np.pad(taps, (0, taps_per_phase * up - len(taps)))
+    phases = np.ascontiguousarray(taps.reshape(taps_per_phase, up).T[:, ::-1], dtype=np.float32)
+    phases.setflags(write=False)
+    return PolyphaseFilter(up, down, half_length, phases)
+
+
+class Resampler:
+    """Resamples a stream of mono audio chunk by chunk. `int16` chunks are resampled to `int16` and `float32` chunks to `float32`.
+
+    The output lags the input by about 10 samples, call `flush` at the end of the stream to get the rest of it.
+    """
+
+    def __init__(self, sample_rate: int, target_sample_rate: int) -> None:
+        self.sample_rate = sample_rate
+        self.target_sample_rate = target_sample_rate
+        self.filter = polyphase_filter(sample_rate, target_sample_rate)
+        self._dtype: np.dtype = np.dtype(np.float32)
+        self.reset()
+
+    def reset(self) -> None:
+        """Start a new stream."""
+        self._history = np.zeros(self.filter.phases.shape[1] - 1, dtype=np.float32)
+        # position of the next output sample in the upsampled signal, relative to the start of the next chunk
+        self._position = self.filter.half_length
+        self._num_input_samples = 0
+        self._num_output_samples = 0
+
+    def _filter(self, chunk: NDArray[np.float32]) -> NDArray[np.float32]:
+        if len(chunk) == 0:
+            # NOTE: `sliding_window_view` needs at least one full window
+            return np.empty(0, dtype=np.float32)
+        up, down, phases = self.filter.up, self.filter.down, self.filter.phases
+        buffer = np.concatenate((self._history, chunk))
+        # `windows[i]` ends with `chunk[i]`
+        windows = sliding_window_view(buffer, phases.shape[1])
+        num_upsampled = len(chunk) * up
+        num_output = max(0, -(-(num_upsampled - self._position) // down))
+        output = np.empty(num_output, dtype=np.float32)
+        # every `up`-th output sample uses the same phase and windows that are `down` input samples apart
+        for offset in range(min(up, num_output)):
+            position = self._position + offset * down
+            num_strided = len(range(offset, num_output, up))
+            output[offset::up] = windows[position // up :: down][:num_strided] @ phases[position % up]
+        self._position += num_output * down - num_upsampled
+        self._history = buffer[len(buffer) - len(self._history) :]
+        return output
+
+    def _to_dtype(self, samples: NDArray[np.float32]) -> Samples:
+        if self._dtype == np.int16:
+            return np.clip(np.rint(samples), -32768, 32767).astype(np.int16)
+        return samples
+
+    def process(self, chunk: Samples) -> Samples:
+        self._dtype = chunk.dtype
+        self._num_input_samples += len(chunk)
+        output = self._filter(chunk.astype(np.float32, copy=False))
+        self._num_output_samples += len(output)
+        return self._to_dtype(output)
+
+    def flush(self) -> Samples:
+        """The rest of the stream's output. Resets the resampler."""
+        num_remaining = -(-self._num_input_samples * self.filter.up // self.filter.down) - self._num_output_samples
+        output = self._filter(np.zeros(-(-self.filter.half_length // self.filter.up) + 1, dtype=np.float32))
+        self.reset()
+        return self._to_dtype(output[: max(0, num_remaining)])
+
+
+def resample(samples: Samples, sample_rate: int, target_sample_rate: int) -> Samples:
+    """Resample a whole signal. The output has `ceil(len(samples) * target_sample_rate / sample_rate)` samples."""
+    if sample_rate == target_sample_rate:
+        return samples
+    resampler = Resampler(sample_rate, target_sample_rate)
+    return np.concatenate((resampler.process(samples), resampler.flush()))
@@ -0,0 +1,154 @@
+import logging
+from pathlib import Path
+import shutil
+from typing import Annotated
+
+from fastapi import (
+    APIRouter,
+    File,
+    Form,
+    HTTPException,
+    Response,
+    UploadFile,
+)
+
+from speaches.audio import get_audio_duration
+from speaches.batch_jobs import NewJob, TranscriptionBatch, TranscriptionParams, parse_manifest
+from speaches.dependencies import (
+    BatchJobRunnerDependency,
+    BatchJobStoreDependency,
+    ConfigDependency,
+)
+from speaches.model_aliases import ModelId
+from speaches.routers.stt import DEFAULT_RESPONSE_FORMAT, ResponseFormat, segments_to_response
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["automatic-speech-recognition"])
+
+
+def _manifest_jobs(manifest: UploadFile, manifest_dirs: list[Path]) -> list[NewJob]:
+    if len(manifest_dirs) == 0:
+        raise HTTPException(status_code=403, detail="Manifests are disabled. Set `BATCH_JOBS__MANIFEST_DIRS`.")
+    try:
+        paths = parse_manifest(manifest.file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid manifest: {e}") from e
+    jobs: list[NewJob] = []
+    for path in paths:
+        audio_path = Path(path).resolve()
+        if not any(audio_path.is_relative_to(manifest_dir) for manifest_dir in manifest_dirs):
+            raise HTTPException(status_code=403, detail=f"'{path}' is not in one of the allowed manifest directories")
+        if not audio_path.is_file():
+            raise HTTPException(status_code=400, detail=f"'{path}' doesn't exist")
+        duration = get_audio_duration(str(audio_path))
+        if duration is None:
+            raise HTTPException(status_code=415, detail=f"Failed to read the duration of '{path}'")
+        jobs.append(NewJob(filename=path, audio_path=str(audio_path), owns_audio=False, duration=duration))
+    return jobs
+
+
+@router.post("/v1/audio/transcriptions/batches", summary="Queue audio files for transcription.")
+def create_batch(
+    config: ConfigDependency,
+    store: BatchJobStoreDependency,
+    runner: BatchJobRunnerDependency,
+    model: Annotated[ModelId, Form()],
+    files: Annotated[list[UploadFile] | None, File(description="Audio files to transcribe.")] = None,
+    manifest: Annotated[
+        UploadFile | None,
+        File(
+            description="Paths of audio files on the server, either as a JSON array or one per line. Only paths in `BATCH_JOBS__MANIFEST_DIRS` are allowed."
+        ),
+    ] = None,
+    language: Annotated[str | None, Form()] = None,
+    prompt: Annotated[str | None, Form()] = None,
+    temperature: Annotated[float, Form()] = 0.0,
+    word_timestamps: Annotated[bool, Form()] = False,
+    hotwords: Annotated[str | None, Form()] = None,
+    vad_filter: Annotated[bool | None, Form()] = None,
+) -> TranscriptionBatch:
+    jobs: list[NewJob] = []
+    try:
+        for file in files or []:
+            filename = file.filename or "audio"
+            audio_path = store.new_audio_path(filename)
+            # NOTE: added before writing, so that the file gets cleaned up if anything below fails
+            jobs.append(NewJob(filename=filename, audio_path=str(audio_path), owns_audio=True, duration=0.0))
+            with audio_path.open("wb") as f:
+                shutil.copyfileobj(file.file, f)
+            duration = get_audio_duration(str(audio_path))
+            if duration is None:
+                raise HTTPException(status_code=415, detail=f"Failed to read the duration of '{filename}'")
+            jobs[-1].duration = duration
+        if manifest is not None:
+            jobs.extend(
+                _manifest_jobs(
+                    manifest, [Path(manifest_dir).resolve() for manifest_dir in config.batch_jobs.manifest_dirs]
+                )
+            )
+        if len(jobs) == 0:
+            raise HTTPException(status_code=400, detail="Either `files` or a `manifest` must be provided")
+        params = TranscriptionParams(
+            language=language,
+            prompt=prompt,
+            temperature=temperature,
+            word_timestamps=word_timestamps,
+            hotwords=hotwords,
+            vad_filter=vad_filter if vad_filter is not None else config._unstable_vad_filter,  # noqa: SLF001
+        )
+        batch = store.create_batch(model, params, jobs)
+    except BaseException:
+        for job in jobs:
+            if job.owns_audio:
+                Path(job.audio_path).unlink(missing_ok=True)
+        raise
+    logger.info(f"Queued batch {batch.id} with {len(jobs)} files ({sum(job.duration for job in jobs):.2f}s of audio)")
+    runner.notify()
+    return batch
+
+
+@router.get("/v1/audio/transcriptions/batches", summary="List transcription batches.")
+def list_batches(store: BatchJobStoreDependency) -> list[TranscriptionBatch]:
+    return store.list_batches()
+
+
+@router.get("/v1/audio/transcriptions/batches/{batch_id}", summary="Get a transcription batch and its jobs.")
+def get_batch(store: BatchJobStoreDependency, batch_id: str) -> TranscriptionBatch:
+    batch = store.get_batch(batch_id, with_jobs=True)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch '{batch_id}' not found")
+    return batch
+
+
+@router.delete(
+    "/v1/audio/transcriptions/batches/{batch_id}",
+    summary="Cancel the queued jobs of a transcription batch. Jobs that are already running are finished.",
+)
+def cancel_batch(store: BatchJobStoreDependency, batch_id: str) -> TranscriptionBatch:
+    if not store.cancel_batch(batch_id):
+        raise HTTPException(status_code=404, detail=f"Batch '{batch_id}' not found")
+    batch = store.get_batch(batch_id, with_jobs=True)
+    assert batch is not None
+    return batch
+
+
+@router.get(
+    "/v1/audio/transcriptions/batches/{batch_id}/jobs/{job_id}/content",
+    summary="Download the transcription of a completed job.",
+)
+def get_job_content(
+    store: BatchJobStoreDependency,
+    batch_id: str,
+    job_id: str,
+    response_format: ResponseFormat = DEFAULT_RESPONSE_FORMAT,
+) -> Response:
+    job = store.get_job(batch_id, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found in batch '{batch_id}'")
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' is {job.status}")
+    result = store.get_result(batch_id, job_id)
+    assert result is not None
+    segments, transcription_info = result
+    return segments_to_response(segments, transcription_info, response_format)
@@ -0,0 +1,200 @@
+import asyncio
+from collections import deque
+from contextlib import ExitStack
+import json
+import logging
+import time
+
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    WebSocket,
+    WebSocketDisconnect,
+    WebSocketException,
+    status,
+)
+from faster_whisper.transcribe import Word
+import numpy as np
+
+from speaches.audio import Audio
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.dependencies import (
+    AdmissionControlDependency,
+    ConfigDependency,
+    InferenceExecutorDependency,
+    PrioritySchedulerDependency,
+    WhisperModelManagerDependency,
+)
+from speaches.dictation import Utterance, final_latency_seconds, partial_passes, transcribe_words
+from speaches.model_aliases import ModelId
+from speaches.resampling import Resampler
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["automatic-speech-recognition"])
+
+
+@router.websocket("/v1/audio/transcriptions")
+async def transcribe_stream(  # noqa: C901, PLR0915
+    ws: WebSocket,
+    config: ConfigDependency,
+    model_manager: WhisperModelManagerDependency,
+    inference_executor: InferenceExecutorDependency,
+    admission_control: AdmissionControlDependency,
+    priority_scheduler: PrioritySchedulerDependency,
+    model: ModelId,
+    language: str | None = None,
+    prompt: str | None = None,
+    hotwords: str | None = None,
+    sample_rate: int = SAMPLES_PER_SECOND,
+) -> None:
+    """Push-to-talk dictation.
+
+    The client sends the audio as binary messages of mono 16-bit little-endian PCM (at `sample_rate`) while the key is held, and a `{"type": "commit"}` text message when it's released (or `{"type": "clear"}` to discard the utterance). The connection can be reused for any number of utterances.
+
+    The server sends `{"type": "transcript.partial", "text": ..., "confirmed": ..., "unconfirmed": ...}` messages while audio is arriving, where the `confirmed` prefix won't change anymore, and a `{"type": "transcript.final", "text": ...}` message for every commit.
+    """
+
+    def load() -> None:
+        with model_manager.load_model(model):
+            pass
+
+    # NOTE: an unknown (or broken) model is rejected during the handshake rather than failing every pass of every utterance
+    try:
+        await inference_executor.run(load)
+    except Exception as e:
+        logger.error(f"Failed to load model '{model}' for dictation: {e}")
+        raise WebSocketException(
+            code=status.WS_1008_POLICY_VIOLATION, reason=f"Failed to load model '{model}': {e}"
+        ) from e
+    await ws.accept()
+    logger.info(f"Accepted dictation connection for '{model}'")
+    dictation_config = config.dictation
+    utterance = Utterance(dictation_config)
+    committed: deque[Utterance] = deque()
+    wakeup = asyncio.Event()
+    resampler = Resampler(sample_rate, SAMPLES_PER_SECOND) if sample_rate != SAMPLES_PER_SECOND else None
+
+    async def transcribe(audio: Audio, utterance: Utterance) -> tuple[list[Word], str]:
+        running_request = priority_scheduler.register("interactive")
+        try:
+            permit = await admission_control.transcription.admit(model, audio.duration, "interactive")
+        except BaseException:
+            running_request.release()
+            raise
+
+        def run() -> tuple[list[Word], str]:
+            with ExitStack() as stack:
+                stack.callback(running_request.release)
+                stack.callback(permit.release)
+                try:
+                    whisper = stack.enter_context(model_manager.load_model(model))
+                    return transcribe_words(
+                        whisper,
+                        audio,
+                        language=utterance.language or language,
+                        prompt=utterance.prompt(prompt),
+                        hotwords=hotwords,
+                    )
+                except Exception as e:
+                    # NOTE: surfaced to the client as an error message rather than tearing down the connection
+                    logger.error(f"Failed to transcribe dictation with '{model}': {e}")
+                    raise HTTPException(status_code=500, detail=f"Failed to transcribe with '{model}': {e}") from e
+
+        try:
+            return await inference_executor.run(run)
+        except BaseException:
+            permit.release()
+            running_request.release()
+            raise
+
+    async def finalize(utterance: Utterance) -> None:
+        if utterance.audio.end == 0:
+            text = ""
+        elif utterance.untranscribed_seconds == 0:
+            text = utterance.final_text()
+        else:
+            try:
+                audio = utterance.final_snapshot()
+                hypothesis, _ = await transcribe(audio, utterance)
+            except HTTPException as e:
+                await ws.send_json({"type": "error", "message": e.detail})
+                return
+            text = utterance.final_text(hypothesis)
+        assert utterance.committed_at is not None
+        final_latency_seconds.observe(time.perf_counter() - utterance.committed_at)
+        await ws.send_json({"type": "transcript.final", "text": text})
+
+    async def process() -> None:
+        overloaded = False
+        while True:
+            if len(committed) > 0:
+                await finalize(committed.popleft())
+                continue
+            if not overloaded and utterance.untranscribed_seconds >= dictation_config.min_chunk_seconds:
+                # NOTE: a reference is kept, as the utterance may get committed while it's being transcribed
+                current = utterance
+                audio = current.snapshot()
+                try:
+                    hypothesis, detected_language = await transcribe(audio, current)
+                except HTTPException as e:
+                    # partial transcripts are best effort, the next attempt is made once more audio arrives
+                    logger.warning(f"Skipping a partial dictation transcript: {e.detail}")
+                    overloaded = True
+                    continue
+                partial_passes.inc()
+                current.update(audio, hypothesis, detected_language)
+                if current is utterance:
+                    await ws.send_json(
+                        {
+                            "type": "transcript.partial",
+                            "text": f"{current.confirmed_text} {current.unconfirmed_text}".strip(),
+                            "confirmed": current.confirmed_text,
+                            "unconfirmed": current.unconfirmed_text,
+                        }
+                    )
+                continue
+            await wakeup.wait()
+            wakeup.clear()
+            overloaded = False
+
+    async def receive() -> None:  # noqa: C901
+        nonlocal utterance
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if (data := message.get("bytes")) is not None:
+                samples = np.frombuffer(data, dtype="<i2")
+                if resampler is not None:
+                    samples = resampler.process(samples)
+                utterance.append(samples)
+            elif (text := message.get("text")) is not None:
+                try:
+                    event_type = json.loads(text)["type"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    await ws.send_json({"type": "error", "message": f"Invalid message: {text[:100]}"})
+                    continue
+                if event_type == "commit":
+                    if resampler is not None:
+                        utterance.append(resampler.flush())
+                    utterance.committed_at = time.perf_counter()
+                    committed.append(utterance)
+                    utterance = Utterance(dictation_config)
+                elif event_type == "clear":
+                    if resampler is not None:
+                        resampler.reset()
+                    utterance = Utterance(dictation_config)
+                else:
+                    await ws.send_json({"type": "error", "message": f"Unknown message type: '{event_type}'"})
+                    continue
+            wakeup.set()
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            process_task = tg.create_task(process(), name="dictation_process")
+            await receive()
+            process_task.cancel()
+    except* WebSocketDisconnect:
+        pass
+    logger.info(f"Finished handling the dictation connection for '{model}'")
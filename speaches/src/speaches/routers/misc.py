@@ -3,14 +3,24 @@ from fastapi import (
     Response,
 )
 
-from speaches.dependencies import WhisperModelManagerDependency
+from speaches.dependencies import ModelPreloaderDependency, WhisperModelManagerDependency
+from speaches.metrics import metrics
 from speaches.model_aliases import ModelId
 
 router = APIRouter()
 
 
 @router.get("/health", tags=["diagnostic"])
-def health() -> Response:
+def health(model_preloader: ModelPreloaderDependency) -> Response:
+    if not model_preloader.ready.is_set():
+        return Response(status_code=503, content="Warming up")
+    # NOTE: a model that failed to preload is loaded again by the first request for it (which may well succeed), so the failure is reported but doesn't fail the health check. Otherwise, a single transient failure (i.e. a network error while downloading) would get the container restarted over and over by a liveness probe
+    if len(model_preloader.errors) > 0:
+        return Response(
+            status_code=200,
+            content="Degraded, failed to preload:\n"
+            + "\n".join(f"{model_id}: {error}" for model_id, error in model_preloader.errors.items()),
+        )
     return Response(status_code=200, content="OK")
 
 
@@ -22,6 +32,22 @@ def get_running_models(
     return {"models": list(model_manager.loaded_models.keys())}
 
 
+@router.get(
+    "/api/ps/replicas",
+    tags=["experimental"],
+    summary="Get the load state and queue depth of every replica of the loaded models.",
+)
+def get_model_replicas(
+    model_manager: WhisperModelManagerDependency,
+) -> dict[str, list[dict[str, int | bool]]]:
+    return model_manager.replica_stats()
+
+
+@router.get("/api/metrics", tags=["experimental"], summary="Get the values of the in-process metrics.")
+def get_metrics() -> dict[str, int | float]:
+    return metrics.snapshot()
+
+
 # FIX: support non-whisper models
 @router.post("/api/ps/{model_id:path}", tags=["experimental"], summary="Load a model into memory.")
 def load_model_route(model_manager: WhisperModelManagerDependency, model_id: ModelId) -> Response:
@@ -1,6 +1,9 @@
+import hashlib
+
 from fastapi import (
     APIRouter,
     HTTPException,
+    Request,
     Response,
 )
 from fastapi.responses import JSONResponse
@@ -11,6 +14,7 @@ from speaches.api_types import (
     Model,
     ModelTask,
 )
+from speaches.dependencies import RemoteModelCatalogDependency
 from speaches.executors.kokoro.utils import KokoroModel, KokoroModelVoice
 from speaches.executors.kokoro.utils import model_registry as kokoro_model_registry
 from speaches.executors.piper.utils import PiperModel
@@ -18,22 +22,48 @@ from speaches.executors.piper.utils import model_registry as piper_model_registr
 from speaches.executors.whisper.utils import model_registry as whisper_model_registry
 from speaches.hf_utils import delete_local_model_repo
 from speaches.model_aliases import ModelId
+from speaches.model_registry import ModelRegistrySnapshot
 
 router = APIRouter(tags=["models"])
 
 # TODO: should model aliases be listed?
 
 
+def make_etag(*parts: str) -> str:
+    return f'"{hashlib.sha1("|".join(parts).encode()).hexdigest()}"'  # noqa: S324
+
+
+def not_modified_response(request: Request, etag: str) -> Response | None:
+    """A `304 Not Modified` response if the client's `If-None-Match` header matches `etag`."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if "*" in tags or etag in tags:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+def snapshots_etag(endpoint: str, snapshots: list[ModelRegistrySnapshot]) -> str:
+    return make_etag(endpoint, *(snapshot.etag for snapshot in snapshots))
+
+
 # HACK: returning ListModelsResponse directly causes extra `Model` fields to be omitted
 @router.get("/v1/models", response_model=ListModelsResponse)
-def list_local_models(task: ModelTask | None = None) -> JSONResponse:
-    models: list[Model] = []
+def list_local_models(request: Request, task: ModelTask | None = None) -> Response:
+    snapshots: list[ModelRegistrySnapshot] = []
     if task is None or task == "text-to-speech":
-        models.extend(list(kokoro_model_registry.list_local_models()))
-        models.extend(list(piper_model_registry.list_local_models()))
+        snapshots.append(kokoro_model_registry.snapshot())
+        snapshots.append(piper_model_registry.snapshot())
     if task is None or task == "automatic-speech-recognition":
-        models.extend(list(whisper_model_registry.list_local_models()))
-    return JSONResponse(content={"data": [model.model_dump() for model in models], "object": "list"})
+        snapshots.append(whisper_model_registry.snapshot())
+    etag = snapshots_etag(f"models:{task}", snapshots)
+    if (response := not_modified_response(request, etag)) is not None:
+        return response
+    models: list[Model] = [model for snapshot in snapshots for model in snapshot.models]
+    return JSONResponse(
+        content={"data": [model.model_dump() for model in models], "object": "list"}, headers={"ETag": etag}
+    )
 
 
 class ListAudioModelsResponse(BaseModel):
@@ -43,11 +73,15 @@ class ListAudioModelsResponse(BaseModel):
 
 # HACK: returning ListModelsResponse directly causes extra `Model` fields to be omitted
 @router.get("/v1/audio/models", response_model=ListAudioModelsResponse)
-def list_local_audio_models() -> JSONResponse:
-    models: list[Model] = []
-    models.extend(list(kokoro_model_registry.list_local_models()))
-    models.extend(list(piper_model_registry.list_local_models()))
-    return JSONResponse(content={"models": [model.model_dump() for model in models], "object": "list"})
+def list_local_audio_models(request: Request) -> Response:
+    snapshots = [kokoro_model_registry.snapshot(), piper_model_registry.snapshot()]
+    etag = snapshots_etag("audio_models", snapshots)
+    if (response := not_modified_response(request, etag)) is not None:
+        return response
+    models: list[Model] = [model for snapshot in snapshots for model in snapshot.models]
+    return JSONResponse(
+        content={"models": [model.model_dump() for model in models], "object": "list"}, headers={"ETag": etag}
+    )
 
 
 class ListVoicesResponse(BaseModel):
@@ -56,78 +90,84 @@ class ListVoicesResponse(BaseModel):
 
 # HACK: returning ListModelsResponse directly causes extra `Model` fields to be omitted
 @router.get("/v1/audio/voices", response_model=ListModelsResponse)
-def list_local_audio_voices() -> JSONResponse:
-    models: list[KokoroModel | PiperModel] = []
-    models.extend(list(kokoro_model_registry.list_local_models()))
-    models.extend(list(piper_model_registry.list_local_models()))
-    voices = [voice for model in models for voice in model.voices]
-    return JSONResponse(content={"voices": [voice.model_dump() for voice in voices], "object": "list"})
+def list_local_audio_voices(request: Request) -> Response:
+    snapshots: list[ModelRegistrySnapshot[KokoroModel] | ModelRegistrySnapshot[PiperModel]] = [
+        kokoro_model_registry.snapshot(),
+        piper_model_registry.snapshot(),
+    ]
+    etag = snapshots_etag("audio_voices", snapshots)
+    if (response := not_modified_response(request, etag)) is not None:
+        return response
+    voices = [voice for snapshot in snapshots for model in snapshot.models for voice in model.voices]
+    return JSONResponse(
+        content={"voices": [voice.model_dump() for voice in voices], "object": "list"}, headers={"ETag": etag}
+    )
+
+
+# NOTE: keyed by the registry names returned by `RemoteModelCatalog.classify`
+MODEL_REGISTRIES = {
+    "kokoro": kokoro_model_registry,
+    "piper": piper_model_registry,
+    "whisper": whisper_model_registry,
+}
+
+
+def download_local_model(remote_model_catalog: RemoteModelCatalogDependency, model_id: str) -> Model | None:
+    """Download a model that isn't available locally. `None` if no remote registry has it or if its files were already there."""
+    # 检查远程模型并下载
+    try:
+        registry_name = remote_model_catalog.classify(model_id)
+        if registry_name is None:
+            print(f"❌ 模型 '{model_id}' 在远程注册表中也未找到")
+            return None
+        registry = MODEL_REGISTRIES[registry_name]
+        print(f"正在下载 {registry_name.capitalize()} 模型: {model_id}")
+        if not registry.download_model_files_if_not_exist(model_id):
+            return None
+        # 重新获取本地模型列表
+        model = registry.get_local_model(model_id)
+    except Exception as e:
+        print(f"❌ 下载模型 '{model_id}' 失败: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to download model '{model_id}': {e!s}") from e
+    if model is not None:
+        print(f"✅ 模型 '{model_id}' 下载完成")
+    return model
 
 
 # TODO: this is very naive implementation. It should be improved
 # NOTE: without `response_model` and `JSONResponse` extra fields aren't included in the response
 @router.get("/v1/models/{model_id:path}", response_model=Model)
-def get_local_model(model_id: ModelId) -> JSONResponse:
-    models: list[Model] = []
-    models.extend(list(kokoro_model_registry.list_local_models()))
-    models.extend(list(piper_model_registry.list_local_models()))
-    models.extend(list(whisper_model_registry.list_local_models()))
-    
+def get_local_model(
+    request: Request, remote_model_catalog: RemoteModelCatalogDependency, model_id: ModelId
+) -> Response:
+    snapshots = [kokoro_model_registry.snapshot(), piper_model_registry.snapshot(), whisper_model_registry.snapshot()]
+
     # 首先检查本地是否有模型
-    for model in models:
-        if model.id == model_id:
-            return JSONResponse(content=model.model_dump())
-    
+    for snapshot in snapshots:
+        for model in snapshot.models:
+            if model.id == model_id:
+                etag = make_etag(model_id, snapshot.etag)
+                if (response := not_modified_response(request, etag)) is not None:
+                    return response
+                return JSONResponse(content=model.model_dump(), headers={"ETag": etag})
+
     # 如果本地没有，尝试自动下载
     print(f"模型 '{model_id}' 不存在，尝试自动下载...")
-    
-    try:
-        # 检查远程模型并下载
-        if model_id in [model.id for model in kokoro_model_registry.list_remote_models()]:
-            print(f"正在下载 Kokoro 模型: {model_id}")
-            was_downloaded = kokoro_model_registry.download_model_files_if_not_exist(model_id)
-            if was_downloaded:
-                # 重新获取本地模型列表
-                for model in kokoro_model_registry.list_local_models():
-                    if model.id == model_id:
-                        print(f"✅ 模型 '{model_id}' 下载完成")
-                        return JSONResponse(content=model.model_dump())
-                        
-        elif model_id in [model.id for model in piper_model_registry.list_remote_models()]:
-            print(f"正在下载 Piper 模型: {model_id}")
-            was_downloaded = piper_model_registry.download_model_files_if_not_exist(model_id)
-            if was_downloaded:
-                for model in piper_model_registry.list_local_models():
-                    if model.id == model_id:
-                        print(f"✅ 模型 '{model_id}' 下载完成")
-                        return JSONResponse(content=model.model_dump())
-                        
-        elif model_id in [model.id for model in whisper_model_registry.list_remote_models()]:
-            print(f"正在下载 Whisper 模型: {model_id}")
-            was_downloaded = whisper_model_registry.download_model_files_if_not_exist(model_id)
-            if was_downloaded:
-                for model in whisper_model_registry.list_local_models():
-                    if model.id == model_id:
-                        print(f"✅ 模型 '{model_id}' 下载完成")
-                        return JSONResponse(content=model.model_dump())
-        else:
-            print(f"❌ 模型 '{model_id}' 在远程注册表中也未找到")
-            
-    except Exception as e:
-        print(f"❌ 下载模型 '{model_id}' 失败: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to download model '{model_id}': {str(e)}")
-    
+    downloaded_model = download_local_model(remote_model_catalog, model_id)
+    if downloaded_model is not None:
+        return JSONResponse(content=downloaded_model.model_dump())
     raise HTTPException(status_code=404, detail=f"Model '{model_id}' not found and download failed")
 
 
 # NOTE: without `response_model` and `JSONResponse` extra fields aren't included in the response
 @router.post("/v1/models/{model_id:path}")
-def download_remote_model(model_id: ModelId) -> Response:
-    if model_id in [model.id for model in kokoro_model_registry.list_remote_models()]:
+def download_remote_model(remote_model_catalog: RemoteModelCatalogDependency, model_id: ModelId) -> Response:
+    registry_name = remote_model_catalog.classify(model_id)
+    if registry_name == "kokoro":
         was_downloaded = kokoro_model_registry.download_model_files_if_not_exist(model_id)
-    elif model_id in [model.id for model in piper_model_registry.list_remote_models()]:
+    elif registry_name == "piper":
         was_downloaded = piper_model_registry.download_model_files_if_not_exist(model_id)
-    elif model_id in [model.id for model in whisper_model_registry.list_remote_models()]:
+    elif registry_name == "whisper":
         was_downloaded = whisper_model_registry.download_model_files_if_not_exist(model_id)
     else:
         raise HTTPException(status_code=404, detail=f"Model '{model_id}' not found")
@@ -150,11 +190,13 @@ def delete_model(model_id: ModelId) -> Response:
 
 # HACK: returning ListModelsResponse directly causes extra `Model` fields to be omitted
 @router.get("/v1/registry", response_model=ListModelsResponse)
-def get_remote_models(task: ModelTask | None = None) -> JSONResponse:
+def get_remote_models(
+    remote_model_catalog: RemoteModelCatalogDependency, task: ModelTask | None = None
+) -> JSONResponse:
     models: list[Model] = []
     if task is None or task == "text-to-speech":
-        models.extend(list(kokoro_model_registry.list_remote_models()))
-        models.extend(list(piper_model_registry.list_remote_models()))
+        models.extend(remote_model_catalog.list_models("kokoro"))
+        models.extend(remote_model_catalog.list_models("piper"))
     if task is None or task == "automatic-speech-recognition":
-        models.extend(list(whisper_model_registry.list_remote_models()))
+        models.extend(remote_model_catalog.list_models("whisper"))
     return JSONResponse(content={"data": [model.model_dump() for model in models], "object": "list"})
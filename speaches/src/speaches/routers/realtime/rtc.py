@@ -21,14 +21,15 @@ from fastapi import (
     Request,
     Response,
 )
-import numpy as np
 from openai import AsyncOpenAI
 from openai.types.beta.realtime.error_event import Error
 from pydantic import ValidationError
 
+from speaches.audio import PcmBuffer
 from speaches.dependencies import (
     ConfigDependency,
     TranscriptionClientDependency,
+    VadBatcherDependency,
 )
 from speaches.realtime.context import SessionContext
 from speaches.realtime.conversation_event_router import event_router as conversation_event_router
@@ -169,7 +170,7 @@ def message_handler(ctx: SessionContext, message: str) -> None:
 
 async def audio_receiver(ctx: SessionContext, track: RemoteStreamTrack) -> None:
     # Initialize buffer to store audio data
-    buffer = np.array([], dtype=np.int16)
+    buffer = PcmBuffer(capacity=2 * MIN_BUFFER_SIZE)
 
     while True:
         frames = await track.recv()
@@ -185,12 +186,12 @@ async def audio_receiver(ctx: SessionContext, track: RemoteStreamTrack) -> None:
         # Accumulate audio data
         for frame in frames:
             arr = frame.to_ndarray()
-            buffer = np.append(buffer, arr.flatten())  # Flatten and append to buffer
+            buffer.append(arr.flatten())
 
             # When buffer reaches or exceeds target size, emit event
             if len(buffer) >= MIN_BUFFER_SIZE:
                 # Convert to bytes and emit event
-                audio_bytes = buffer.tobytes()
+                audio_bytes = buffer.samples.tobytes()
                 assert len(audio_bytes) == len(buffer) * 2, "Audio sample width is not 2 bytes"
                 ctx.pubsub.publish_nowait(
                     InputAudioBufferAppendEvent(
@@ -199,7 +200,7 @@ async def audio_receiver(ctx: SessionContext, track: RemoteStreamTrack) -> None:
                     )
                 )
 
-                buffer = np.array([], dtype=np.int16)
+                buffer = PcmBuffer(capacity=2 * MIN_BUFFER_SIZE)
 
 
 def datachannel_handler(ctx: SessionContext, channel: RTCDataChannel) -> None:
@@ -261,6 +262,7 @@ async def realtime_webrtc(
     model: Annotated[str, Query(...)],
     config: ConfigDependency,
     transcription_client: TranscriptionClientDependency,
+    vad_batcher: VadBatcherDependency,
 ) -> Response:
     completion_client = AsyncOpenAI(
         base_url=f"http://{config.host}:{config.port}/v1",
@@ -271,6 +273,7 @@ async def realtime_webrtc(
         transcription_client=transcription_client,
         completion_client=completion_client,
         session=create_session_object_configuration(model),
+        vad_batcher=vad_batcher,
     )
     rtc_session_tasks[ctx.session.id] = set()
 
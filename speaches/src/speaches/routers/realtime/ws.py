@@ -10,6 +10,7 @@ from openai import AsyncOpenAI
 from speaches.dependencies import (
     ConfigDependency,
     TranscriptionClientDependency,
+    VadBatcherDependency,
 )
 from speaches.realtime.context import SessionContext
 from speaches.realtime.conversation_event_router import event_router as conversation_event_router
@@ -56,6 +57,7 @@ async def realtime(
     model: str,
     config: ConfigDependency,
     transcription_client: TranscriptionClientDependency,
+    vad_batcher: VadBatcherDependency,
 ) -> None:
     await ws.accept()
     logger.info("Accepted websocket connection")
@@ -69,6 +71,7 @@ async def realtime(
         transcription_client=transcription_client,
         completion_client=completion_client,
         session=create_session_object_configuration(model),
+        vad_batcher=vad_batcher,
     )
     message_manager = WsServerMessageManager(ctx.pubsub)
     async with asyncio.TaskGroup() as tg:
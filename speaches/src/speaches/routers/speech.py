@@ -1,19 +1,23 @@
+from collections.abc import AsyncGenerator, AsyncIterator, Callable, Generator, Iterator
 import logging
 from typing import Literal
 
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
-from huggingface_hub.utils._cache_manager import _scan_cached_repo
 from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
 
 from speaches.audio import convert_audio_format
-from speaches.dependencies import KokoroModelManagerDependency, PiperModelManagerDependency
+from speaches.dependencies import (
+    AdmissionControlDependency,
+    KokoroModelManagerDependency,
+    PiperModelManagerDependency,
+)
 from speaches.executors.kokoro import utils as kokoro_utils
 from speaches.executors.piper import utils as piper_utils
 from speaches.hf_utils import (
     MODEL_CARD_DOESNT_EXISTS_ERROR_MESSAGE,
-    get_model_card_data_from_cached_repo_info,
-    get_model_repo_path,
+    get_hf_cache_index,
 )
 from speaches.model_aliases import ModelId
 from speaches.text_utils import strip_emojis, strip_markdown_emphasis
@@ -52,21 +56,38 @@ class CreateSpeechRequestBody(BaseModel):
     """Desired sample rate to convert the generated audio to. If not provided, the model's default sample rate will be used."""
 
 
+def release_after(audio: Iterator[bytes], release: Callable[[], None]) -> Generator[bytes]:
+    """Call `release` once the stream is done, including when it fails or the client disconnects. Starlette skips the response's background task in those cases."""
+    try:
+        yield from audio
+    finally:
+        release()
+
+
+async def release_after_async(audio: AsyncIterator[bytes], release: Callable[[], None]) -> AsyncGenerator[bytes]:
+    """Same as `release_after`, for an async stream."""
+    try:
+        async for audio_bytes in audio:
+            yield audio_bytes
+    finally:
+        release()
+
+
 # https://platform.openai.com/docs/api-reference/audio/createSpeech
 @router.post("/v1/audio/speech")
-async def synthesize(
+async def synthesize(  # noqa: C901, PLR0912
     piper_model_manager: PiperModelManagerDependency,
     kokoro_model_manager: KokoroModelManagerDependency,
+    admission_control: AdmissionControlDependency,
     body: CreateSpeechRequestBody,
 ) -> StreamingResponse:
-    model_repo_path = get_model_repo_path(body.model)
-    if model_repo_path is None:
+    cached_repo = get_hf_cache_index().get(body.model)
+    if cached_repo is None:
         raise HTTPException(
             status_code=404,
             detail=f"Model '{body.model}' is not installed locally. You can download the model using `POST /v1/models`",
         )
-    cached_repo_info = _scan_cached_repo(model_repo_path)
-    model_card_data = get_model_card_data_from_cached_repo_info(cached_repo_info)
+    model_card_data = cached_repo.model_card_data
     if model_card_data is None:
         raise HTTPException(
             status_code=500,
@@ -76,7 +97,9 @@ async def synthesize(
     body.input = strip_emojis(body.input)
     body.input = strip_markdown_emphasis(body.input)
 
-    if kokoro_utils.hf_model_filter.passes_filter(model_card_data):
+    # NOTE: invalid requests are rejected before they queue for a speech slot
+    is_kokoro = kokoro_utils.hf_model_filter.passes_filter(model_card_data)
+    if is_kokoro:
         if body.speed < 0.5 or body.speed > 2.0:
             raise HTTPException(
                 status_code=422,
@@ -93,22 +116,6 @@ async def synthesize(
                     status_code=422,
                     detail=f"Voice '{body.voice}' is not supported. Supported voices: {kokoro_utils.VOICES}",
                 )
-        with kokoro_model_manager.load_model(body.model) as tts:
-            audio_generator = kokoro_utils.generate_audio(
-                tts,
-                body.input,
-                body.voice,
-                speed=body.speed,
-                sample_rate=body.sample_rate,
-            )
-            if body.response_format != "pcm":
-                audio_generator = (
-                    convert_audio_format(
-                        audio_bytes, body.sample_rate or kokoro_utils.SAMPLE_RATE, body.response_format
-                    )
-                    async for audio_bytes in audio_generator
-                )
-            return StreamingResponse(audio_generator, media_type=f"audio/{body.response_format}")
     elif piper_utils.hf_model_filter.passes_filter(model_card_data):
         if body.speed < 0.25 or body.speed > 4.0:
             raise HTTPException(
@@ -116,21 +123,54 @@ async def synthesize(
                 detail=f"Speed must be between 0.25 and 4.0, got {body.speed}",
             )
         # TODO: maybe check voice
-        with piper_model_manager.load_model(body.model) as piper_tts:
-            # TODO: async generator
-            audio_generator = piper_utils.generate_audio(
-                piper_tts, body.input, speed=body.speed, sample_rate=body.sample_rate
-            )
-            if body.response_format != "pcm":
-                audio_generator = (
-                    convert_audio_format(
-                        audio_bytes, body.sample_rate or piper_tts.config.sample_rate, body.response_format
-                    )
-                    for audio_bytes in audio_generator
-                )
-            return StreamingResponse(audio_generator, media_type=f"audio/{body.response_format}")
     else:
         raise HTTPException(
             status_code=404,
             detail=f"Model '{body.model}' is not supported. If you think this is a mistake, please open an issue.",
         )
+
+    permit = await admission_control.speech.admit(body.model, len(body.input))
+    # NOTE: the permit is held until the audio is fully streamed (or the stream failed or got cancelled)
+    try:
+        if is_kokoro:
+            with kokoro_model_manager.load_model(body.model) as tts:
+                audio_generator = kokoro_utils.generate_audio(
+                    tts,
+                    body.input,
+                    body.voice,
+                    speed=body.speed,
+                    sample_rate=body.sample_rate,
+                )
+                if body.response_format != "pcm":
+                    audio_generator = (
+                        convert_audio_format(
+                            audio_bytes, body.sample_rate or kokoro_utils.SAMPLE_RATE, body.response_format
+                        )
+                        async for audio_bytes in audio_generator
+                    )
+                return StreamingResponse(
+                    release_after_async(audio_generator, permit.release),
+                    media_type=f"audio/{body.response_format}",
+                    background=BackgroundTask(permit.release),
+                )
+        else:
+            with piper_model_manager.load_model(body.model) as piper_tts:
+                # TODO: async generator
+                audio_generator = piper_utils.generate_audio(
+                    piper_tts, body.input, speed=body.speed, sample_rate=body.sample_rate
+                )
+                if body.response_format != "pcm":
+                    audio_generator = (
+                        convert_audio_format(
+                            audio_bytes, body.sample_rate or piper_tts.config.sample_rate, body.response_format
+                        )
+                        for audio_bytes in audio_generator
+                    )
+                return StreamingResponse(
+                    release_after(audio_generator, permit.release),
+                    media_type=f"audio/{body.response_format}",
+                    background=BackgroundTask(permit.release),
+                )
+    except BaseException:
+        permit.release()
+        raise
@@ -1,18 +1,21 @@
-import asyncio
-from collections.abc import Generator, Iterable
+from collections.abc import AsyncGenerator, Callable, Iterable
+from concurrent.futures import Executor
+from contextlib import ExitStack
 import logging
 from typing import Annotated, Literal
 
 from fastapi import (
     APIRouter,
+    Depends,
     Form,
+    Header,
     HTTPException,
     Request,
     Response,
 )
 from fastapi.responses import StreamingResponse
-from faster_whisper.transcribe import BatchedInferencePipeline, TranscriptionInfo
-from huggingface_hub.utils._cache_manager import _scan_cached_repo
+from faster_whisper.transcribe import BatchedInferencePipeline, Segment, TranscriptionInfo
+from starlette.background import BackgroundTask
 
 from speaches.api_types import (
     DEFAULT_TIMESTAMP_GRANULARITIES,
@@ -20,17 +23,37 @@ from speaches.api_types import (
     CreateTranscriptionResponseJson,
     CreateTranscriptionResponseVerboseJson,
     TimestampGranularities,
-    TranscriptionSegment,
 )
-from speaches.dependencies import AudioFileDependency, ConfigDependency, WhisperModelManagerDependency
+from speaches.audio import decode_audio_chunks
+from speaches.config import SAMPLES_PER_SECOND, Priority
+from speaches.dependencies import (
+    AdmissionControlDependency,
+    AudioFileDependency,
+    ConfigDependency,
+    InferenceExecutorDependency,
+    LongFormTranscriberDependency,
+    PrioritySchedulerDependency,
+    RequestPriorityDependency,
+    TranscriptionCacheDependency,
+    WhisperBatchSchedulerDependency,
+    WhisperModelManagerDependency,
+    authenticated_api_key,
+)
 from speaches.executors.whisper import utils as whisper_utils
+from speaches.executors.whisper.batching import MAX_BATCHED_SAMPLES
 from speaches.hf_utils import (
     MODEL_CARD_DOESNT_EXISTS_ERROR_MESSAGE,
-    get_model_card_data_from_cached_repo_info,
-    get_model_repo_path,
+    get_model_card_data,
 )
 from speaches.model_aliases import ModelId
+from speaches.segment_stream import SegmentStream
 from speaches.text_utils import segments_to_srt, segments_to_text, segments_to_vtt
+from speaches.transcription_serialization import (
+    json_response_body,
+    verbose_json_response_body,
+    verbose_json_segment_body,
+)
+from speaches.upload_stream import UploadAbortedError, UploadPipe, pump_upload
 
 logger = logging.getLogger(__name__)
 
@@ -43,7 +66,7 @@ DEFAULT_RESPONSE_FORMAT: ResponseFormat = "json"
 
 
 def segments_to_response(
-    segments: Iterable[TranscriptionSegment],
+    segments: Iterable[Segment],
     transcription_info: TranscriptionInfo,
     response_format: ResponseFormat,
 ) -> Response:
@@ -52,15 +75,9 @@ def segments_to_response(
         case "text":
             return Response(segments_to_text(segments), media_type="text/plain")
         case "json":
-            return Response(
-                CreateTranscriptionResponseJson.from_segments(segments).model_dump_json(),
-                media_type="application/json",
-            )
+            return Response(json_response_body(segments), media_type="application/json")
         case "verbose_json":
-            return Response(
-                CreateTranscriptionResponseVerboseJson.from_segments(segments, transcription_info).model_dump_json(),
-                media_type="application/json",
-            )
+            return Response(verbose_json_response_body(segments, transcription_info), media_type="application/json")
         case "vtt":
             return Response(
                 "".join(segments_to_vtt(segment, i) for i, segment in enumerate(segments)), media_type="text/vtt"
@@ -76,37 +93,72 @@ def format_as_sse(data: str) -> str:
 
 
 def segments_to_streaming_response(
-    segments: Iterable[TranscriptionSegment],
-    transcription_info: TranscriptionInfo,
+    segments: Iterable[Segment] | SegmentStream[Segment],
+    transcription_info: TranscriptionInfo | None,
     response_format: ResponseFormat,
+    release: Callable[[], None] | None = None,
+    executor: Executor | None = None,
 ) -> StreamingResponse:
-    def segment_responses() -> Generator[str, None, None]:
-        for i, segment in enumerate(segments):
+    """`segments` are consumed (i.e. decoded) on a worker thread (of `executor`, if given) while the response is being sent. `release` is called once decoding has finished or was abandoned because the client disconnected.
+
+    An already created `SegmentStream` is used as is. `transcription_info` is only needed for `verbose_json`.
+    """
+    segment_stream = (
+        segments if isinstance(segments, SegmentStream) else SegmentStream(segments, release, executor=executor)
+    )
+
+    async def segment_responses() -> AsyncGenerator[str]:
+        i = 0
+        async for segment in segment_stream:
             if response_format == "text":
                 data = segment.text
             elif response_format == "json":
-                data = CreateTranscriptionResponseJson.from_segments([segment]).model_dump_json()
+                data = json_response_body([segment]).decode()
             elif response_format == "verbose_json":
-                data = CreateTranscriptionResponseVerboseJson.from_segment(
-                    segment, transcription_info
-                ).model_dump_json()
+                assert transcription_info is not None
+                data = verbose_json_segment_body(segment, transcription_info).decode()
             elif response_format == "vtt":
                 data = segments_to_vtt(segment, i)
             elif response_format == "srt":
                 data = segments_to_srt(segment, i)
+            i += 1
             yield format_as_sse(data)
 
-    return StreamingResponse(segment_responses(), media_type="text/event-stream")
+    # NOTE: the background task releases the model if the response never got to iterate the stream
+    return StreamingResponse(
+        segment_responses(), media_type="text/event-stream", background=BackgroundTask(segment_stream.close)
+    )
+
+
+def transcription_response(
+    segments: Iterable[Segment],
+    transcription_info: TranscriptionInfo,
+    response_format: ResponseFormat,
+    *,
+    stream: bool,
+    release: Callable[[], None] | None = None,
+    executor: Executor | None = None,
+) -> Response | StreamingResponse:
+    if stream:
+        return segments_to_streaming_response(segments, transcription_info, response_format, release, executor)
+    return segments_to_response(segments, transcription_info, response_format)
 
 
 @router.post(
     "/v1/audio/translations",
     response_model=str | CreateTranscriptionResponseJson | CreateTranscriptionResponseVerboseJson,
 )
-def translate_file(
+async def translate_file(
     config: ConfigDependency,
     model_manager: WhisperModelManagerDependency,
+    batch_scheduler: WhisperBatchSchedulerDependency,
+    long_form_transcriber: LongFormTranscriberDependency,
+    transcription_cache: TranscriptionCacheDependency,
+    inference_executor: InferenceExecutorDependency,
+    admission_control: AdmissionControlDependency,
+    priority_scheduler: PrioritySchedulerDependency,
     audio: AudioFileDependency,
+    priority: RequestPriorityDependency,
     model: Annotated[ModelId, Form()],
     prompt: Annotated[str | None, Form()] = None,
     response_format: Annotated[ResponseFormat, Form()] = DEFAULT_RESPONSE_FORMAT,
@@ -117,29 +169,95 @@ def translate_file(
     # Use config default if vad_filter not explicitly provided
     effective_vad_filter = vad_filter if vad_filter is not None else config._unstable_vad_filter  # noqa: SLF001
 
+    await priority_scheduler.wait_for_interactive(priority)
+    # NOTE: registered before admission, so that bulk requests already yield while this one is queued
+    running_request = priority_scheduler.register(priority)
     try:
-        with model_manager.load_model(model) as whisper:
-            whisper_model = BatchedInferencePipeline(model=whisper) if config.whisper.use_batched_mode else whisper
-            segments, transcription_info = whisper_model.transcribe(
-                audio,
-                task="translate",
-                initial_prompt=prompt,
-                temperature=temperature,
-                vad_filter=effective_vad_filter,
-            )
-            segments = TranscriptionSegment.from_faster_whisper_segments(segments)
-
-            if stream:
-                return segments_to_streaming_response(segments, transcription_info, response_format)
-            else:
-                return segments_to_response(segments, transcription_info, response_format)
-                
-    except Exception as e:
-        logger.error(f"Failed to load or process model '{model}' for translation: {e}")
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to load model '{model}': {str(e)}",
+        permit = await admission_control.transcription.admit(model, len(audio) / SAMPLES_PER_SECOND, priority)
+    except BaseException:
+        running_request.release()
+        raise
+
+    # NOTE: everything below blocks (model loading, inference), so it's run on the inference workers rather than on the event loop
+    def run() -> Response | StreamingResponse:
+        cache_key = transcription_cache.make_key(
+            audio,
+            model=model,
+            task="translate",
+            prompt=prompt,
+            temperature=temperature,
+            vad_filter=effective_vad_filter,
         )
+        try:
+            with ExitStack() as stack:
+                stack.callback(running_request.release)
+                stack.callback(permit.release)
+                if (cached_result := transcription_cache.get(cache_key)) is not None:
+                    segments, transcription_info = cached_result
+                    return transcription_response(segments, transcription_info, response_format, stream=stream)
+                # NOTE: the batch scheduler and the long-form transcriber acquire replicas themselves, holding one here as well would only keep it busy
+                if config.whisper.batching.enabled and len(audio) <= MAX_BATCHED_SAMPLES:
+                    segments, transcription_info = batch_scheduler.transcribe(
+                        model,
+                        audio,
+                        task="translate",
+                        initial_prompt=prompt,
+                        temperature=temperature,
+                        vad_filter=effective_vad_filter,
+                    )
+                elif (
+                    config.whisper.long_form.enabled
+                    and len(audio) > config.whisper.long_form.min_duration_seconds * SAMPLES_PER_SECOND
+                ):
+                    segments, transcription_info = long_form_transcriber.transcribe(
+                        model,
+                        audio,
+                        task="translate",
+                        initial_prompt=prompt,
+                        temperature=temperature,
+                        vad_filter=effective_vad_filter,
+                        priority=priority,
+                    )
+                else:
+                    replica = model_manager.load_model(model)
+                    whisper = stack.enter_context(replica)
+                    whisper_model = (
+                        BatchedInferencePipeline(model=whisper) if config.whisper.use_batched_mode else whisper
+                    )
+                    segments, transcription_info = whisper_model.transcribe(
+                        audio,
+                        task="translate",
+                        initial_prompt=prompt,
+                        temperature=temperature,
+                        vad_filter=effective_vad_filter,
+                    )
+                    segments = priority_scheduler.gate(segments, priority, replica.lent, inference_executor.paused)
+                segments = transcription_cache.record(cache_key, segments, transcription_info)
+                if stream:
+                    # the model reference (and the admission permit) is held until the stream is done decoding rather than until the response is returned
+                    return transcription_response(
+                        segments,
+                        transcription_info,
+                        response_format,
+                        stream=True,
+                        release=stack.pop_all().close,
+                        executor=inference_executor,
+                    )
+                return transcription_response(segments, transcription_info, response_format, stream=False)
+        except Exception as e:
+            logger.error(f"Failed to load or process model '{model}' for translation: {e}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to load model '{model}': {str(e)}",
+            )
+
+    try:
+        return await inference_executor.run_with_priority(priority, run)
+    except BaseException:
+        # `run` releases these itself (or hands them over to the streaming response), unless it never got to run
+        permit.release()
+        running_request.release()
+        raise
 
 
 # HACK: Since Form() doesn't support `alias`, we need to use a workaround.
@@ -160,21 +278,24 @@ async def get_timestamp_granularities(request: Request) -> TimestampGranularitie
     "/v1/audio/transcriptions",
     response_model=str | CreateTranscriptionResponseJson | CreateTranscriptionResponseVerboseJson,
 )
-def transcribe_file(
+async def transcribe_file(
     config: ConfigDependency,
     model_manager: WhisperModelManagerDependency,
-    request: Request,
+    batch_scheduler: WhisperBatchSchedulerDependency,
+    long_form_transcriber: LongFormTranscriberDependency,
+    transcription_cache: TranscriptionCacheDependency,
+    inference_executor: InferenceExecutorDependency,
+    admission_control: AdmissionControlDependency,
+    priority_scheduler: PrioritySchedulerDependency,
     audio: AudioFileDependency,
+    priority: RequestPriorityDependency,
+    # NOTE: `Form(alias="timestamp_granularities[]")` doesn't actually work, so the (already parsed) form is read directly
+    timestamp_granularities: Annotated[TimestampGranularities, Depends(get_timestamp_granularities)],
     model: Annotated[ModelId, Form()],
     language: Annotated[str | None, Form()] = None,
     prompt: Annotated[str | None, Form()] = None,
     response_format: Annotated[ResponseFormat, Form()] = DEFAULT_RESPONSE_FORMAT,
     temperature: Annotated[float, Form()] = 0.0,
-    timestamp_granularities: Annotated[
-        TimestampGranularities,
-        # WARN: `alias` doesn't actually work.
-        Form(alias="timestamp_granularities[]"),
-    ] = ["segment"],
     stream: Annotated[bool, Form()] = False,
     hotwords: Annotated[str | None, Form()] = None,
     vad_filter: Annotated[bool | None, Form()] = None,
@@ -182,46 +303,199 @@ def transcribe_file(
     # Use config default if vad_filter not explicitly provided
     effective_vad_filter = vad_filter if vad_filter is not None else config._unstable_vad_filter  # noqa: SLF001
 
-    timestamp_granularities = asyncio.run(get_timestamp_granularities(request))
     if timestamp_granularities != DEFAULT_TIMESTAMP_GRANULARITIES and response_format != "verbose_json":
         logger.warning(
             "It only makes sense to provide `timestamp_granularities[]` when `response_format` is set to `verbose_json`. See https://platform.openai.com/docs/api-reference/audio/createTranscription#audio-createtranscription-timestamp_granularities."
         )
 
-    # 尝试加载模型，如果不存在会自动下载
+    await priority_scheduler.wait_for_interactive(priority)
+    # NOTE: registered before admission, so that bulk requests already yield while this one is queued
+    running_request = priority_scheduler.register(priority)
     try:
-        with model_manager.load_model(model) as whisper:
-            # 验证模型是否符合过滤器要求
-            model_repo_path = get_model_repo_path(model)
-            if model_repo_path is not None:
-                cached_repo_info = _scan_cached_repo(model_repo_path)
-                model_card_data = get_model_card_data_from_cached_repo_info(cached_repo_info)
+        permit = await admission_control.transcription.admit(model, len(audio) / SAMPLES_PER_SECOND, priority)
+    except BaseException:
+        running_request.release()
+        raise
+
+    # NOTE: everything below blocks (model loading, inference), so it's run on the inference workers rather than on the event loop
+    def run() -> Response | StreamingResponse:
+        cache_key = transcription_cache.make_key(
+            audio,
+            model=model,
+            task="transcribe",
+            language=language,
+            prompt=prompt,
+            temperature=temperature,
+            word_timestamps="word" in timestamp_granularities,
+            hotwords=hotwords,
+            vad_filter=effective_vad_filter,
+        )
+        # 尝试加载模型，如果不存在会自动下载
+        try:
+            with ExitStack() as stack:
+                stack.callback(running_request.release)
+                stack.callback(permit.release)
+                # 验证模型是否符合过滤器要求
+                model_card_data = get_model_card_data(model)
                 if model_card_data is not None and not whisper_utils.hf_model_filter.passes_filter(model_card_data):
                     raise HTTPException(
                         status_code=404,
                         detail=f"Model '{model}' is not supported. If you think this is a mistake, please open an issue.",
                     )
-            whisper_model = BatchedInferencePipeline(model=whisper) if config.whisper.use_batched_mode else whisper
-            segments, transcription_info = whisper_model.transcribe(
-                audio,
-                task="transcribe",
-                language=language,
-                initial_prompt=prompt,
-                word_timestamps="word" in timestamp_granularities,
-                temperature=temperature,
-                vad_filter=effective_vad_filter,
-                hotwords=hotwords,
+                if (cached_result := transcription_cache.get(cache_key)) is not None:
+                    segments, transcription_info = cached_result
+                    return transcription_response(segments, transcription_info, response_format, stream=stream)
+                # NOTE: the batch scheduler and the long-form transcriber acquire replicas themselves, holding one here as well would only keep it busy
+                if config.whisper.batching.enabled and len(audio) <= MAX_BATCHED_SAMPLES:
+                    segments, transcription_info = batch_scheduler.transcribe(
+                        model,
+                        audio,
+                        task="transcribe",
+                        language=language,
+                        initial_prompt=prompt,
+                        word_timestamps="word" in timestamp_granularities,
+                        temperature=temperature,
+                        vad_filter=effective_vad_filter,
+                        hotwords=hotwords,
+                    )
+                elif (
+                    config.whisper.long_form.enabled
+                    and len(audio) > config.whisper.long_form.min_duration_seconds * SAMPLES_PER_SECOND
+                ):
+                    segments, transcription_info = long_form_transcriber.transcribe(
+                        model,
+                        audio,
+                        task="transcribe",
+                        language=language,
+                        initial_prompt=prompt,
+                        word_timestamps="word" in timestamp_granularities,
+                        temperature=temperature,
+                        vad_filter=effective_vad_filter,
+                        hotwords=hotwords,
+                        priority=priority,
+                    )
+                else:
+                    replica = model_manager.load_model(model)
+                    whisper = stack.enter_context(replica)
+                    whisper_model = (
+                        BatchedInferencePipeline(model=whisper) if config.whisper.use_batched_mode else whisper
+                    )
+                    segments, transcription_info = whisper_model.transcribe(
+                        audio,
+                        task="transcribe",
+                        language=language,
+                        initial_prompt=prompt,
+                        word_timestamps="word" in timestamp_granularities,
+                        temperature=temperature,
+                        vad_filter=effective_vad_filter,
+                        hotwords=hotwords,
+                    )
+                    segments = priority_scheduler.gate(segments, priority, replica.lent, inference_executor.paused)
+                segments = transcription_cache.record(cache_key, segments, transcription_info)
+                if stream:
+                    # the model reference (and the admission permit) is held until the stream is done decoding rather than until the response is returned
+                    return transcription_response(
+                        segments,
+                        transcription_info,
+                        response_format,
+                        stream=True,
+                        release=stack.pop_all().close,
+                        executor=inference_executor,
+                    )
+                return transcription_response(segments, transcription_info, response_format, stream=False)
+        except Exception as e:
+            logger.error(f"Failed to load or process model '{model}': {e}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to load model '{model}': {str(e)}",
             )
-            segments = TranscriptionSegment.from_faster_whisper_segments(segments)
-
-            if stream:
-                return segments_to_streaming_response(segments, transcription_info, response_format)
-            else:
-                return segments_to_response(segments, transcription_info, response_format)
-                
-    except Exception as e:
-        logger.error(f"Failed to load or process model '{model}': {e}")
+
+    try:
+        return await inference_executor.run_with_priority(priority, run)
+    except BaseException:
+        # `run` releases these itself (or hands them over to the streaming response), unless it never got to run
+        permit.release()
+        running_request.release()
+        raise
+
+
+type UploadStreamResponseFormat = Literal["text", "json", "srt", "vtt"]
+
+
+@router.post("/v1/audio/transcriptions/stream")
+async def transcribe_upload_stream(
+    request: Request,
+    config: ConfigDependency,
+    long_form_transcriber: LongFormTranscriberDependency,
+    admission_control: AdmissionControlDependency,
+    priority_scheduler: PrioritySchedulerDependency,
+    model: ModelId,
+    language: str | None = None,
+    prompt: str | None = None,
+    response_format: UploadStreamResponseFormat = "json",
+    temperature: float = 0.0,
+    hotwords: str | None = None,
+    vad_filter: bool | None = None,
+    priority: Priority | None = None,
+    x_priority: Annotated[Priority | None, Header()] = None,
+    authorization: Annotated[str | None, Header()] = None,
+) -> StreamingResponse:
+    """Transcribe an upload while it's still being received, the segments are streamed back as server-sent events.
+
+    The audio is either the `file` field of a `multipart/form-data` body or the whole body. Unlike in `/v1/audio/transcriptions` the parameters are query parameters, as they'd otherwise only be known after the upload. The audio is decoded as it arrives and transcribed a chunk (`whisper.long_form.chunk_seconds`) at a time, so transcription starts with the first chunk and memory doesn't grow with the duration of the audio. The audio has to be in a streamable format (i.e. WAV, FLAC, MP3 or Ogg, but not an MP4 whose index is at the end).
+    """
+    model_card_data = get_model_card_data(model)
+    if model_card_data is not None and not whisper_utils.hf_model_filter.passes_filter(model_card_data):
         raise HTTPException(
-            status_code=500,
-            detail=f"Failed to load model '{model}': {str(e)}",
+            status_code=404,
+            detail=f"Model '{model}' is not supported. If you think this is a mistake, please open an issue.",
         )
+    effective_vad_filter = vad_filter if vad_filter is not None else config._unstable_vad_filter  # noqa: SLF001
+    chunk_seconds = config.whisper.long_form.chunk_seconds
+    # NOTE: the duration isn't known upfront, a chunk is what's transcribed at a time
+    priority = priority_scheduler.resolve(
+        priority if priority is not None else x_priority, authenticated_api_key(config, authorization), chunk_seconds
+    )
+    await priority_scheduler.wait_for_interactive(priority)
+    running_request = priority_scheduler.register(priority)
+    try:
+        permit = await admission_control.transcription.admit(model, chunk_seconds, priority)
+    except BaseException:
+        running_request.release()
+        raise
+
+    pipe = UploadPipe()
+
+    def release() -> None:
+        # NOTE: unblocks the upload if decoding or transcription stopped before all of the audio was read
+        pipe.abort()
+        permit.release()
+        running_request.release()
+
+    segments = long_form_transcriber.transcribe_stream(
+        model,
+        decode_audio_chunks(pipe),
+        language=language,
+        initial_prompt=prompt,
+        temperature=temperature,
+        hotwords=hotwords,
+        vad_filter=effective_vad_filter,
+        priority=priority,
+    )
+    # NOTE: a dedicated thread rather than an inference worker, as it mostly waits for the upload. The chunks are transcribed on the long-form transcriber's executor
+    segment_stream = SegmentStream(segments, release, max_buffered=0)
+    segment_stream.start()
+    try:
+        await pump_upload(request, pipe)
+    except UploadAbortedError:
+        # the transcription failed (i.e. the audio couldn't be decoded), the error is reported through the stream
+        pass
+    except ValueError as e:
+        pipe.abort()
+        segment_stream.close()
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except BaseException:
+        pipe.abort()
+        segment_stream.close()
+        raise
+    return segments_to_streaming_response(segment_stream, None, response_format)
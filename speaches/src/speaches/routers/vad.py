@@ -2,23 +2,36 @@
 # - https://github.com/snakers4/silero-vad
 
 
+import asyncio
 import logging
 from typing import Annotated
 
 from fastapi import (
     APIRouter,
+    Depends,
     Form,
+    UploadFile,
 )
-from faster_whisper.vad import VadOptions, get_speech_timestamps
+from faster_whisper.vad import VadOptions
+import numpy as np
+from numpy.typing import NDArray
 from pydantic import BaseModel
 
-from speaches.dependencies import AudioFileDependency
+from speaches.audio import get_audio_duration
+from speaches.dependencies import (
+    AdmissionControlDependency,
+    AudioFileDependency,
+    InferenceExecutorDependency,
+    VadModelManagerDependency,
+    decode_audio_file,
+)
+from speaches.executors.silero_vad.model_manager import MODEL_ID, VadModelManager
+from speaches.executors.silero_vad.utils import get_speech_timestamps
 from speaches.model_aliases import ModelId
 
 # NOTE: this should match the default value in `decode_audio` which gets called by `AudioFileDependency`
 SAMPLE_RATE = 16000
 MS_SAMPLE_RATE = SAMPLE_RATE // 1000
-MODEL_ID = "silero_vad_v5"
 
 
 logger = logging.getLogger(__name__)
@@ -38,13 +51,7 @@ def to_ms_speech_timestamps(speech_timestamps: list[SpeechTimestamp]) -> list[Sp
     return speech_timestamps
 
 
-# TODO: adapt parameter names from here https://platform.openai.com/docs/api-reference/realtime-sessions/create#realtime-sessions-create-turn_detection
-# TODO: use model manager
-# TODO: use CudaExecutionProvider
-@router.post("/v1/audio/speech/timestamps")
-def detect_speech_timestamps(
-    audio: AudioFileDependency,
-    model: Annotated[ModelId, Form()] = MODEL_ID,
+def vad_options_form(
     threshold: Annotated[
         float,
         Form(
@@ -88,9 +95,8 @@ def detect_speech_timestamps(
     speech_pad_ms: Annotated[
         int, Form(ge=0, description="""Final speech chunks are padded by speech_pad_ms each side""")
     ] = 0,
-) -> list[SpeechTimestamp]:
-    assert model == MODEL_ID, f"Only '{MODEL_ID}' model is supported"
-    vad_options = VadOptions(
+) -> VadOptions:
+    return VadOptions(
         threshold=threshold,
         neg_threshold=neg_threshold,  # pyright: ignore[reportArgumentType]
         min_speech_duration_ms=min_speech_duration_ms,
@@ -98,10 +104,70 @@ def detect_speech_timestamps(
         min_silence_duration_ms=min_silence_duration_ms,
         speech_pad_ms=speech_pad_ms,
     )
-    speech_timestamps = to_ms_speech_timestamps(
-        [
-            SpeechTimestamp.model_validate(x)
-            for x in get_speech_timestamps(audio, vad_options=vad_options, sampling_rate=SAMPLE_RATE)
-        ]
-    )
+
+
+VadOptionsDependency = Annotated[VadOptions, Depends(vad_options_form)]
+
+
+def detect(
+    vad_model_manager: VadModelManager, model_id: str, audios: list[NDArray[np.float32]], vad_options: VadOptions
+) -> list[list[SpeechTimestamp]]:
+    with vad_model_manager.load_model(model_id) as vad:
+        raw_speech_timestamps = get_speech_timestamps(vad, audios, vad_options)
+    return [
+        to_ms_speech_timestamps([SpeechTimestamp.model_validate(x) for x in audio_speech_timestamps])
+        for audio_speech_timestamps in raw_speech_timestamps
+    ]
+
+
+# TODO: adapt parameter names from here https://platform.openai.com/docs/api-reference/realtime-sessions/create#realtime-sessions-create-turn_detection
+@router.post("/v1/audio/speech/timestamps")
+async def detect_speech_timestamps(
+    admission_control: AdmissionControlDependency,
+    inference_executor: InferenceExecutorDependency,
+    vad_model_manager: VadModelManagerDependency,
+    audio: AudioFileDependency,
+    vad_options: VadOptionsDependency,
+    model: Annotated[ModelId, Form()] = MODEL_ID,
+) -> list[SpeechTimestamp]:
+    assert model == MODEL_ID, f"Only '{MODEL_ID}' model is supported"
+    permit = await admission_control.vad.admit(model, len(audio) / SAMPLE_RATE)
+    try:
+        [speech_timestamps] = await inference_executor.run(detect, vad_model_manager, model, [audio], vad_options)
+    finally:
+        permit.release()
     return speech_timestamps
+
+
+def header_duration(files: list[UploadFile]) -> float:
+    """Total duration (in seconds) from the files' headers, without decoding them. Files without one (i.e. raw PCM) count as 0."""
+    return sum(get_audio_duration(file.file) or 0.0 for file in files)
+
+
+class FileSpeechTimestamps(BaseModel):
+    file: str | None
+    speech_timestamps: list[SpeechTimestamp]
+
+
+@router.post("/v1/audio/speech/timestamps/batch")
+async def detect_speech_timestamps_batch(
+    admission_control: AdmissionControlDependency,
+    inference_executor: InferenceExecutorDependency,
+    vad_model_manager: VadModelManagerDependency,
+    files: Annotated[list[UploadFile], Form()],
+    vad_options: VadOptionsDependency,
+    model: Annotated[ModelId, Form()] = MODEL_ID,
+) -> list[FileSpeechTimestamps]:
+    """Detect the speech in many files with a single batched inference. The results are in the order of the files."""
+    assert model == MODEL_ID, f"Only '{MODEL_ID}' model is supported"
+    # NOTE: admitted before decoding, as decoding all of the files is a large part of the work
+    permit = await admission_control.vad.admit(model, await inference_executor.run(header_duration, files))
+    try:
+        audios = list(await asyncio.gather(*(inference_executor.run(decode_audio_file, file) for file in files)))
+        speech_timestamps = await inference_executor.run(detect, vad_model_manager, model, audios, vad_options)
+    finally:
+        permit.release()
+    return [
+        FileSpeechTimestamps(file=file.filename, speech_timestamps=file_speech_timestamps)
+        for file, file_speech_timestamps in zip(files, speech_timestamps, strict=True)
+    ]
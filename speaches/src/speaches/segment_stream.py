@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator, Callable, Iterable, Iterator
+    from concurrent.futures import Executor, Future
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Done:
+    exception: BaseException | None = None
+
+
+class SegmentStream[T]:
+    """Consumes a (lazy, blocking) segment iterator on a worker thread and hands the segments to the event loop through a bounded `asyncio.Queue`.
+
+    The worker only runs as far ahead of the client as `max_buffered` allows. When the consumer goes away (i.e. the client disconnected and the response task got cancelled) the worker stops pulling segments, so no more audio gets decoded. `release` (i.e. exiting the model context) is called exactly once, after the worker is done with `segments`, or from `close` if the stream never started.
+
+    The worker runs on `executor` if given, otherwise on a dedicated thread. It's started by iterating the stream, or earlier by calling `start` (i.e. to consume an upload while it's still being received, which needs `max_buffered=0`, i.e. an unbounded queue, as nobody reads the segments yet).
+    """
+
+    def __init__(
+        self,
+        segments: Iterable[T],
+        release: Callable[[], None] | None = None,
+        max_buffered: int = 4,
+        executor: Executor | None = None,
+    ) -> None:
+        self.segments = segments
+        self.max_buffered = max_buffered
+        self.executor = executor
+        self._release = release
+        self._release_lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._started = False
+        self._iterated = False
+        self._queue: asyncio.Queue[T | _Done] | None = None
+        self._future: Future[None] | None = None
+
+    def release(self) -> None:
+        with self._release_lock:
+            release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def close(self) -> None:
+        """Stop the worker. Safe to call multiple times."""
+        self._cancelled.set()
+        # NOTE: a worker that never got to run won't release
+        if not self._started or (self._future is not None and self._future.cancel()):
+            self.release()
+
+    def _put(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue[T | _Done], item: T | _Done) -> bool:
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.1)
+            except TimeoutError:
+                # the queue is full, i.e. the client is slower than the decoding
+                if self._cancelled.is_set():
+                    future.cancel()
+                    return False
+            else:
+                return True
+
+    def _produce(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue[T | _Done]) -> None:
+        iterator: Iterator[T] = iter(self.segments)
+        try:
+            while not self._cancelled.is_set():
+                try:
+                    segment = next(iterator)
+                except StopIteration:
+                    self._put(loop, queue, _Done())
+                    return
+                if not self._put(loop, queue, segment):
+                    break
+            logger.info("Segment stream was cancelled, stopping decoding")
+        except Exception as e:  # noqa: BLE001
+            # NOTE: nobody's listening anymore once the stream was closed (i.e. an aborted upload)
+            if not self._cancelled.is_set():
+                self._put(loop, queue, _Done(e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            self.release()
+
+    def start(self) -> None:
+        """Start the worker. Must be called from the event loop."""
+        if self._started:
+            return
+        self._started = True
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_buffered)
+        if self.executor is not None:
+            self._future = self.executor.submit(self._produce, loop, self._queue)
+        else:
+            threading.Thread(target=self._produce, args=(loop, self._queue), name="segment-stream", daemon=True).start()
+
+    async def __aiter__(self) -> AsyncGenerator[T]:
+        assert not self._iterated, "A `SegmentStream` can only be iterated once"
+        self._iterated = True
+        self.start()
+        queue, future = self._queue, self._future
+        assert queue is not None
+        try:
+            while True:
+                item = await queue.get()
+                if isinstance(item, _Done):
+                    if item.exception is not None:
+                        raise item.exception
+                    return
+                yield item
+        finally:
+            self._cancelled.set()
+            if future is not None and future.cancel():
+                # the worker never started, so it won't release
+                self.release()
@@ -0,0 +1,222 @@
+"""Streaming turn detection with the silero VAD (as bundled with `faster_whisper`).
+
+`faster_whisper.vad.get_speech_timestamps` starts over from a fresh model state on every call, so detecting turns with it means rescoring a window of the recent audio whenever audio is appended. Here the LSTM state, the context samples and a cursor are kept per stream, so each 32 ms window is scored exactly once.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+import dataclasses
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Literal
+
+import numpy as np
+
+from speaches.audio import _pcm_to_float32
+from speaches.config import SAMPLES_PER_SECOND
+from speaches.executors.silero_vad.model_manager import MODEL_ID
+from speaches.metrics import metrics
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+    from faster_whisper.vad import SileroVADModel
+    from numpy.typing import NDArray
+
+    from speaches.config import RealtimeVadConfig
+    from speaches.executors.silero_vad.model_manager import VadModelManager
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SIZE_SAMPLES = 512
+CONTEXT_SIZE_SAMPLES = 64
+STATE_SHAPE = (2, 1, 128)
+# same as in `SileroVADModel.__call__`, bounds the memory used by the encoder for long audio
+ENCODER_BATCH_SIZE = 10000
+
+batch_sizes = metrics.summary("realtime_vad_batch_size", "Number of streams scored by a single batched VAD inference.")
+
+type VadTransition = tuple[Literal["speech_started", "speech_stopped"], int]
+
+
+class SileroState:
+    """The recurrent state of a single audio stream."""
+
+    def __init__(self) -> None:
+        self.state = np.zeros(STATE_SHAPE, dtype=np.float32)
+        self.context = np.zeros(CONTEXT_SIZE_SAMPLES, dtype=np.float32)
+
+
+def _encoder_input(windows: NDArray[np.float32], silero_state: SileroState) -> NDArray[np.float32]:
+    """Each window is prepended with the end of the previous one."""
+    contexts = np.concatenate((silero_state.context[np.newaxis], windows[:-1, -CONTEXT_SIZE_SAMPLES:]))
+    return np.concatenate((contexts, windows), axis=1)
+
+
+def speech_probs(
+    model: SileroVADModel, streams: Sequence[tuple[NDArray[np.float32], SileroState]]
+) -> list[NDArray[np.float32]]:
+    """Speech probability of each of the `(n, WINDOW_SIZE_SAMPLES)` consecutive windows of every stream, continuing from (and updating) its state. Same as `SileroVADModel.__call__`, which always starts from a zero state and requires equally long streams.
+
+    The windows of all of the streams are encoded in a single run. The decoder is recurrent, so it's run once per window position, with the states of the streams that have a window at that position stacked into one batch.
+    """
+    if len(streams) == 0:
+        return []
+    # longest first, so that the streams that have a window at each position are a prefix of the batch
+    order = sorted(range(len(streams)), key=lambda i: len(streams[i][0]), reverse=True)
+    lengths = [len(streams[i][0]) for i in order]
+    encoder_input = np.concatenate([_encoder_input(*streams[i]) for i in order])
+    encoder_output = np.concatenate(
+        [
+            model.encoder_session.run(None, {"input": encoder_input[i : i + ENCODER_BATCH_SIZE]})[0]
+            for i in range(0, len(encoder_input), ENCODER_BATCH_SIZE)
+        ]
+    ).reshape(len(encoder_input), -1)
+    offsets = np.cumsum([0, *lengths[:-1]])
+    # NOTE: laid out like `encoder_output` (the streams one after another) rather than padded to the longest stream
+    probs = np.empty(len(encoder_input), dtype=np.float32)
+    state = np.concatenate([streams[i][1].state for i in order], axis=1)
+    for position in range(lengths[0]):
+        batch_size = sum(length > position for length in lengths)
+        out, state[:, :batch_size] = model.decoder_session.run(
+            None,
+            {
+                "input": encoder_output[offsets[:batch_size] + position],
+                "state": np.ascontiguousarray(state[:, :batch_size]),
+            },
+        )
+        probs[offsets[:batch_size] + position] = out.reshape(-1)
+    results: list[NDArray[np.float32]] = [np.empty(0, dtype=np.float32)] * len(streams)
+    for j, i in enumerate(order):
+        windows, silero_state = streams[i]
+        silero_state.state = state[:, j : j + 1].copy()
+        silero_state.context = windows[-1, -CONTEXT_SIZE_SAMPLES:].copy()
+        results[i] = probs[offsets[j] : offsets[j] + lengths[j]]
+    return results
+
+
+@dataclasses.dataclass(eq=False)
+class VadRequest:
+    windows: NDArray[np.float32]
+    silero_state: SileroState
+    future: Future[NDArray[np.float32]] = dataclasses.field(default_factory=Future)
+
+
+class VadBatcher:
+    """Scores the audio of all of the realtime sessions with a single batched inference per tick instead of a tiny one per session and audio chunk.
+
+    A dispatcher thread takes every request that is already waiting (and waits up to `max_wait_ms` for more), so requests that pile up while a batch is being scored are scored together in the next one.
+    """
+
+    def __init__(self, config: RealtimeVadConfig, model_manager: VadModelManager) -> None:
+        self.config = config
+        self.model_manager = model_manager
+        self._queue: deque[VadRequest] = deque()
+        self._condition = threading.Condition()
+        self._dispatcher: threading.Thread | None = None
+
+    def submit(self, windows: NDArray[np.float32], silero_state: SileroState) -> Future[NDArray[np.float32]]:
+        """Score the windows of a stream, see `speech_probs`. The state is updated by the dispatcher, so a stream must not have more than one request in flight."""
+        request = VadRequest(windows, silero_state)
+        with self._condition:
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name="vad-batcher", daemon=True)
+                self._dispatcher.start()
+            self._queue.append(request)
+            self._condition.notify()
+        return request.future
+
+    def _collect_batch(self) -> list[VadRequest]:
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._queue) > 0)
+            batch = [self._queue.popleft()]
+            deadline = time.perf_counter() + self.config.max_wait_ms / 1000
+            while len(batch) < self.config.max_batch_size:
+                if len(self._queue) == 0:
+                    timeout = deadline - time.perf_counter()
+                    if timeout <= 0 or not self._condition.wait_for(lambda: len(self._queue) > 0, timeout=timeout):
+                        break
+                batch.append(self._queue.popleft())
+        return batch
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            try:
+                with self.model_manager.load_model(MODEL_ID) as vad:
+                    probs = speech_probs(vad, [(request.windows, request.silero_state) for request in batch])
+            except Exception as e:
+                logger.exception(f"Failed to run the VAD on a batch of {len(batch)} streams")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            batch_sizes.observe(len(batch))
+            for request, request_probs in zip(batch, probs, strict=True):
+                request.future.set_result(request_probs)
+
+
+class StreamingVad:
+    """Detects a single turn (the start and the end of speech) in a growing 16 kHz audio buffer.
+
+    The hysteresis is the same as in `get_speech_timestamps`: speech starts at a window scored at or above `threshold` and ends once the probability stayed below `threshold - 0.15` for `silence_duration_ms`.
+    """
+
+    def __init__(self) -> None:
+        self.silero_state = SileroState()
+        self.cursor = 0
+        """Number of samples that have been scored."""
+        self.speech_start: int | None = None
+        self.silence_start: int | None = None
+        self.stopped = False
+        # NOTE: audio may be appended while its previous windows are being scored, the next call waits for them
+        self._lock = asyncio.Lock()
+
+    async def process(
+        self,
+        samples: NDArray[np.int16],
+        vad_batcher: VadBatcher,
+        *,
+        threshold: float,
+        silence_duration_ms: int,
+        prefix_padding_ms: int,
+    ) -> list[VadTransition]:
+        """Score the complete windows of `samples` (the whole buffer) past the cursor. Returns the transitions, with the sample offsets within the buffer at which the (padded) speech starts and ends."""
+        async with self._lock:
+            num_windows = (len(samples) - self.cursor) // WINDOW_SIZE_SAMPLES
+            if self.stopped or num_windows <= 0:
+                return []
+            end = self.cursor + num_windows * WINDOW_SIZE_SAMPLES
+            windows = _pcm_to_float32(samples[self.cursor : end]).reshape(num_windows, WINDOW_SIZE_SAMPLES)
+            probs = await asyncio.wrap_future(vad_batcher.submit(windows, self.silero_state))
+            return self._update(probs, threshold, silence_duration_ms, prefix_padding_ms)
+
+    def _update(
+        self, probs: NDArray[np.float32], threshold: float, silence_duration_ms: int, prefix_padding_ms: int
+    ) -> list[VadTransition]:
+        neg_threshold = max(threshold - 0.15, 0.01)
+        min_silence_samples = silence_duration_ms * SAMPLES_PER_SECOND // 1000
+        padding_samples = prefix_padding_ms * SAMPLES_PER_SECOND // 1000
+        transitions: list[VadTransition] = []
+        for i, prob in enumerate(probs):
+            position = self.cursor + i * WINDOW_SIZE_SAMPLES
+            if prob >= threshold:
+                self.silence_start = None
+                if self.speech_start is None:
+                    self.speech_start = position
+                    transitions.append(("speech_started", max(0, position - padding_samples)))
+            elif prob < neg_threshold and self.speech_start is not None:
+                if self.silence_start is None:
+                    self.silence_start = position
+                if position + WINDOW_SIZE_SAMPLES - self.silence_start >= min_silence_samples:
+                    transitions.append(
+                        ("speech_stopped", min(self.silence_start + padding_samples, position + WINDOW_SIZE_SAMPLES))
+                    )
+                    # NOTE: a buffer holds a single turn, audio appended after its end is ignored
+                    self.stopped = True
+                    break
+        self.cursor += len(probs) * WINDOW_SIZE_SAMPLES
+        return transitions
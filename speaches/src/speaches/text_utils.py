@@ -7,6 +7,8 @@ from typing import TYPE_CHECKING, Protocol
 if TYPE_CHECKING:
     from collections.abc import AsyncGenerator, Iterable
 
+    from faster_whisper.transcribe import Segment
+
     from speaches.api_types import TranscriptionSegment
 
 
@@ -28,7 +30,7 @@ class TextChunker(Protocol):
         yield ""
 
 
-def segments_to_text(segments: Iterable[TranscriptionSegment]) -> str:
+def segments_to_text(segments: Iterable[TranscriptionSegment | Segment]) -> str:
     return "".join(segment.text for segment in segments).strip()
 
 
@@ -48,7 +50,7 @@ def vtt_format_timestamp(ts: float) -> str:
     return f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}.{int(milliseconds):03d}"
 
 
-def segments_to_vtt(segment: TranscriptionSegment, i: int) -> str:
+def segments_to_vtt(segment: TranscriptionSegment | Segment, i: int) -> str:
     start = segment.start if i > 0 else 0.0
     result = f"{vtt_format_timestamp(start)} --> {vtt_format_timestamp(segment.end)}\n{segment.text}\n\n"
 
@@ -58,7 +60,7 @@ def segments_to_vtt(segment: TranscriptionSegment, i: int) -> str:
         return result
 
 
-def segments_to_srt(segment: TranscriptionSegment, i: int) -> str:
+def segments_to_srt(segment: TranscriptionSegment | Segment, i: int) -> str:
     return f"{i + 1}\n{srt_format_timestamp(segment.start)} --> {srt_format_timestamp(segment.end)}\n{segment.text}\n\n"
 
 
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+from typing import TYPE_CHECKING
+
+from cachetools import LRUCache
+import numpy as np
+
+from speaches.metrics import metrics
+from speaches.transcription_serialization import transcription_result_from_json, transcription_result_to_json
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Iterable
+
+    from faster_whisper.transcribe import Segment, TranscriptionInfo
+    from numpy.typing import NDArray
+
+    from speaches.config import TranscriptionCacheConfig
+
+logger = logging.getLogger(__name__)
+
+type TranscriptionResult = tuple[list[Segment], TranscriptionInfo]
+
+memory_hits = metrics.counter("transcription_cache_memory_hits", "Results served from the in-memory tier.")
+disk_hits = metrics.counter("transcription_cache_disk_hits", "Results served from the on-disk tier.")
+misses = metrics.counter("transcription_cache_misses", "Requests that had to be transcribed.")
+disk_evictions = metrics.counter("transcription_cache_disk_evictions", "Files removed to stay under `disk_max_mb`.")
+
+
+class TranscriptionCache:
+    """Caches transcription results by the decoded audio, the model and the decoding parameters.
+
+    There's an in-memory LRU tier and an optional on-disk tier, which stores the results as JSON.
+    """
+
+    def __init__(self, config: TranscriptionCacheConfig) -> None:
+        self.config = config
+        self._memory: LRUCache[str, TranscriptionResult] = LRUCache(maxsize=config.max_entries)
+        self._lock = threading.Lock()
+        self._disk_path = Path(config.disk_path) if config.disk_path is not None else None
+        self._disk_bytes = 0
+        if self._disk_path is not None:
+            self._disk_path.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(path.stat().st_size for path in self._disk_path.glob("*.json"))
+
+    def make_key(self, audio: NDArray[np.float32], **params: object) -> str | None:
+        """`None` when the cache is disabled."""
+        if not self.config.enabled:
+            return None
+        digest = hashlib.blake2b(np.ascontiguousarray(audio).data, digest_size=20)
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _disk_file(self, key: str) -> Path:
+        assert self._disk_path is not None
+        return self._disk_path / f"{key}.json"
+
+    def get(self, key: str | None) -> TranscriptionResult | None:
+        if key is None:
+            return None
+        with self._lock:
+            result = self._memory.get(key)
+        if result is not None:
+            memory_hits.inc()
+            return result
+        if self._disk_path is not None:
+            disk_file = self._disk_file(key)
+            try:
+                result = transcription_result_from_json(disk_file.read_bytes())
+                os.utime(disk_file)  # the modification time doubles as the last access time for eviction
+            except FileNotFoundError:
+                pass
+            except Exception:
+                logger.exception(f"Failed to read cached transcription {disk_file}")
+            if result is not None:
+                disk_hits.inc()
+                with self._lock:
+                    self._memory[key] = result
+                return result
+        misses.inc()
+        return None
+
+    def put(self, key: str, result: TranscriptionResult) -> None:
+        with self._lock:
+            self._memory[key] = result
+        if self._disk_path is None:
+            return
+        data = transcription_result_to_json(*result)
+        disk_file = self._disk_file(key)
+        tmp_file = disk_file.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_file.write_bytes(data)
+        try:
+            # the same result may have been cached by a concurrent request, in which case its file gets replaced
+            replaced_bytes = disk_file.stat().st_size
+        except FileNotFoundError:
+            replaced_bytes = 0
+        tmp_file.replace(disk_file)
+        with self._lock:
+            self._disk_bytes += len(data) - replaced_bytes
+            if self._disk_bytes > self.config.disk_max_mb * 1024**2:
+                self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        assert self._disk_path is not None
+        max_bytes = self.config.disk_max_mb * 1024**2
+        files = sorted(
+            ((path, path.stat()) for path in self._disk_path.glob("*.json")), key=lambda item: item[1].st_mtime
+        )
+        self._disk_bytes = sum(stat.st_size for _, stat in files)
+        for path, stat in files:
+            if self._disk_bytes <= max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self._disk_bytes -= stat.st_size
+            disk_evictions.inc()
+
+    def record(
+        self, key: str | None, segments: Iterable[Segment], transcription_info: TranscriptionInfo
+    ) -> Iterable[Segment]:
+        """Pass the segments through and cache the result once all of them have been consumed."""
+        if key is None:
+            return segments
+
+        def record_segments() -> Generator[Segment]:
+            collected: list[Segment] = []
+            for segment in segments:
+                collected.append(segment)
+                yield segment
+            try:
+                self.put(key, (collected, transcription_info))
+            except Exception:
+                logger.exception("Failed to cache the transcription result")
+
+        return record_segments()
@@ -0,0 +1,145 @@
+"""Serialization of transcription results without instantiating the `api_types` pydantic models.
+
+The pydantic models (`CreateTranscriptionResponseJson`, `CreateTranscriptionResponseVerboseJson`, ...) are only used for the OpenAPI schema. Building them for every segment and word of long, word-timestamped audio dominates the response time, so the `faster_whisper` dataclasses are serialized directly instead. The output has the same fields, order and values as the models' `model_dump_json`. Only very small or very large floats may be formatted differently (e.g. `1.5e-07` instead of `1.5e-7`), which JSON parsers read as the same number.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+from typing import TYPE_CHECKING, Any
+
+from faster_whisper.transcribe import Segment, TranscriptionInfo, TranscriptionOptions, Word
+from faster_whisper.vad import VadOptions
+import numpy as np
+
+from speaches.text_utils import segments_to_text
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+try:
+    import orjson
+except ImportError:  # `orjson` is optional, it's used when installed because it's faster for large responses
+    orjson = None
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps(obj: Any) -> bytes:  # noqa: ANN401
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return _json_encoder.encode(obj).encode()
+
+
+def word_to_dict(word: Word) -> dict[str, Any]:
+    return {
+        "start": float(word.start),
+        "end": float(word.end),
+        "word": word.word,
+        "probability": float(word.probability),
+    }
+
+
+def segment_to_dict(segment: Segment) -> dict[str, Any]:
+    """Same fields (and order) as `api_types.TranscriptionSegment`.
+
+    `faster_whisper` fills some of the fields with numpy scalars (e.g. `no_speech_prob`, word timestamps), which `orjson` refuses to serialize, hence every number is converted to a builtin one.
+    """
+    return {
+        "avg_logprob": float(segment.avg_logprob),
+        "compression_ratio": float(segment.compression_ratio),
+        "end": float(segment.end),
+        "id": int(segment.id),
+        "no_speech_prob": float(segment.no_speech_prob),
+        "seek": int(segment.seek),
+        "start": float(segment.start),
+        "temperature": float(segment.temperature or 0),
+        "text": segment.text,
+        "tokens": [int(token) for token in segment.tokens],
+        "words": [word_to_dict(word) for word in segment.words] if segment.words is not None else None,
+    }
+
+
+def json_response_body(segments: list[Segment]) -> bytes:
+    """Same as `CreateTranscriptionResponseJson.from_segments(...).model_dump_json()`."""
+    return dumps({"text": segments_to_text(segments)})
+
+
+def verbose_json_response_body(segments: list[Segment], transcription_info: TranscriptionInfo) -> bytes:
+    """Same as `CreateTranscriptionResponseVerboseJson.from_segments(...).model_dump_json()`."""
+    segment_dicts = [segment_to_dict(segment) for segment in segments]
+    return dumps(
+        {
+            "task": "transcribe",
+            "language": transcription_info.language,
+            "duration": float(transcription_info.duration),
+            "text": segments_to_text(segments),
+            "words": [word for segment_dict in segment_dicts for word in segment_dict["words"] or ()]
+            if transcription_info.transcription_options.word_timestamps
+            else None,
+            "segments": segment_dicts,
+        }
+    )
+
+
+def verbose_json_segment_body(segment: Segment, transcription_info: TranscriptionInfo) -> bytes:
+    """Same as `CreateTranscriptionResponseVerboseJson.from_segment(...).model_dump_json()`."""
+    segment_dict = segment_to_dict(segment)
+    return dumps(
+        {
+            "task": "transcribe",
+            "language": transcription_info.language,
+            "duration": float(segment.end - segment.start),
+            "text": segment.text,
+            "words": segment_dict["words"] if transcription_info.transcription_options.word_timestamps else None,
+            "segments": [segment_dict],
+        }
+    )
+
+
+def segment_from_dict(data: dict[str, Any]) -> Segment:
+    """The inverse of `segment_to_dict`."""
+    words = data["words"]
+    return Segment(**{**data, "words": [Word(**word) for word in words] if words is not None else None})
+
+
+def _to_builtin(obj: object) -> object:
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def transcription_result_to_json(segments: Iterable[Segment], transcription_info: TranscriptionInfo) -> bytes:
+    """The whole result, including all of `transcription_info` (unlike the API responses), so that it can be restored with `transcription_result_from_json`."""
+    # NOTE: the stdlib encoder is used as `orjson` turns infinite floats (i.e. `VadOptions.max_speech_duration_s`) into `null`
+    return json.dumps(
+        {
+            "segments": [segment_to_dict(segment) for segment in segments],
+            "transcription_info": dataclasses.asdict(transcription_info),
+        },
+        ensure_ascii=False,
+        separators=(",", ":"),
+        default=_to_builtin,
+    ).encode()
+
+
+def transcription_result_from_json(data: bytes) -> tuple[list[Segment], TranscriptionInfo]:
+    result = json.loads(data)
+    info = result["transcription_info"]
+    all_language_probs = info["all_language_probs"]
+    transcription_options = info["transcription_options"]
+    vad_options = info["vad_options"]
+    transcription_info = TranscriptionInfo(
+        **{
+            **info,
+            "all_language_probs": [tuple(item) for item in all_language_probs]
+            if all_language_probs is not None
+            else None,
+            "transcription_options": TranscriptionOptions(**transcription_options)
+            if transcription_options is not None
+            else None,
+            "vad_options": VadOptions(**vad_options) if vad_options is not None else None,
+        }
+    )
+    return [segment_from_dict(segment) for segment in result["segments"]], transcription_info
@@ -0,0 +1,157 @@
+"""Audio uploads that are decoded while they're still being received.
+
+`UploadPipe` is a bounded, file-like buffer between the event loop (which receives the request body) and a worker thread (which decodes it with `speaches.audio.decode_audio_chunks`). When the decoder falls behind, `pump_upload` stops reading the body, so at most `max_bytes` of the upload are held in memory.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+if TYPE_CHECKING:
+    from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+MAX_BUFFERED_UPLOAD_BYTES = 4 * 1024 * 1024
+
+
+class UploadAbortedError(Exception):
+    pass
+
+
+class UploadPipe:
+    """A bounded byte pipe with a blocking `read`, so that it can be passed to `av.open`. It's deliberately not seekable, which makes PyAV read it as a stream."""
+
+    def __init__(self, max_bytes: int = MAX_BUFFERED_UPLOAD_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._chunks: deque[bytes] = deque()
+        self._size = 0
+        self._closed = False
+        self._error: BaseException | None = None
+        self._condition = threading.Condition()
+
+    def write(self, data: bytes) -> None:
+        """Blocks while the pipe is full."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._size < self.max_bytes or self._error is not None)
+            if self._error is not None:
+                raise self._error
+            self._chunks.append(data)
+            self._size += len(data)
+            self._condition.notify_all()
+
+    def close(self) -> None:
+        """The upload is complete, `read` returns `b""` once the pipe is drained."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def abort(self, error: BaseException | None = None) -> None:
+        """Fail pending and future reads and writes, i.e. when the client disconnected or the decoder gave up."""
+        with self._condition:
+            self._error = error or UploadAbortedError("The upload was aborted")
+            self._condition.notify_all()
+
+    def read(self, size: int = -1) -> bytes:
+        with self._condition:
+            self._condition.wait_for(lambda: len(self._chunks) > 0 or self._closed or self._error is not None)
+            if self._error is not None:
+                raise self._error
+            if len(self._chunks) == 0:
+                return b""
+            data = self._chunks.popleft()
+            if 0 <= size < len(data):
+                data, rest = data[:size], data[size:]
+                self._chunks.appendleft(rest)
+            self._size -= len(data)
+            self._condition.notify_all()
+            return data
+
+
+class MultipartFieldParser:
+    """Incrementally extracts the content of a single field from a `multipart/form-data` body."""
+
+    def __init__(self, boundary: bytes, field_name: str) -> None:
+        self.field_name = field_name.encode()
+        self._data: list[bytes] = []
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._in_field = False
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_part_data": self._on_part_data,
+            },
+        )
+
+    def _on_part_begin(self) -> None:
+        self._in_field = False
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field.extend(data[start:end])
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value.extend(data[start:end])
+
+    def _on_header_end(self) -> None:
+        if self._header_field.lower() == b"content-disposition":
+            _, disposition = parse_options_header(bytes(self._header_value))
+            self._in_field = disposition.get(b"name") == self.field_name
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_field:
+            self._data.append(data[start:end])
+
+    def feed(self, chunk: bytes) -> bytes:
+        """The field's content in `chunk`."""
+        self._parser.write(chunk)
+        data = b"".join(self._data)
+        self._data.clear()
+        return data
+
+    def finalize(self) -> None:
+        self._parser.finalize()
+
+
+async def pump_upload(request: Request, pipe: UploadPipe, field_name: str = "file") -> None:
+    """Write the audio of the request's body into `pipe` as it arrives, then close it.
+
+    A `multipart/form-data` body is parsed incrementally and only the `field_name` part is written, any other body is written as is. The pipe is aborted if receiving the body fails. Raises a `ValueError` for a malformed body.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    parser: MultipartFieldParser | None = None
+    if content_type == b"multipart/form-data":
+        boundary = params.get(b"boundary")
+        if boundary is None:
+            msg = "The multipart body doesn't have a boundary"
+            raise ValueError(msg)
+        parser = MultipartFieldParser(boundary, field_name)
+    try:
+        async for chunk in request.stream():
+            data = chunk if parser is None else parser.feed(chunk)
+            if len(data) > 0:
+                # NOTE: blocks while the decoder is behind, which applies backpressure to the client
+                await asyncio.to_thread(pipe.write, data)
+        if parser is not None:
+            parser.finalize()
+    except MultipartParseError as e:
+        pipe.abort(UploadAbortedError(f"Failed to receive the upload: {e}"))
+        msg = f"Malformed multipart body: {e}"
+        raise ValueError(msg) from e
+    except BaseException as e:
+        pipe.abort(UploadAbortedError(f"Failed to receive the upload: {e}"))
+        raise
+    pipe.close()